@@ -44,11 +44,18 @@ def main():
         type=int, default=None,
         help='ID numérico para este nodo mesh (opcional)'
     )
+    parser.add_argument(
+        '--state', '-s',
+        default=None,
+        help='Archivo donde guardar la identidad del nodo entre reinicios (opcional)'
+    )
     args = parser.parse_args()
 
     # Ajustar puerto de escucha si se indicó
     if args.port:
         NodeManager.DEFAULT_PORT = args.port
+    if args.state:
+        NodeManager.STATE_PATH = args.state
 
     # Inicializar nodo mesh
     node = NodeManager.get_node(ID=args.node_id)
@@ -105,6 +112,6 @@ def main():
     except Exception as e:
         print(f"[FileClient][Error] al recibir fichero: {e}")
 
-# python3 FileClient.py --hub-id <> --filename prueba.txt --out-dir ./descargas --port 8003
+# python3 FileClient.py --hub-id <> --filename prueba.txt --out-dir ./descargas --port 8003 --state ./client.json
 if __name__ == "__main__":
     main()
@@ -80,11 +80,17 @@ def main() -> None:
         '--port', '-p', type=int, default=None,
         help='Puerto local para el nodo mesh (evitar choques)'
     )
+    parser.add_argument(
+        '--state', '-s', default=None,
+        help='Archivo donde guardar la identidad del nodo entre reinicios (opcional)'
+    )
     args = parser.parse_args()
 
     # Ajustar puerto de escucha
     if args.port:
         NodeManager.DEFAULT_PORT = args.port
+    if args.state:
+        NodeManager.STATE_PATH = args.state
 
     # Inicializar el nodo mesh (mismo ID de nodo-hub si ya registrado)
     node = NodeManager.get_node()
@@ -114,6 +120,6 @@ def main() -> None:
         print("[FileServiceDaemon] Parando...")
         NodeManager.shutdown()
 
-# python3 FileServiceDaemon.py --hub-id <ID FileHUB> --dir ./carpeta_compartida --interval 5.0 --port 8002
+# python3 FileServiceDaemon.py --hub-id <ID FileHUB> --dir ./carpeta_compartida --interval 5.0 --port 8002 --state ./daemon.json
 if __name__ == '__main__':
     main()
\ No newline at end of file
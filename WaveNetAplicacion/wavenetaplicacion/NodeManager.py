@@ -13,18 +13,22 @@ class NodeManager:
     _instance: Optional[WaveNetBasicMeshNode] = None
     DEFAULT_PORT: int = 8000
     HUB_PORT:    int = 9000
+    STATE_PATH:  Optional[str] = None
 
     @classmethod
-    def get_node(cls, ID: int = None) -> WaveNetBasicMeshNode:
+    def get_node(cls, ID: int = None, state: Optional[str] = None) -> WaveNetBasicMeshNode:
         """
         Devuelve la instancia única de WaveNetBasicMeshNode.
         Si no existe, la crea con el protocolo LocalProtocol en DEFAULT_PORT,
         opcionalmente usando el ID que se pase, la arranca, conecta al hub y hace join.
+        Si se indica un archivo de estado (o STATE_PATH), el nodo reutiliza la
+        identidad y las llaves guardadas, por lo que arranca sin generar una
+        llave RSA y vuelve a entrar al mesh sin esperar al hub.
         """
         if cls._instance is None:
             # 1) Arrancar nodo local con ID opcional
             protocol = LocalProtocol(port=cls.DEFAULT_PORT)
-            cls._instance = WaveNetBasicMeshNode([protocol], ID=ID)
+            cls._instance = WaveNetBasicMeshNode([protocol], ID=ID, state=state or cls.STATE_PATH)
             cls._instance.run()
 
             # 2) Conectar y join al mesh‐hub de capa 3
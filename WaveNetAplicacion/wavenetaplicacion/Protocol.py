@@ -1,5 +1,5 @@
 import json
-from typing import Any, Dict
+from typing import Any, Dict, Union
 
 
 class Protocol:
@@ -14,12 +14,15 @@ class Protocol:
         "body": Any  # Datos o contenido del mensaje, puede ser str, dict, list, etc.
     }
 
+    Si el body son bytes, el mensaje se envía como bytes: la cabecera JSON
+    (sin el body), un salto de línea y luego los bytes tal cual, sin base64.
+
     Si en el futuro se agregan campos o tipos, basta con actualizar
     el esquema de mensajes y mantener los métodos encode/decode.
     """
 
     @staticmethod
-    def encode(message: Dict[str, Any]) -> str:
+    def encode(message: Dict[str, Any]) -> Union[str, bytes]:
         """
         Serializa un mensaje (dict) en una cadena JSON.
 
@@ -28,23 +31,27 @@ class Protocol:
                      'type', 'resource' y 'body'.
 
         Returns:
-            Una cadena JSON.
+            Una cadena JSON, o bytes si el body son bytes.
 
         Raises:
             ValueError: si falla la serialización.
         """
+        body = message.get("body")
         try:
+            if isinstance(body, (bytes, bytearray, memoryview)):
+                header = {k: v for k, v in message.items() if k != "body"}
+                return json.dumps(header).encode() + b"\n" + bytes(body)
             return json.dumps(message)
         except (TypeError, ValueError) as e:
             raise ValueError(f"Error al codificar el mensaje a JSON: {e}")
 
     @staticmethod
-    def decode(message_str: str) -> Dict[str, Any]:
+    def decode(message_str: Union[str, bytes]) -> Dict[str, Any]:
         """
         Deserializa una cadena JSON en un mensaje (dict).
 
         Args:
-            message_str: Cadena JSON recibida.
+            message_str: Cadena JSON recibida, o bytes con cabecera y body.
 
         Returns:
             Diccionario con los campos del mensaje.
@@ -53,8 +60,14 @@ class Protocol:
             ValueError: si falla la deserialización o el formato es inválido.
         """
         try:
-            message = json.loads(message_str)
-        except json.JSONDecodeError as e:
+            if isinstance(message_str, bytes):
+                header, _, body = message_str.partition(b"\n")
+                message = json.loads(header)
+                if isinstance(message, dict):
+                    message["body"] = body
+            else:
+                message = json.loads(message_str)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
             raise ValueError(f"Error al decodificar la cadena JSON: {e}")
 
         if not isinstance(message, dict):
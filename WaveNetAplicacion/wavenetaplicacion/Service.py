@@ -1,6 +1,5 @@
 import os
 import time
-import base64
 from typing import Any, Dict, Tuple, Generator
 
 from Protocol import Protocol
@@ -55,8 +54,7 @@ def send_file(dest_id: int, filepath: str, chunk_size: int = 1024) -> None:
     # chunks
     for chunk in _read_in_chunks(filepath, chunk_size):
         print(f"[Service] Enviando chunk de {len(chunk)} bytes")
-        b64 = base64.b64encode(chunk).decode('utf-8')
-        send_message(dest_id, "DATA", "file_chunk", {"data": b64})
+        send_message(dest_id, "DATA", "file_chunk", chunk)
         time.sleep(0.01)
     # end
     print(f"[Service] Enviando señal de fin para '{filename}'")
@@ -78,8 +76,7 @@ def receive_file(save_dir: str) -> str:
     while True:
         from_id, msg = receive_message()
         if msg.get("type") == "DATA" and msg.get("resource") == "file_chunk":
-            data = msg.get("body", {}).get("data")
-            raw = base64.b64decode(data)
+            raw = msg.get("body", b"")
             print(f"[Service] Recibido chunk de {len(raw)} bytes")
             chunks.append(raw)
         elif msg.get("type") == "DATA" and msg.get("resource") == "file_end":
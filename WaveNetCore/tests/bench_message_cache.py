@@ -0,0 +1,24 @@
+import time
+import tracemalloc
+from wavenetcore.WaveNetCache import MessageCache
+
+def bench_message_cache(total=2_000_000, capacity=1 << 16, step=250_000):
+	"""
+	Inserta millones de llaves distintas y muestra que la memoria se mantiene constante.
+	"""
+
+	cache = MessageCache(capacity=capacity, ttl=None)
+	tracemalloc.start()
+	start = time.perf_counter()
+	for i in range(1, total + 1):
+		cache.check(hash(("packet", i)))
+		if i % step == 0:
+			current, peak = tracemalloc.get_traced_memory()
+			print(f"{i:>9} packets | size {len(cache):>6} | memory {current / 1024:>9.1f} KiB | peak {peak / 1024:>9.1f} KiB")
+	elapsed = time.perf_counter() - start
+	tracemalloc.stop()
+	print(f"{total / elapsed:,.0f} packets/s")
+	print(cache.stats())
+
+if __name__ == "__main__":
+	bench_message_cache()
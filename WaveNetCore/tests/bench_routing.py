@@ -0,0 +1,71 @@
+import time
+import random
+from wavenetcore.WaveNetNode import *
+from wavenetcore.WaveNetProtocols import *
+
+BASE_PORT = 9300
+
+def build_mesh(size, edges, routing):
+	"""
+	Crea una red de nodos sobre LocalProtocol con las conexiones dadas.
+	"""
+
+	nodes = []
+	for i in range(size):
+		info = NodeInfo(i, None)
+		nodes.append(Node(info, [LocalProtocol(BASE_PORT + i)], lambda packet: True, routing=routing))
+	for node in nodes: node.listen()
+	time.sleep(0.5)
+	for a, b in edges:
+		nodes[a].add_link(Link(str(BASE_PORT + b), LocalProtocol()), b)
+		nodes[b].add_link(Link(str(BASE_PORT + a), LocalProtocol()), a)
+	return nodes
+
+def wait_idle(nodes, timeout=30.0):
+	"""
+	Espera a que todas las colas de salida estén vacías.
+	"""
+
+	start = time.monotonic()
+	while time.monotonic() - start < timeout:
+		time.sleep(0.5)
+		depth = sum(queue["depth"] for node in nodes for queue in node.stats()["forwarding"].values())
+		if depth == 0: return
+
+def bench_routing(size=10, extra_edges=10, messages=200, body_size=512):
+	"""
+	Compara los bytes enviados por inundación y por tablas de rutas para mensajes unicast.
+	"""
+
+	rng = random.Random(1)
+	edges = {(i, i + 1) for i in range(size - 1)}
+	while len(edges) < size - 1 + extra_edges:
+		a, b = sorted(rng.sample(range(size), 2))
+		edges.add((a, b))
+	pairs = [tuple(rng.sample(range(size), 2)) for _ in range(messages)]
+	body = "x" * body_size
+
+	counter = {"bytes" : 0, "packets" : 0}
+	original_send = Link.send
+	def counting_send(self, packet):
+		if packet.mtype != "route":
+			counter["bytes"] += len(packet.form())
+			counter["packets"] += 1
+		return original_send(self, packet)
+	Link.send = counting_send
+
+	for routing in (False, True):
+		counter["bytes"], counter["packets"] = 0, 0
+		nodes = build_mesh(size, edges, routing)
+		time.sleep(1.0)
+		for src, dest in pairs: nodes[src].send(dest, "data", body)
+		wait_idle(nodes)
+		name = "routing" if routing else "flooding"
+		print(f"{name:>9} | {counter['packets']:>6} transmissions | {counter['bytes']:>9} bytes on the wire")
+		for node in nodes: node.kill()
+		time.sleep(1.5)
+
+	Link.send = original_send
+
+if __name__ == "__main__":
+	bench_routing()
@@ -0,0 +1,35 @@
+import time
+from wavenetcore.WaveNetCrypto import PrivateKey
+from wavenetcore.WaveNetPacketeering import Packet, encrypt_packet, decrypt_packet
+from wavenetcore.WaveNetSession import SessionManager
+
+def measure(name, total, encrypt, decrypt):
+	packets = [Packet(1, 2, "data", "x" * 256) for _ in range(total)]
+	start = time.perf_counter()
+	secrets = [encrypt(packet) for packet in packets]
+	middle = time.perf_counter()
+	for secret in secrets: decrypt(secret)
+	end = time.perf_counter()
+	print(f"{name:>8} | encrypt {total / (middle - start):>10,.0f} packets/s | decrypt {total / (end - middle):>10,.0f} packets/s")
+
+def bench_sessions(total=2000):
+	"""
+	Compara el cifrado por paquete con RSA contra el cifrado con una sesión ya negociada.
+	"""
+
+	key_a, key_b = PrivateKey(), PrivateKey()
+	public = {1: key_a.public_key(), 2: key_b.public_key()}
+	a = SessionManager(1, key_a, public.get)
+	b = SessionManager(2, key_b, public.get)
+
+	start = time.perf_counter()
+	init, future = a.start(2, public[2])
+	a.complete(2, b.respond(1, init))
+	session = future.result(timeout=0)
+	print(f"handshake {1000 * (time.perf_counter() - start):.2f} ms")
+
+	measure("rsa", total, lambda packet: encrypt_packet(packet, public[2]), lambda secret: decrypt_packet(secret, key_b))
+	measure("session", total, session.encrypt_packet, b.decrypt_packet)
+
+if __name__ == "__main__":
+	bench_sessions()
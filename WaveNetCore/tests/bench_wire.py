@@ -0,0 +1,59 @@
+import time
+from wavenetcore.WaveNetCrypto import PrivateKey
+from wavenetcore.WaveNetPacketeering import Packet, BatchPacket, encrypt_packet, reconstruct_packet
+from wavenetcore.WaveNetCompression import LinkCodec
+
+def copy_of(packet):
+	if type(packet) == BatchPacket: return BatchPacket([copy_of(inner) for inner in packet.packets])
+	return packet.hop(packet.via)
+
+def measure(name, packet, total):
+	results = []
+	for label, encode in (("json", lambda copy: copy.form().encode()), ("binary", lambda copy: copy.encode())):
+		copies = [copy_of(packet) for _ in range(total)]
+		start = time.perf_counter()
+		for copy in copies: data = encode(copy)
+		middle = time.perf_counter()
+		for _ in range(total): reconstruct_packet(data)
+		end = time.perf_counter()
+		results.append(f"{label} {len(data):>6} B | encode {total / (middle - start):>10,.0f}/s | decode {total / (end - middle):>10,.0f}/s")
+	print(f"{name:>8} | " + " || ".join(results))
+
+def measure_relay(name, packet, total):
+	codec = LinkCodec()
+	received = reconstruct_packet(packet.hop("9000", codec).encode())
+	fresh = reconstruct_packet(packet.hop("9000", codec).form())
+	results = []
+	for label, incoming in (("rebuilt", fresh), ("reused", received)):
+		start = time.perf_counter()
+		for _ in range(total): incoming.hop("9001", codec).encode()
+		results.append(f"{label} {total / (time.perf_counter() - start):>10,.0f}/s")
+	print(f"{name:>8} | relay " + " || ".join(results))
+
+def measure_parse(name, packet, total):
+	data = packet.encode()
+	start = time.perf_counter()
+	for _ in range(total): reconstruct_packet(data)
+	middle = time.perf_counter()
+	for _ in range(total): reconstruct_packet(data).body
+	end = time.perf_counter()
+	print(f"{name:>8} | parse {len(data):>6} B | header {total / (middle - start):>10,.0f}/s || full {total / (end - middle):>10,.0f}/s")
+
+def bench_wire(total=20000):
+	"""
+	Compara el tamaño y la velocidad del formato json contra el binario.
+	"""
+
+	key = PrivateKey()
+	small = Packet(1, 2, "data", "x" * 64, via="9000")
+	large = Packet(1, 2, "data", "x" * 16384, via="9000")
+	measure("small", small, total)
+	measure("large", large, total // 4)
+	measure("secret", encrypt_packet(large, key.public_key()), total // 4)
+	measure("batch", BatchPacket([small] * 16), total // 4)
+	measure_relay("text", Packet(1, 2, "data", "wavenet " * 2048, via="9000"), total // 4)
+	for size in (64, 4096, 65536):
+		measure_parse(str(size), Packet(1, 2, "data", "wavenet " * (size // 8), via="9000").hop("9000", LinkCodec()), total // 4)
+
+if __name__ == "__main__":
+	bench_wire()
@@ -135,3 +135,32 @@ def test_recv_data_from_specific_id(setup_mesh_3):
 
 	assert result.get("data") == msg
 	assert result.get("from_id") == target_sender.my_id()
+
+def test_data_sent_before_listening_is_kept(setup_mesh_3):
+	hub, nodes = setup_mesh_3
+	receiver = nodes[0]
+	sender = nodes[2]
+
+	for i in range(20): sender.send(receiver.my_id(), str(i))
+	time.sleep(0.5)
+
+	received = []
+	while len(received) < 20:
+		batch = receiver.recv_many(limit=8, timeout=2.0)
+		if not batch: break
+		received += batch
+
+	assert sorted(int(body) for _, body in received) == list(range(20))
+	assert all(src == sender.my_id() for src, _ in received)
+
+def test_concurrent_pings_to_the_same_node(setup_mesh_3):
+	hub, nodes = setup_mesh_3
+	results = []
+
+	threads = [Thread(target=lambda: results.append(nodes[0].ping(nodes[2].my_id()))) for _ in range(10)]
+	for thread in threads: thread.start()
+	for thread in threads: thread.join(timeout=5)
+
+	assert results == [True] * 10
+	assert nodes[0].stats()["pending"]["in_flight"] == 0
+	assert nodes[0].stats()["pending"]["answered"] >= 10
@@ -0,0 +1,61 @@
+import pytest
+import asyncio
+import time
+from wavenetcore.WaveNetAsync import AsyncMeshHub, AsyncMeshNode, AsyncInbox
+from wavenetcore.WaveNetProtocols import LocalProtocol
+from wavenetcore.WaveNetPacketeering import Packet
+
+@pytest.fixture
+def async_mesh():
+	ports = [9100, 9101, 9102]
+	protocols = [[LocalProtocol(port)] for port in ports]
+	hub = AsyncMeshHub(protocols[0], encrypt=False)
+	nodes = [AsyncMeshNode(protocols[i], ID=i, encrypt=False) for i in range(1, 3)]
+
+	hub.run()
+	for node in nodes: node.run()
+	nodes[0].connect(0, protocols[1][0], str(ports[0]))
+	nodes[1].connect(1, protocols[2][0], str(ports[1]))
+	time.sleep(0.5)
+
+	yield hub, nodes
+
+	time.sleep(0.5)
+	hub.kill()
+	for node in nodes: node.kill()
+	time.sleep(1)
+
+def test_inbox_wakes_waiting_coroutine():
+	async def scenario():
+		inbox = AsyncInbox()
+		waiter = asyncio.create_task(inbox.wait_many(timeout=2.0))
+		await asyncio.sleep(0.05)
+		await asyncio.get_running_loop().run_in_executor(None, inbox.put, Packet(1, 2, "data", "hi"))
+		return await waiter
+
+	packets = asyncio.run(scenario())
+	assert [packet.body for packet in packets] == ["hi"]
+
+def test_inbox_wait_times_out():
+	assert asyncio.run(AsyncInbox().wait_many(timeout=0.05)) == []
+
+def test_async_send_recv_and_ping(async_mesh):
+	hub, (node1, node2) = async_mesh
+
+	async def scenario():
+		await asyncio.gather(node1.join(), node2.join())
+		pings = await asyncio.gather(hub.ping(1), hub.ping(2), node1.ping(2))
+
+		await asyncio.gather(*(node1.send(2, str(i)) for i in range(50)))
+		received = []
+		async for src, body in node2:
+			received.append((src, body))
+			if len(received) == 50: break
+
+		with pytest.raises(asyncio.TimeoutError): await node2.recv(timeout=0.2)
+		return pings, received
+
+	pings, received = asyncio.run(scenario())
+	assert pings == [True, True, True]
+	assert sorted(int(body) for _, body in received) == list(range(50))
+	assert all(src == 1 for src, _ in received)
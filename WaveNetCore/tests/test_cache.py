@@ -0,0 +1,113 @@
+import pytest
+import time
+from threading import Thread, Event
+from wavenetcore.WaveNetCache import MessageCache, KeyCache
+
+class FakeClock:
+	def __init__(self):
+		self.now = 0.0
+
+	def __call__(self):
+		return self.now
+
+def test_check_counts_hits_and_misses():
+	cache = MessageCache(capacity=8, ttl=None)
+
+	assert not cache.check(1)
+	assert cache.check(1)
+	assert not cache.check(2)
+
+	stats = cache.stats()
+	assert stats["hits"] == 1
+	assert stats["misses"] == 2
+	assert stats["size"] == 2
+
+def test_capacity_evicts_oldest():
+	cache = MessageCache(capacity=3, ttl=None)
+	for key in range(5): cache.add(key)
+
+	assert len(cache) == 3
+	assert 0 not in cache
+	assert 1 not in cache
+	assert 4 in cache
+	assert cache.stats()["evictions"] == 2
+
+def test_ttl_expires_keys():
+	clock = FakeClock()
+	cache = MessageCache(capacity=8, ttl=10.0, clock=clock)
+
+	cache.add("a")
+	clock.now = 5.0
+	cache.add("b")
+	clock.now = 12.0
+
+	assert "a" not in cache
+	assert "b" in cache
+	assert not cache.check("a")
+	assert cache.stats()["evictions"] == 1
+
+def test_memory_stays_bounded():
+	cache = MessageCache(capacity=100, ttl=None)
+	for key in range(10000): cache.check(key)
+
+	assert len(cache) == 100
+	assert len(cache.ring) == 100
+
+def test_key_cache_hits_after_first_fetch():
+	calls = []
+	def fetch(ID):
+		calls.append(ID)
+		return f"key-{ID}"
+	cache = KeyCache()
+
+	assert cache.get(5, fetch) == "key-5"
+	assert cache.get(5, fetch) == "key-5"
+
+	assert calls == [5]
+	stats = cache.stats()
+	assert stats["hits"] == 1
+	assert stats["misses"] == 1
+	assert stats["hit_rate"] == 0.5
+
+def test_key_cache_expires_and_invalidates():
+	clock = FakeClock()
+	calls = []
+	def fetch(ID):
+		calls.append(ID)
+		return len(calls)
+	cache = KeyCache(ttl=10.0, clock=clock)
+
+	assert cache.get(1, fetch) == 1
+	clock.now = 11.0
+	assert cache.get(1, fetch) == 2
+	cache.invalidate(1)
+	assert cache.get(1, fetch) == 3
+	assert cache.stats()["invalidations"] == 1
+
+def test_key_cache_merges_concurrent_lookups():
+	gate = Event()
+	calls = []
+	def fetch(ID):
+		calls.append(ID)
+		gate.wait(2)
+		return "key"
+	cache = KeyCache()
+	results = []
+	threads = [Thread(target=lambda: results.append(cache.get(7, fetch))) for _ in range(5)]
+
+	for t in threads: t.start()
+	time.sleep(0.2)
+	gate.set()
+	for t in threads: t.join(2)
+
+	assert results == ["key"] * 5
+	assert calls == [7]
+	assert cache.stats()["merged"] == 4
+
+def test_key_cache_propagates_fetch_errors():
+	def fetch(ID):
+		raise Exception("Timeout")
+	cache = KeyCache()
+
+	with pytest.raises(Exception): cache.get(3, fetch)
+	assert cache.stats()["size"] == 0
@@ -0,0 +1,107 @@
+import pytest
+import os
+import json
+import time
+from wavenetcore.WaveNetCompression import LinkCodec, InflateBudget, inflate, CODEC
+from wavenetcore.WaveNetPacketeering import *
+from wavenetcore.WaveNetMesh import MeshHub, MeshNode
+from wavenetcore.WaveNetProtocols import LocalProtocol
+
+CONTROL = json.dumps({"protocol" : "LOCAL", "dest" : "9000", "routes" : {str(i): i % 4 for i in range(1, 20)}})
+
+def test_codec_compresses_control_messages():
+	codec = LinkCodec()
+	compressed = codec.compress(CONTROL.encode())
+
+	assert compressed is not None
+	assert inflate(compressed) == CONTROL.encode()
+	stats = codec.stats()
+	assert stats["compressed"] == 1
+	assert stats["ratio"] < 0.5
+	assert stats["cpu"] >= 0
+
+def test_codec_skips_what_does_not_shrink(monkeypatch):
+	monkeypatch.setattr(LinkCodec, "max_misses", 2)
+	monkeypatch.setattr(LinkCodec, "retry_every", 4)
+	codec = LinkCodec()
+
+	assert codec.compress(b"tiny") is None
+	results = [codec.compress(os.urandom(256)) for _ in range(8)]
+	assert results == [None] * 8
+	assert codec.stats()["skipped"] == 8
+	retries = [codec.compress(CONTROL.encode()) for _ in range(4)]
+	assert retries[:3] == [None] * 3
+	assert retries[3] is not None
+
+def test_inflate_is_bounded():
+	compressed = LinkCodec().compress(bytes(1 << 16))
+
+	with pytest.raises(Exception): inflate(compressed, limit=1024)
+	with pytest.raises(Exception): inflate(compressed[:-4])
+
+def test_budget_bounds_a_whole_frame():
+	bomb = Packet(1, 2, "data", bytes(1 << 20)).hop("9000", LinkCodec())
+	frame = BatchPacket([bomb] * 8).encode()
+	assert len(frame) < 16384
+
+	packets = reconstruct_packet(frame, InflateBudget(4 << 20)).packets
+	assert all(packet.decodes() for packet in packets[:4])
+	assert not any(packet.decodes() for packet in packets[4:])
+	assert reconstruct_packet(frame).packets[7].body == bytes(1 << 20)
+
+def test_budget_covers_decrypted_bodies():
+	private_key = PrivateKey()
+	secret = encrypt_packet(Packet(1, 2, "data", bytes(1 << 20), codec=LinkCodec()), private_key.public_key())
+	frame = BatchPacket([secret] * 2).encode()
+
+	first, second = reconstruct_packet(frame, InflateBudget(1 << 20)).packets
+	assert decrypt_packet(first, private_key).decodes()
+	assert not decrypt_packet(second, private_key).decodes()
+
+def test_packet_with_codec_round_trips():
+	codec = LinkCodec()
+	for body in (CONTROL, CONTROL.encode()):
+		pkt = Packet(1, 2, "route", body).hop("9000", codec)
+		plain = Packet(1, 2, "route", body).hop("9000")
+
+		assert len(pkt.encode()) < len(plain.encode())
+		assert reconstruct_packet(pkt.encode()).body == body
+		assert reconstruct_packet(pkt.form()).body == body
+
+def test_compression_happens_before_encryption():
+	private_key = PrivateKey()
+	pkt = Packet(1, 2, "data", CONTROL * 4, codec=LinkCodec())
+	secret = encrypt_packet(pkt, private_key.public_key())
+
+	assert len(secret.body) < len(CONTROL)
+	assert decrypt_packet(secret, private_key).body == CONTROL * 4
+
+@pytest.fixture
+def mesh():
+	ports = [9195, 9196, 9197, 9198]
+	protocols = [LocalProtocol(port) for port in ports]
+	hub = MeshHub([protocols[0]], compression=True)
+	nodes = [MeshNode([protocols[1]], ID=1, compression=True), MeshNode([protocols[2]], ID=2, compression=True), MeshNode([protocols[3]], ID=3)]
+	for peer in [hub] + nodes: peer.listen()
+	for i, node in enumerate(nodes, 1): node.connect(0, protocols[i], str(ports[0]))
+	time.sleep(0.5)
+	for node in nodes: node.join()
+	yield hub, nodes
+	for peer in [hub] + nodes: peer.kill()
+	time.sleep(0.5)
+
+def test_links_negotiate_compression(mesh):
+	hub, (a, b, legacy) = mesh
+	message = "hello compressed world " * 40
+	a.send_data(2, message).result(10)
+	legacy.send_data(2, message).result(10)
+
+	assert b.recv_data(1, timeout=10) == (1, message)
+	assert b.recv_data(3, timeout=10) == (3, message)
+	links = a.stats()["node"]["links"]
+	assert links["|LOCAL|9195"]["compression"]["compressed"] >= 1
+	assert links["|LOCAL|9195"]["compression"]["ratio"] < 1.0
+	assert legacy.stats()["node"]["links"]["|LOCAL|9195"]["compression"] is None
+	hub_links = hub.node.stats()["links"]
+	assert hub_links["|LOCAL|9196"]["compression"]["codec"] == CODEC
+	assert hub_links["|LOCAL|9198"]["compression"] is None
@@ -0,0 +1,227 @@
+import pytest
+import time
+from threading import Event
+from wavenetcore.WaveNetForwarding import *
+from wavenetcore.WaveNetPacketeering import Packet, BatchPacket
+
+class FakeProtocol:
+	batch_window = 0.2
+	batch_bytes = 4096
+
+class FakeLink:
+	def __init__(self, name, gate=None, fail=False):
+		self.name = name
+		self.gate = gate
+		self.fail = fail
+		self.sent = []
+		self.protocol = FakeProtocol()
+
+	def send(self, packet):
+		if self.gate is not None: self.gate.wait(2)
+		if self.fail: raise Exception("Connection refused")
+		self.sent.append(packet)
+
+	def __str__(self):
+		return self.name
+
+def wait_until(condition, timeout=2.0):
+	start = time.monotonic()
+	while not condition() and time.monotonic() - start < timeout: time.sleep(0.01)
+	return condition()
+
+def test_slow_neighbor_does_not_block_others():
+	gate = Event()
+	slow = FakeLink("slow", gate=gate)
+	fast = FakeLink("fast")
+	forwarder = Forwarder(workers=2)
+
+	for i in range(3):
+		forwarder.submit(slow, i)
+		forwarder.submit(fast, i)
+
+	assert wait_until(lambda: fast.sent == [0, 1, 2])
+	assert slow.sent == []
+	gate.set()
+	assert wait_until(lambda: slow.sent == [0, 1, 2])
+	forwarder.shutdown()
+
+def test_drop_new_policy_counts_drops():
+	gate = Event()
+	link = FakeLink("link", gate=gate)
+	forwarder = Forwarder(workers=1, queue_size=2, policy=DropPolicy.DROP_NEW)
+
+	results = [forwarder.submit(link, i) for i in range(6)]
+	gate.set()
+
+	assert not all(results)
+	assert wait_until(lambda: forwarder.stats()["link"]["depth"] == 0)
+	stats = forwarder.stats()["link"]
+	assert stats["dropped"] == results.count(False)
+	assert stats["sent"] == results.count(True)
+	forwarder.shutdown()
+
+def test_drop_old_policy_keeps_newest():
+	gate = Event()
+	link = FakeLink("link", gate=gate)
+	forwarder = Forwarder(workers=1, queue_size=2, policy=DropPolicy.DROP_OLD)
+
+	forwarder.submit(link, 0)
+	assert wait_until(lambda: forwarder.stats()["link"]["depth"] == 0)
+	for i in range(1, 6): forwarder.submit(link, i)
+	gate.set()
+
+	assert wait_until(lambda: len(link.sent) == 3)
+	assert link.sent == [0, 4, 5]
+	forwarder.shutdown()
+
+def test_failures_are_counted():
+	link = FakeLink("dead", fail=True)
+	forwarder = Forwarder(workers=1)
+
+	forwarder.submit(link, 0)
+
+	assert wait_until(lambda: forwarder.stats()["dead"]["failed"] == 1)
+	forwarder.shutdown()
+
+def test_failing_callback_does_not_stall_the_queue():
+	def on_result(link, packet, error, elapsed):
+		raise Exception("Broken callback")
+
+	link = FakeLink("link")
+	forwarder = Forwarder(workers=1, on_result=on_result)
+	forwarder.submit(link, 0)
+	assert wait_until(lambda: link.sent == [0])
+	forwarder.submit(link, 1)
+	forwarder.submit(link, 2)
+
+	assert wait_until(lambda: link.sent == [0, 1, 2])
+	forwarder.shutdown()
+
+def test_executor_returns_futures():
+	executor = BoundedExecutor(workers=2)
+
+	future = executor.submit(lambda x: x * 2, 21)
+	failing = executor.submit(lambda: 1 / 0)
+
+	assert future.result(timeout=2) == 42
+	with pytest.raises(ZeroDivisionError): failing.result(timeout=2)
+	assert wait_until(lambda: executor.stats()["pending"] == 0)
+	stats = executor.stats()
+	assert stats["completed"] == 1
+	assert stats["failed"] == 1
+	executor.shutdown()
+
+def test_executor_rejects_when_saturated():
+	gate = Event()
+	executor = BoundedExecutor(workers=1, queue_size=1, policy=DropPolicy.DROP_NEW)
+
+	running = executor.submit(gate.wait, 2)
+	queued = executor.submit(gate.wait, 2)
+	rejected = executor.submit(gate.wait, 2)
+
+	with pytest.raises(ExecutorFull): rejected.result(timeout=0)
+	gate.set()
+	assert running.result(timeout=2)
+	assert queued.result(timeout=2)
+	assert executor.stats()["rejected"] == 1
+	executor.shutdown()
+
+def test_executor_blocks_until_space():
+	gate = Event()
+	executor = BoundedExecutor(workers=1, queue_size=0, policy=DropPolicy.BLOCK, block_timeout=0.1)
+
+	executor.submit(gate.wait, 2)
+	with pytest.raises(ExecutorFull): executor.submit(gate.wait, 2).result(timeout=0)
+	gate.set()
+	assert executor.submit(lambda: True).result(timeout=2)
+	executor.shutdown()
+
+def test_batching_coalesces_packets_within_the_window():
+	link = FakeLink("link")
+	forwarder = Forwarder(workers=1, batching=True)
+
+	for i in range(5): forwarder.submit(link, Packet(1, 2, "msg", str(i)))
+
+	assert wait_until(lambda: forwarder.stats()["link"]["sent"] == 5)
+	assert len(link.sent) == 1
+	assert type(link.sent[0]) == BatchPacket
+	assert [packet.body for packet in link.sent[0].packets] == ["0", "1", "2", "3", "4"]
+	assert forwarder.stats()["link"]["frames"] == 1
+	forwarder.shutdown()
+
+def test_batching_respects_the_byte_budget():
+	link = FakeLink("link")
+	link.protocol.batch_window = 0.0
+	link.protocol.batch_bytes = 2 * (Forwarder.overhead + 100)
+	gate = Event()
+	blocker = FakeLink("blocker", gate=gate)
+	forwarder = Forwarder(workers=1, batching=True)
+	forwarder.submit(blocker, Packet(1, 2, "msg", ""))
+
+	for i in range(5): forwarder.submit(link, Packet(1, 2, "msg", "x" * 100))
+	gate.set()
+
+	assert wait_until(lambda: forwarder.stats()["link"]["sent"] == 5)
+	assert [len(frame.packets) if type(frame) == BatchPacket else 1 for frame in link.sent] == [2, 2, 1]
+	forwarder.shutdown()
+
+def test_single_packets_are_not_wrapped():
+	link = FakeLink("link")
+	link.protocol.batch_window = 0.0
+	forwarder = Forwarder(workers=1, batching=True)
+	forwarder.submit(link, Packet(1, 2, "msg", "alone"))
+
+	assert wait_until(lambda: len(link.sent) == 1)
+	assert type(link.sent[0]) == Packet
+	forwarder.shutdown()
+
+def test_batched_mesh_delivers_every_message():
+	from wavenetcore.WaveNetMesh import MeshHub, MeshNode
+	from wavenetcore.WaveNetProtocols import LocalProtocol
+	ports = [9180, 9181, 9182]
+	protocols = [LocalProtocol(port) for port in ports]
+	hub = MeshHub([protocols[0]], encrypt=False, batching=True)
+	nodes = [MeshNode([protocols[i]], ID=i, encrypt=False, batching=True) for i in (1, 2)]
+	for node in [hub] + nodes: node.listen()
+	for i, node in enumerate(nodes, 1): node.connect(0, protocols[i], str(ports[0]))
+	time.sleep(0.5)
+	for node in nodes: node.join()
+
+	futures = [nodes[0].send_data(2, str(i)) for i in range(50)]
+	for future in futures: future.result(5)
+	received = [nodes[1].recv_data(1, timeout=5)[1] for i in range(50)]
+
+	assert sorted(received, key=int) == [str(i) for i in range(50)]
+	stats = nodes[0].node.forwarder.stats()
+	assert sum(queue["frames"] for queue in stats.values()) < sum(queue["sent"] for queue in stats.values())
+	for node in [hub] + nodes: node.kill()
+	time.sleep(0.5)
+
+def test_shared_executor_outlives_a_killed_node():
+	from wavenetcore.WaveNetMesh import MeshNode
+	from wavenetcore.WaveNetProtocols import LocalProtocol
+	executor = BoundedExecutor(workers=2)
+	nodes = [MeshNode([LocalProtocol(port)], ID=port, encrypt=False, executor=executor) for port in (9178, 9179)]
+	nodes[0].kill()
+
+	assert executor.submit(lambda: 42).result(timeout=1) == 42
+	nodes[1].kill()
+	executor.shutdown()
+
+def test_ping_is_answered_outside_the_control_lock():
+	import json
+	from threading import Thread
+	from wavenetcore.WaveNetMesh import MeshNode
+	from wavenetcore.WaveNetPacketeering import Packet
+	from wavenetcore.WaveNetProtocols import LocalProtocol
+	node = MeshNode([LocalProtocol(9178)], ID=5, encrypt=False)
+	sent = []
+	node.sends = lambda dest, mtype, message: sent.append((dest, mtype))
+
+	with node.mutex:
+		thread = Thread(target=node.delegate, args=[Packet(7, 5, "ping", json.dumps({"rid" : 1}))])
+		thread.start()
+		thread.join(timeout=1)
+		assert not thread.is_alive()
+	assert sent == [(7, "pong")]
+	node.kill()
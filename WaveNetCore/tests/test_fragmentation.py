@@ -0,0 +1,173 @@
+import pytest
+import os
+import time
+from wavenetcore.WaveNetMesh import MeshHub, MeshNode
+from wavenetcore.WaveNetFragmentation import split, pack_fragment, unpack_fragment, SentFragments, Reassembly, FRAGMENT_HEADER
+from wavenetcore.WaveNetNode import Node, NodeInfo
+from wavenetcore.WaveNetCrypto import PrivateKey
+from wavenetcore.WaveNetProtocols import LocalProtocol, Link
+
+class FakeClock:
+	def __init__(self):
+		self.now = 0.0
+
+	def __call__(self):
+		return self.now
+
+def test_split_covers_the_body():
+	assert split(b"abcdefg", 3) == [b"abc", b"def", b"g"]
+	assert split(b"", 3) == [b""]
+
+def test_reassembly_out_of_order():
+	reassembly = Reassembly()
+	fragments = split(b"hello fragmented world", 4)
+	order = list(reversed(range(len(fragments))))
+	results = [reassembly.put(1, 7, i, len(fragments), fragments[i]) for i in order]
+
+	assert results[:-1] == [None] * (len(fragments) - 1)
+	assert results[-1] == b"hello fragmented world"
+	assert reassembly.stats()["incomplete"] == 0
+	assert reassembly.stats()["bytes"] == 0
+
+def test_reassembly_ignores_duplicates_and_rejects_bad_fragments():
+	reassembly = Reassembly(max_fragments=8)
+	assert reassembly.put(1, 7, 0, 2, b"ab") is None
+	assert reassembly.put(1, 7, 0, 2, b"ab") is None
+	assert reassembly.stats()["bytes"] == 2
+	with pytest.raises(Exception): reassembly.put(1, 7, 2, 2, b"cd")
+	with pytest.raises(Exception): reassembly.put(1, 7, 0, 9, b"cd")
+	with pytest.raises(Exception): reassembly.put(1, 7, 1, 3, b"cd")
+
+def test_reassembly_memory_is_bounded():
+	reassembly = Reassembly(capacity=2, max_bytes=10)
+	reassembly.put(1, 1, 0, 2, b"aaaa")
+	reassembly.put(1, 2, 0, 2, b"bbbb")
+	reassembly.put(1, 3, 0, 2, b"cccc")
+
+	stats = reassembly.stats()
+	assert stats["incomplete"] == 2
+	assert stats["bytes"] <= 10
+	assert stats["evicted"] == 1
+	assert reassembly.put(1, 1, 1, 2, b"aaaa") is None
+
+def test_reassembly_asks_for_missing_fragments_and_expires():
+	clock = FakeClock()
+	reassembly = Reassembly(timeout=10, nack_after=1, clock=clock)
+	reassembly.put(5, 9, 1, 4, b"x")
+	assert reassembly.missing() == []
+
+	clock.now = 1.5
+	assert reassembly.missing() == [(5, 9, [0, 2, 3])]
+	assert reassembly.missing() == []
+
+	clock.now = 11
+	assert reassembly.missing() == []
+	assert reassembly.stats()["expired"] == 1
+
+def test_reassembly_waits_longer_on_slow_links():
+	clock = FakeClock()
+	reassembly = Reassembly(timeout=30, nack_after=0.5, clock=clock)
+	reassembly.put(5, 9, 1, 4, b"x", pace=88.0)
+
+	clock.now = 200
+	assert reassembly.missing() == []
+	clock.now = 265
+	assert reassembly.missing() == [(5, 9, [0, 2, 3])]
+	clock.now = 1000
+	reassembly.missing()
+	assert reassembly.stats()["expired"] == 0
+	clock.now = 30 + 3 * 4 * 88
+	reassembly.missing()
+	assert reassembly.stats()["expired"] == 1
+
+def test_slow_links_take_longer_per_fragment(monkeypatch):
+	from wavenetcore.WaveNetProtocols import SoundProtocol, empty_protocol_from_str
+	monkeypatch.setattr(SoundProtocol, "MAC", "1:1:1:1:1:1")
+	node = Node(NodeInfo(1, None), [LocalProtocol(9188)], lambda packet: True, routing=False)
+	node.info.add_neighbor(Link("9189", LocalProtocol(9189)))
+	fast = node.transfer_time(2, 107)
+	node.info.add_neighbor(Link("sound", empty_protocol_from_str("SOUND")))
+
+	assert fast < 1.0
+	assert node.transfer_time(2, 107) >= SoundProtocol.latency
+
+def test_sent_fragments_only_resend_to_the_destination():
+	clock = FakeClock()
+	sent = SentFragments(ttl=5, clock=clock)
+	sent.put(9, 2, [b"a", b"b", b"c"], text=True)
+
+	assert sent.get(9, 3, [0]) == (0, False, [])
+	assert sent.get(9, 2, [2, 7, "x"]) == (3, True, [(2, b"c")])
+	clock.now = 6
+	assert sent.get(9, 2, [0]) == (0, False, [])
+
+def test_fragment_body_round_trip():
+	body = pack_fragment(1 << 63, 2, 3, True, b"chunk")
+
+	assert unpack_fragment(body) == (1 << 63, 2, 3, True, b"chunk")
+	with pytest.raises(Exception): unpack_fragment(body[:4])
+
+def test_fragment_packets_fit_the_frame_budget(monkeypatch):
+	node = Node(NodeInfo(1, PrivateKey()), [LocalProtocol(9188)], lambda packet: True, routing=False)
+	link = Link("9189", LocalProtocol(9189))
+	node.info.add_neighbor(link)
+	key = PrivateKey().public_key()
+
+	def frame(size, public_key):
+		packet = node.wrap(2, "fragment", os.urandom(FRAGMENT_HEADER.size + size), public_key=public_key)
+		return len(link.protocol.frame(packet.hop(node.via(link))))
+
+	for binary, mtu, public_key in ((True, 300, None), (False, 300, None), (True, 300, key), (False, 107, key)):
+		monkeypatch.setattr(LocalProtocol, "binary", binary)
+		monkeypatch.setattr(LocalProtocol, "mtu", mtu)
+		size = node.mtu(2, "fragment", FRAGMENT_HEADER.size, public_key=public_key)
+		budget = -(-(frame(0, public_key) + 1) // mtu) * mtu
+
+		assert size > 0
+		assert frame(size, public_key) <= budget < frame(size + 32, public_key)
+
+@pytest.fixture
+def mesh(monkeypatch):
+	monkeypatch.setattr(LocalProtocol, "mtu", 400)
+	ports = [9185, 9186, 9187]
+	protocols = [LocalProtocol(port) for port in ports]
+	hub = MeshHub([protocols[0]])
+	nodes = [MeshNode([protocols[i]], ID=i) for i in (1, 2)]
+	nodes[1].reassembly.nack_after = 0.2
+	for peer in [hub] + nodes: peer.listen()
+	for i, node in enumerate(nodes, 1): node.connect(0, protocols[i], str(ports[0]))
+	time.sleep(0.5)
+	for node in nodes: node.join()
+	yield hub, nodes
+	for peer in [hub] + nodes: peer.kill()
+	time.sleep(0.5)
+
+def test_large_message_is_fragmented_and_rebuilt(mesh):
+	hub, (a, b) = mesh
+	message = "".join(chr(ord("a") + i % 26) for i in range(5000))
+	a.send_data(2, message).result(10)
+
+	assert b.recv_data(1, timeout=10) == (1, message)
+	assert b.stats()["fragments"]["completed"] == 1
+	assert a.stats()["fragments"]["messages"] == 1
+
+def test_large_binary_message_is_fragmented_and_rebuilt(mesh):
+	hub, (a, b) = mesh
+	message = bytes(range(256)) * 20
+	a.send_data(2, message).result(10)
+
+	assert b.recv_data(1, timeout=10) == (1, message)
+
+def test_lost_fragment_is_resent(mesh):
+	hub, (a, b) = mesh
+	process_fragment, dropped = b.process_fragment, []
+	def lossy(packet):
+		if not dropped: dropped.append(packet)
+		else: process_fragment(packet)
+	b.process_fragment = lossy
+	message = "0123456789" * 50
+	a.send_data(2, message).result(10)
+
+	assert b.recv_data(1, timeout=10) == (1, message)
+	assert len(dropped) == 1
+	assert a.stats()["fragments"]["resent"] >= 1
@@ -0,0 +1,90 @@
+import pytest
+import json
+import time
+from wavenetcore.WaveNetMesh import MeshHub, MeshNode
+from wavenetcore.WaveNetCrypto import PrivateKey
+from wavenetcore.WaveNetPacketeering import Packet
+from wavenetcore.WaveNetProtocols import LocalProtocol
+
+def wait_for(condition, timeout=5.0):
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		if condition(): return True
+		time.sleep(0.05)
+	return condition()
+
+def no_fetch(ID):
+	raise Exception(f"Asked the hub for {ID}")
+
+@pytest.fixture
+def pair():
+	hub = MeshHub([LocalProtocol(9160)], encrypt=False)
+	node = MeshNode([LocalProtocol(9161)], ID=7, encrypt=False, gossip=True)
+	node.hub_key = hub.private_key.public_key()
+	yield hub, node
+	node.kill()
+	hub.kill()
+
+def entry(hub, ID, key):
+	hub.process_join(Packet(ID, 0, "join", json.dumps({"id" : ID, "pem" : str(key.public_key())})))
+	epoch, pem, _, _ = hub.entries[ID]
+	return [ID, epoch, pem, hub.certify(ID), hub.issued[ID]]
+
+def gossip(entries):
+	return Packet(8, 7, "gossip", json.dumps({"entries" : entries}))
+
+def test_learns_keys_signed_by_the_hub(pair):
+	hub, node = pair
+	key = PrivateKey()
+	node.process_gossip(gossip([entry(hub, 5, key)]))
+
+	assert str(node.keys.get(5, no_fetch)) == str(key.public_key())
+	assert node.stats()["gossip"]["learned"] == 1
+	assert node.stats()["gossip"]["convergence"] is not None
+
+def test_rejects_keys_not_signed_by_the_hub(pair):
+	hub, node = pair
+	forged = entry(hub, 5, PrivateKey())
+	forged[2] = str(PrivateKey().public_key())
+	node.process_gossip(gossip([forged]))
+
+	with pytest.raises(Exception): node.keys.get(5, no_fetch)
+	assert node.stats()["gossip"]["rejected"] == 1
+
+def test_rotated_keys_are_not_brought_back(pair):
+	hub, node = pair
+	old = PrivateKey()
+	stale = entry(hub, 5, old)
+	node.process_gossip(gossip([stale]))
+
+	node.floors[5] = node.certificates.pop(5)[0] + 1
+	node.keys.invalidate(5)
+	node.process_gossip(gossip([stale]))
+	with pytest.raises(Exception): node.keys.get(5, no_fetch)
+
+@pytest.fixture
+def chain(monkeypatch):
+	monkeypatch.setattr(MeshNode, "gossip_interval", 0.2)
+	ports = [9162, 9163, 9164, 9165]
+	protocols = [LocalProtocol(port) for port in ports]
+	hub = MeshHub([protocols[0]], encrypt=False)
+	nodes = [MeshNode([protocols[i]], ID=i, encrypt=False, gossip=True) for i in range(1, 4)]
+	for node in [hub] + nodes: node.listen()
+
+	nodes[0].connect(0, protocols[1], str(ports[0]))
+	nodes[1].connect(1, protocols[2], str(ports[1]))
+	nodes[2].connect(2, protocols[3], str(ports[2]))
+	time.sleep(0.5)
+	for node in nodes: node.join()
+
+	yield hub, nodes
+
+	for node in [hub] + nodes: node.kill()
+	time.sleep(0.5)
+
+def test_keys_spread_without_asking_the_hub(chain):
+	hub, nodes = chain
+
+	assert wait_for(lambda: 1 in nodes[2].certificates)
+	assert str(nodes[2].keys.get(1, no_fetch)) == str(nodes[0].private_key.public_key())
+	assert nodes[0].stats()["gossip"]["sent"] > 0
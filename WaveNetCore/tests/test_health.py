@@ -0,0 +1,92 @@
+import pytest
+import time
+from wavenetcore.WaveNetHealth import LinkHealth
+from wavenetcore.WaveNetNode import *
+
+class FakeClock:
+	def __init__(self):
+		self.now = 0.0
+
+	def __call__(self):
+		return self.now
+
+def test_success_tracks_latency_average():
+	health = LinkHealth(clock=FakeClock())
+	health.success(1.0)
+	health.success(2.0)
+
+	assert health.state() == "up"
+	assert health.latency == pytest.approx(1.2)
+	assert health.stats()["sent"] == 2
+
+def test_failures_back_off_exponentially():
+	clock = FakeClock()
+	health = LinkHealth(clock=clock)
+
+	health.failure()
+	assert health.state() == "backoff"
+	assert not health.usable()
+	clock.now = LinkHealth.base_backoff
+	assert health.usable()
+
+	health.failure()
+	assert health.retry_at == clock.now + 2 * LinkHealth.base_backoff
+
+def test_quarantine_needs_a_probe():
+	clock = FakeClock()
+	health = LinkHealth(clock=clock)
+	for _ in range(LinkHealth.quarantine_after): health.failure()
+
+	assert health.state() == "quarantine"
+	clock.now = 1000.0
+	assert not health.usable()
+	assert health.should_probe()
+	health.probing()
+	assert not health.should_probe()
+
+	health.success(0.1)
+	assert health.usable()
+	assert health.dead_for() == 0.0
+
+def test_node_quarantines_dead_neighbor():
+	node = Node(NodeInfo(1, None), [LocalProtocol(9110)], lambda packet: True)
+	dead = Link("9111", LocalProtocol())
+	node.add_link(dead, 2)
+
+	for _ in range(LinkHealth.quarantine_after):
+		node.info.get_health(dead).retry_at = 0.0
+		node.send(2, "data", "hello")
+		time.sleep(0.2)
+
+	stats = node.stats()
+	assert stats["links"]["|LOCAL|9111"]["state"] == "quarantine"
+	assert stats["routing"]["down"] == ["|LOCAL|9111"]
+
+	node.remove_link(dead)
+	assert node.stats()["links"] == {}
+	node.kill()
+
+def test_cost_prefers_fast_protocol_and_falls_back():
+	SoundProtocol.MAC = "0:0:0:0:0:0"
+	node = Node(NodeInfo(1, None), [LocalProtocol(9112)], lambda packet: True)
+	local = Link("9113", LocalProtocol())
+	sound = Link("1:1:1:1:1:1", SoundProtocol())
+	node.router.add_link(local, 2)
+	node.router.add_link(sound, 2)
+	node.info.add_neighbor(local)
+	node.info.add_neighbor(sound)
+
+	assert node.info.get_health(sound).cost(100) > node.info.get_health(local).cost(100)
+	assert node.flood_links(None, 100) == [local]
+	assert node.cheapest(node.router.links_to(2), 100) == [local]
+
+	node.info.get_health(local).failure()
+	assert node.flood_links(None, 100) == [sound]
+	SoundProtocol.MAC = None
+
+def test_large_sends_update_throughput():
+	health = LinkHealth(latency=0.1, throughput=100.0, clock=FakeClock())
+	health.success(1.1, size=10000)
+
+	assert health.throughput == pytest.approx(0.2 * 10000 + 0.8 * 100.0)
+	assert health.cost(0) == pytest.approx(0.1)
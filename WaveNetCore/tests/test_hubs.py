@@ -0,0 +1,120 @@
+import pytest
+import json
+import base64
+import time
+from wavenetcore.WaveNetMesh import MeshHub, MeshNode, hub_id, is_hub, HUB_COUNT
+from wavenetcore.WaveNetCrypto import PrivateKey
+from wavenetcore.WaveNetPacketeering import Packet
+from wavenetcore.WaveNetProtocols import LocalProtocol, Link
+
+def wait_for(condition, timeout=5.0):
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		if condition(): return True
+		time.sleep(0.05)
+	return condition()
+
+def test_hub_ids_are_reserved():
+	assert hub_id(0) == 0
+	assert all(is_hub(hub_id(i)) for i in range(HUB_COUNT))
+	assert not is_hub(1)
+	assert not is_hub((1 << 64) - HUB_COUNT)
+	with pytest.raises(AssertionError): MeshNode([LocalProtocol(9149)], ID=hub_id(1))
+
+@pytest.fixture
+def replicas():
+	key = PrivateKey()
+	hubs = [MeshHub([LocalProtocol(9150 + i)], encrypt=False, index=i, private_key=key) for i in range(2)]
+	yield hubs
+	for hub in hubs: hub.kill()
+
+def sync_packet(hub, signer, src, digest=None, entries={}, want=[]):
+	payload = json.dumps({"digest" : digest, "entries" : entries, "want" : want})
+	sig = base64.b64encode(signer.sign(payload.encode())).decode()
+	return Packet(src, hub.ID, "sync", json.dumps({"payload" : payload, "sig" : sig}))
+
+def test_sync_requires_directory_signature(replicas):
+	hub, other = replicas
+	pem = str(PrivateKey().public_key())
+
+	with pytest.raises(Exception):
+		hub.process_sync(sync_packet(hub, PrivateKey(), other.ID, entries={"5" : [0, pem, 1.0]}))
+	hub.process_sync(sync_packet(hub, PrivateKey(), 5, entries={"5" : [0, pem, 1.0]}))
+	assert 5 not in hub.nodes
+
+	hub.process_sync(sync_packet(hub, other.private_key, other.ID, entries={"5" : [0, pem, 1.0]}))
+	assert str(hub.nodes[5]) == pem
+
+def test_sync_keeps_newest_epoch(replicas):
+	hub, other = replicas
+	old, new = str(PrivateKey().public_key()), str(PrivateKey().public_key())
+
+	hub.process_sync(sync_packet(hub, other.private_key, other.ID, entries={"5" : [1, new, 2.0]}))
+	hub.process_sync(sync_packet(hub, other.private_key, other.ID, entries={"5" : [0, old, 1.0]}))
+	assert str(hub.nodes[5]) == new
+	assert hub.entries[5][0] == 1
+
+def test_conflicts_resolve_the_same_on_every_replica(replicas):
+	a, b = str(PrivateKey().public_key()), str(PrivateKey().public_key())
+	for hub, first, second in ((replicas[0], a, b), (replicas[1], b, a)):
+		other = replicas[1] if hub is replicas[0] else replicas[0]
+		hub.process_sync(sync_packet(hub, other.private_key, other.ID, entries={"5" : [0, first, 1.0]}))
+		hub.process_sync(sync_packet(hub, other.private_key, other.ID, entries={"5" : [0, second, 1.0]}))
+
+	assert replicas[0].entries[5] == replicas[1].entries[5]
+
+def test_first_registration_wins_at_equal_epoch(replicas):
+	hub, other = replicas
+	keys = sorted((str(PrivateKey().public_key()) for _ in range(2)), key=MeshHub.fingerprint)
+	attacker, victim = keys
+
+	hub.process_sync(sync_packet(hub, other.private_key, other.ID, entries={"5" : [0, victim, 100.0]}))
+	hub.process_sync(sync_packet(hub, other.private_key, other.ID, entries={"5" : [0, attacker, 200.0]}))
+	assert str(hub.nodes[5]) == victim
+
+	hub.process_sync(sync_packet(hub, other.private_key, other.ID, digest={"5" : [0, MeshHub.fingerprint(attacker), 200.0]}))
+	assert str(hub.nodes[5]) == victim
+
+@pytest.fixture
+def mesh(monkeypatch):
+	monkeypatch.setattr(MeshHub, "sync_interval", 0.2)
+	monkeypatch.setattr(MeshNode, "hub_timeout", 0.5)
+	key = PrivateKey()
+	ports = [9140, 9141, 9142, 9143]
+	protocols = [LocalProtocol(port) for port in ports]
+	hubs = [MeshHub([protocols[i]], encrypt=False, index=i, private_key=key) for i in range(2)]
+	nodes = [MeshNode([protocols[i]], ID=i, encrypt=False) for i in range(2, 4)]
+	for node in hubs + nodes: node.listen()
+
+	for i, node in enumerate(nodes, 2):
+		for j, hub in enumerate(hubs): node.connect(hub.ID, protocols[i], str(ports[j]))
+	hubs[0].node.add_link(Link(str(ports[1]), protocols[0]), hubs[1].ID)
+	hubs[1].node.add_link(Link(str(ports[0]), protocols[1]), hubs[0].ID)
+	time.sleep(0.5)
+
+	yield hubs, nodes
+
+	for node in hubs + nodes: node.kill()
+	time.sleep(0.5)
+
+def test_replicas_converge(mesh):
+	hubs, nodes = mesh
+	hubs[0].process_join(Packet(2, 0, "join", json.dumps({"id" : 2, "pem" : str(nodes[0].private_key.public_key())})))
+
+	assert wait_for(lambda: 2 in hubs[1].nodes)
+	assert str(hubs[1].nodes[2]) == str(hubs[0].nodes[2])
+	assert hubs[1].stats()["synced"] >= 1
+
+def test_requests_fail_over_to_another_replica(mesh):
+	hubs, nodes = mesh
+	for node in nodes: node.join()
+	assert wait_for(lambda: all(ID in hub.nodes for hub in hubs for ID in (2, 3)))
+
+	nodes[1].hub_loads[hubs[1].ID] = 100
+	assert nodes[1].hubs() == [hubs[0].ID, hubs[1].ID]
+	hubs[0].process_request = lambda packet: None
+	key = nodes[1].request(2)
+
+	assert str(key) == str(nodes[0].private_key.public_key())
+	assert nodes[1].stats()["failovers"] == 1
+	assert nodes[1].hubs()[0] == hubs[1].ID
@@ -0,0 +1,107 @@
+import pytest
+import time
+from threading import Thread
+from wavenetcore.WaveNetMesh import Inbox
+from wavenetcore.WaveNetForwarding import DropPolicy
+from wavenetcore.WaveNetPacketeering import Packet
+
+def data(src, body):
+	return Packet(src, 9, "data", body)
+
+def test_messages_wait_until_received():
+	inbox = Inbox()
+	for i in range(3): inbox.put(data(1, str(i)))
+
+	assert [inbox.get(timeout=0).body for _ in range(3)] == ["0", "1", "2"]
+	assert inbox.get(timeout=0) is None
+
+def test_any_source_returns_oldest_first():
+	inbox = Inbox()
+	inbox.put(data(2, "a"))
+	inbox.put(data(1, "b"))
+	inbox.put(data(2, "c"))
+
+	assert [inbox.get(timeout=0).body for _ in range(3)] == ["a", "b", "c"]
+
+def test_specific_source_skips_others():
+	inbox = Inbox()
+	inbox.put(data(2, "other"))
+	inbox.put(data(1, "mine"))
+
+	assert inbox.get(1, timeout=0).body == "mine"
+	assert inbox.get(1, timeout=0) is None
+	assert inbox.get(timeout=0).body == "other"
+
+def test_get_many_drains_in_one_call():
+	inbox = Inbox()
+	for i in range(10): inbox.put(data(1, str(i)))
+
+	assert [packet.body for packet in inbox.get_many(limit=4, timeout=0)] == ["0", "1", "2", "3"]
+	assert len(inbox.get_many(limit=100, timeout=0)) == 6
+	assert inbox.get_many(timeout=0) == []
+	assert inbox.stats()["delivered"] == 10
+
+def test_drop_old_keeps_newest():
+	inbox = Inbox(capacity=2, policy=DropPolicy.DROP_OLD)
+	for i in range(4): inbox.put(data(1, str(i)))
+
+	assert [packet.body for packet in inbox.get_many(timeout=0)] == ["2", "3"]
+	assert inbox.stats()["dropped"] == 2
+
+def test_drop_new_keeps_oldest():
+	inbox = Inbox(capacity=2, policy=DropPolicy.DROP_NEW)
+	results = [inbox.put(data(1, str(i))) for i in range(4)]
+
+	assert results == [True, True, False, False]
+	assert [packet.body for packet in inbox.get_many(timeout=0)] == ["0", "1"]
+
+def test_bound_is_per_source():
+	inbox = Inbox(capacity=1, policy=DropPolicy.DROP_NEW)
+
+	assert inbox.put(data(1, "a"))
+	assert inbox.put(data(2, "b"))
+	assert not inbox.put(data(1, "c"))
+
+def test_total_bound_covers_all_sources():
+	inbox = Inbox(capacity=4, total=3, policy=DropPolicy.DROP_OLD)
+	for src in range(1, 6): inbox.put(data(src, str(src)))
+
+	assert len(inbox.queues) == 3
+	assert [packet.body for packet in inbox.get_many(timeout=0)] == ["3", "4", "5"]
+	assert inbox.stats()["dropped"] == 2
+
+	strict = Inbox(capacity=4, total=2, policy=DropPolicy.DROP_NEW)
+	assert [strict.put(data(src, "x")) for src in range(1, 4)] == [True, True, False]
+
+def test_empty_sources_are_forgotten():
+	inbox = Inbox()
+	for src in range(100): inbox.put(data(src, "x"))
+	inbox.get_many(limit=100, timeout=0)
+
+	assert inbox.queues == {}
+	assert inbox.stats()["depth"] == {}
+
+def test_block_waits_for_space():
+	inbox = Inbox(capacity=1, policy=DropPolicy.BLOCK, block_timeout=2.0)
+	inbox.put(data(1, "a"))
+
+	def consume():
+		time.sleep(0.1)
+		inbox.get(timeout=0)
+
+	thread = Thread(target=consume)
+	thread.start()
+	assert inbox.put(data(1, "b"))
+	thread.join()
+	assert inbox.get(timeout=0).body == "b"
+
+def test_waiting_receiver_is_woken():
+	inbox = Inbox()
+	result = []
+	thread = Thread(target=lambda: result.append(inbox.get(timeout=2.0)))
+	thread.start()
+	time.sleep(0.05)
+	inbox.put(data(1, "late"))
+	thread.join()
+
+	assert result[0].body == "late"
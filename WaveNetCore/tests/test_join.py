@@ -0,0 +1,50 @@
+import pytest
+import json
+import time
+from wavenetcore.WaveNetMesh import MeshHub, MeshNode
+from wavenetcore.WaveNetCrypto import PrivateKey
+from wavenetcore.WaveNetPacketeering import Packet
+from wavenetcore.WaveNetProtocols import LocalProtocol
+
+@pytest.fixture
+def mesh():
+	ports = [9175, 9176]
+	protocols = [LocalProtocol(port) for port in ports]
+	hub = MeshHub([protocols[0]])
+	node = MeshNode([protocols[1]], ID=1)
+	for peer in (hub, node): peer.listen()
+	node.connect(0, protocols[1], str(ports[0]))
+	yield hub, node
+	node.kill()
+	hub.kill()
+	time.sleep(0.5)
+
+def test_join_completes_in_one_round_trip(mesh):
+	hub, node = mesh
+	node.join()
+
+	assert str(node.hub_key) == str(hub.private_key.public_key())
+	assert node.stats()["join_time"] < 0.5
+	assert str(hub.nodes[1]) == str(node.private_key.public_key())
+
+def test_join_retries_until_the_hub_answers(mesh, monkeypatch):
+	monkeypatch.setattr(MeshNode, "join_timeout", 0.2)
+	hub, node = mesh
+	process_join, dropped = hub.process_join, []
+	def lossy(packet):
+		if not dropped: dropped.append(packet)
+		else: process_join(packet)
+	hub.process_join = lossy
+	node.join()
+
+	assert node.stats()["join_time"] >= 0.2
+	assert len(dropped) == 1
+	assert node.hub_health[0].failed == 1
+
+def test_rejected_join_fails_fast(mesh):
+	hub, node = mesh
+	hub.process_join(Packet(1, 0, "join", json.dumps({"id" : 1, "pem" : str(PrivateKey().public_key())})))
+
+	start = time.monotonic()
+	with pytest.raises(Exception, match="Repeated ID"): node.join()
+	assert time.monotonic() - start < MeshNode.join_timeout
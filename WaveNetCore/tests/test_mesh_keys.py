@@ -0,0 +1,96 @@
+import pytest
+import json
+import base64
+from wavenetcore.WaveNetMesh import MeshHub, MeshNode
+from wavenetcore.WaveNetCrypto import PrivateKey
+from wavenetcore.WaveNetPacketeering import Packet
+from wavenetcore.WaveNetProtocols import LocalProtocol
+
+def join(ID, key, signer=None):
+	body = {"id" : ID, "pem" : str(key.public_key())}
+	if signer is not None: body["sig"] = base64.b64encode(signer.sign(body["pem"].encode())).decode()
+	return Packet(ID, 0, "join", json.dumps(body))
+
+@pytest.fixture
+def hub():
+	hub = MeshHub([LocalProtocol(9190)])
+	yield hub
+	hub.kill()
+
+def test_repeated_id_with_other_key_is_rejected(hub):
+	owner, attacker = PrivateKey(), PrivateKey()
+	hub.process_join(join(5, owner))
+	hub.process_join(join(5, owner))
+
+	with pytest.raises(Exception): hub.process_join(join(5, attacker))
+	with pytest.raises(Exception): hub.process_join(join(5, attacker, signer=attacker))
+	assert str(hub.nodes[5]) == str(owner.public_key())
+
+def test_key_rotation_signed_by_registered_key(hub):
+	old, new = PrivateKey(), PrivateKey()
+	hub.process_join(join(5, old))
+	hub.process_join(join(5, new, signer=old))
+
+	assert str(hub.nodes[5]) == str(new.public_key())
+
+def rekey(signer, ID, epoch):
+	sig = base64.b64encode(signer.sign(MeshHub.rekey_notice(ID, epoch))).decode()
+	return Packet(0, -1, "rekey", json.dumps({"id" : ID, "epoch" : epoch, "sig" : sig}))
+
+def test_rekey_notice_must_be_signed_by_hub(hub):
+	node = MeshNode([LocalProtocol(9191)], ID=7)
+	node.hub_key = hub.private_key.public_key()
+
+	node.keys.put(5, "cached")
+	with pytest.raises(Exception): node.process_rekey(rekey(PrivateKey(), 5, 1))
+	assert node.keys.stats()["size"] == 1
+
+	node.process_rekey(rekey(hub.private_key, 5, 1))
+	assert node.keys.stats()["size"] == 0
+	node.kill()
+
+def test_rekey_notice_signs_the_epoch(hub):
+	node = MeshNode([LocalProtocol(9191)], ID=7)
+	node.hub_key = hub.private_key.public_key()
+	notice = json.loads(rekey(hub.private_key, 5, 1).body)
+	notice["epoch"] = 2
+
+	node.keys.put(5, "cached")
+	with pytest.raises(Exception): node.process_rekey(Packet(0, -1, "rekey", json.dumps(notice)))
+	assert node.keys.stats()["size"] == 1
+	node.kill()
+
+def test_known_rekey_epoch_is_ignored(hub):
+	node = MeshNode([LocalProtocol(9191)], ID=7)
+	node.hub_key = hub.private_key.public_key()
+	node.certificates[5] = (2, "pem", "sig", 0.0)
+
+	node.keys.put(5, "cached")
+	node.process_rekey(rekey(hub.private_key, 5, 2))
+	assert node.keys.stats()["size"] == 1
+	node.kill()
+
+def test_rekey_raises_the_floor_without_a_certificate(hub):
+	node = MeshNode([LocalProtocol(9191)], ID=7)
+	node.hub_key = hub.private_key.public_key()
+	old = str(PrivateKey().public_key())
+	sig = base64.b64encode(hub.private_key.sign(MeshHub.certificate(5, 1, old))).decode()
+
+	node.process_rekey(rekey(hub.private_key, 5, 2))
+	assert node.floors[5] == 2
+	with node.mutex: assert not node.learn(5, 1, old, sig, 0.0)
+	assert 5 not in node.certificates
+	node.kill()
+
+def test_answer_for_another_node_is_rejected(hub):
+	node = MeshNode([LocalProtocol(9191)], ID=7)
+	other = str(PrivateKey().public_key())
+
+	def answer(dest, mtype, message, **kwargs):
+		rid = json.loads(message)["rid"]
+		node.pending.resolve(rid, Packet(0, 7, "answer", json.dumps({"id" : 6, "pem" : other, "rid" : rid})))
+	node.node.send = answer
+
+	with pytest.raises(Exception): node.request_from(0, 5, 1.0)
+	assert node.keys.stats()["size"] == 0
+	node.kill()
@@ -0,0 +1,277 @@
+import pytest
+from wavenetcore.WaveNetPacketeering import *
+
+def test_packets_get_distinct_message_ids():
+	pkt1 = Packet(src=1, dest=2, mtype="msg", body="hello")
+	pkt2 = Packet(src=1, dest=2, mtype="msg", body="hello")
+
+	assert pkt1.mid != pkt2.mid
+	assert pkt1 != pkt2
+
+def test_reconstruct_keeps_message_id():
+	pkt = Packet(src=1, dest=2, mtype="msg", body="hello")
+	received = reconstruct_packet(pkt.form())
+
+	assert received.mid == pkt.mid
+	assert received == pkt
+	assert hash(received) == hash(pkt)
+
+def test_reconstruct_rejects_missing_message_id():
+	data = json.dumps({"enc" : False, "src" : 1, "dest" : 2, "mtype" : "msg", "body" : "", "timestamp" : ""})
+
+	assert reconstruct_packet(data).is_null()
+
+def test_secret_packet_shares_message_id():
+	private_key = PrivateKey()
+	pkt = Packet(src=1, dest=2, mtype="msg", body="hello")
+	secret = encrypt_packet(pkt, private_key.public_key())
+
+	assert type(secret) == SecretPacket
+	assert secret.mid == pkt.mid
+	assert reconstruct_packet(secret.form()) == secret
+	assert decrypt_packet(secret, private_key) == pkt
+
+def test_hop_decrements_limit_and_sets_via():
+	pkt = Packet(src=1, dest=2, mtype="msg", body="hello")
+	forwarded = pkt.hop("9001")
+
+	assert forwarded == pkt
+	assert forwarded.hops == HOP_LIMIT - 1
+	assert forwarded.via == "9001"
+	assert reconstruct_packet(forwarded.form()).hops == HOP_LIMIT - 1
+
+def test_secret_packet_carries_dest():
+	private_key = PrivateKey()
+	pkt = Packet(src=1, dest=2, mtype="msg", body="hello")
+	secret = encrypt_packet(pkt, private_key.public_key())
+
+	assert secret.dest == 2
+	assert reconstruct_packet(secret.form()).dest == 2
+	assert secret.hop("9001").dest == 2
+
+def test_relay_forwards_ciphertext_without_decrypting():
+	from wavenetcore.WaveNetNode import Node, NodeInfo
+
+	class CountingKey:
+		def __init__(self, key):
+			self.key = key
+			self.calls = 0
+
+		def decrypt(self, data):
+			self.calls += 1
+			return self.key.decrypt(data)
+
+	recipient = PrivateKey()
+	relay_key = CountingKey(PrivateKey())
+	delivered = []
+	relay = Node(NodeInfo(3, relay_key), [], lambda packet: delivered.append(packet), routing=False)
+
+	relay.recv(encrypt_packet(Packet(src=1, dest=2, mtype="msg", body="hello"), recipient.public_key()))
+	assert relay_key.calls == 0
+	assert relay.stats()["relayed"] == 1
+
+	relay.recv(encrypt_packet(Packet(src=1, dest=3, mtype="msg", body="hello"), PrivateKey().public_key()))
+	relay.recv(encrypt_packet(Packet(src=1, dest=3, mtype="msg", body="mine"), relay_key.key.public_key()))
+	assert relay_key.calls == 2
+	assert [packet.body for packet in delivered] == ["mine"]
+
+def test_batch_round_trip():
+	private_key = PrivateKey()
+	packets = [Packet(1, 2, "msg", "a", via="9000"), encrypt_packet(Packet(1, 2, "msg", "b"), private_key.public_key())]
+	received = reconstruct_packet(BatchPacket(packets).form())
+
+	assert type(received) == BatchPacket
+	assert received.via == "9000"
+	assert [type(packet) for packet in received.packets] == [Packet, SecretPacket]
+	assert [packet.mid for packet in received.packets] == [packet.mid for packet in packets]
+
+def test_binary_round_trip():
+	pkt = Packet(src=(1 << 64) - 1, dest=-1, mtype="msg", body="héllo", via="9000")
+	data = pkt.encode()
+	received = reconstruct_packet(data)
+
+	assert is_binary(data)
+	assert type(received) == Packet
+	assert (received.src, received.dest, received.mtype, received.body) == (pkt.src, pkt.dest, pkt.mtype, pkt.body)
+	assert (received.timestamp, received.mid, received.hops, received.via) == (pkt.timestamp, pkt.mid, pkt.hops, pkt.via)
+	assert len(data) < len(pkt.form())
+
+def test_binary_secret_and_batch_round_trip():
+	private_key = PrivateKey()
+	secret = encrypt_packet(Packet(1, 2, "msg", "b"), private_key.public_key()).hop("9001")
+	received = reconstruct_packet(secret.encode())
+
+	assert type(received) == SecretPacket
+	assert (received.meta, received.body, received.sid, received.dest, received.hops, received.via) == (secret.meta, secret.body, secret.sid, 2, HOP_LIMIT - 1, "9001")
+	assert decrypt_packet(received, private_key).body == "b"
+
+	batch = reconstruct_packet(BatchPacket([Packet(1, 2, "msg", "a", via="9000"), secret]).encode())
+	assert type(batch) == BatchPacket
+	assert [type(packet) for packet in batch.packets] == [Packet, SecretPacket]
+
+def test_json_still_accepted_as_bytes():
+	pkt = Packet(src=1, dest=2, mtype="msg", body="hello")
+
+	assert reconstruct_packet(pkt.form().encode()) == pkt
+
+def test_binary_rejects_bad_frames():
+	data = Packet(src=1, dest=2, mtype="msg", body="hello").encode()
+
+	assert reconstruct_packet(data[:-1]).is_null()
+	assert reconstruct_packet(data + b"x").is_null()
+	assert reconstruct_packet(bytes([WIRE_MAGIC | (WIRE_VERSION + 1)]) + data[1:]).is_null()
+
+def test_bytes_body_round_trip():
+	body = bytes(range(256))
+	pkt = Packet(src=1, dest=2, mtype="data", body=memoryview(body))
+	data = pkt.encode()
+
+	assert type(pkt.body) == bytes
+	assert reconstruct_packet(data).body == body
+	assert reconstruct_packet(pkt.form()).body == body
+	assert reconstruct_packet(Packet(1, 2, "data", "text").encode()).body == "text"
+	assert len(data) < len(body) + 96
+
+def test_encrypted_bytes_carry_about_one_times_the_payload():
+	private_key = PrivateKey()
+	body = bytes(4096)
+	secret = encrypt_packet(Packet(src=1, dest=2, mtype="data", body=body), private_key.public_key())
+
+	assert len(secret.encode()) < len(body) + 512
+	assert decrypt_packet(reconstruct_packet(secret.encode()), private_key).body == body
+
+def test_decrypts_legacy_json_meta():
+	private_key = PrivateKey()
+	pkt = Packet(src=1, dest=2, mtype="msg", body="hello")
+	key = AES_create_key()
+	nonce, body = AES_encrypt(key, pkt.form())
+	meta = private_key.public_key().encrypt(json.dumps({
+		"decrypted" : True,
+		"key" : base64.b64encode(key).decode(),
+		"nonce" : base64.b64encode(nonce).decode(),
+		}).encode())
+	legacy = json.dumps({"enc" : True, "meta" : base64.b64encode(meta).decode(), "body" : base64.b64encode(body).decode(), "mid" : pkt.mid, "hops" : HOP_LIMIT, "via" : "", "sid" : "", "dest" : 2})
+
+	assert decrypt_packet(reconstruct_packet(legacy), private_key).body == "hello"
+
+def test_packets_are_immutable_and_cache_their_encoding():
+	pkt = Packet(src=1, dest=2, mtype="msg", body="hello")
+
+	with pytest.raises(Exception): pkt.body = "changed"
+	with pytest.raises(Exception): pkt.extra = 1
+	assert pkt.encode() is pkt.encode()
+	assert pkt.form() is pkt.form()
+	assert type(pkt.timestamp) == int
+	assert Packet(1, 2, "msg", "later").timestamp >= pkt.timestamp
+
+def test_relay_reuses_the_received_encoding():
+	class CountingCodec(LinkCodec):
+		def __init__(self):
+			super().__init__()
+			self.calls = 0
+
+		def compress(self, data):
+			self.calls += 1
+			return super().compress(data)
+
+	body = "relay me " * 64
+	codec = CountingCodec()
+	received = reconstruct_packet(Packet(1, 2, "msg", body).hop("9000", codec).encode())
+	assert codec.calls == 1
+
+	forwarded = received.hop("9001", codec)
+	data = forwarded.encode()
+	assert codec.calls == 1
+	assert len(data) < len(body)
+	again = reconstruct_packet(data)
+	assert (again.body, again.via, again.hops, again.timestamp) == (body, "9001", HOP_LIMIT - 2, received.timestamp)
+
+	private_key = PrivateKey()
+	secret = reconstruct_packet(encrypt_packet(Packet(1, 2, "msg", "hi"), private_key.public_key()).encode())
+	relayed = reconstruct_packet(secret.hop("9002").encode())
+	assert (relayed.via, relayed.hops) == ("9002", HOP_LIMIT - 1)
+	assert decrypt_packet(relayed, private_key).body == "hi"
+
+def test_legacy_secret_without_dest_is_accepted():
+	secret = SecretPacket(b"meta", b"body", hops=HOP_LIMIT)
+	legacy = json.dumps({"enc" : True, "meta" : base64.b64encode(b"meta").decode(), "body" : base64.b64encode(b"body").decode(), "mid" : secret.mid, "hops" : HOP_LIMIT, "via" : "", "sid" : ""})
+	parsed = reconstruct_packet(legacy)
+
+	assert type(parsed) == SecretPacket
+	assert parsed.dest == -1 and parsed.mid == secret.mid
+
+def test_legacy_json_timestamp_is_accepted():
+	pkt = Packet(src=1, dest=2, mtype="msg", body="hello")
+	legacy = json.loads(pkt.form())
+	legacy["timestamp"] = "2024-01-01T00:00:00+00:00"
+
+	assert reconstruct_packet(json.dumps(legacy)).timestamp == 0
+
+def test_relay_parses_only_the_header(monkeypatch):
+	import wavenetcore.WaveNetCompression as compression
+	from wavenetcore.WaveNetNode import Node, NodeInfo
+
+	inflated = []
+	def counting_inflate(data, limit=MAX_INFLATED):
+		inflated.append(len(data))
+		return inflate(data, limit)
+	monkeypatch.setattr(compression, "inflate", counting_inflate)
+
+	delivered, forwarded = [], []
+	relay = Node(NodeInfo(3, None), [], lambda packet: delivered.append(packet), routing=False)
+	relay.prop = lambda packet, exclude=None: forwarded.append(packet)
+	body = "cut through " * 4096
+	relay.recv(reconstruct_packet(Packet(1, 2, "msg", body).hop("9000", LinkCodec()).encode()))
+	relay.recv(reconstruct_packet(Packet(1, 2, "msg", "bad").hop("9000").encode().replace(b"bad", b"\xff\xfe\xfd")))
+
+	assert inflated == []
+	assert len(forwarded) == 2
+	assert forwarded[0].size() < len(body)
+	assert reconstruct_packet(forwarded[0].hop("9001").encode()).body == body
+	assert inflated != []
+
+	relay.recv(reconstruct_packet(Packet(1, 3, "msg", "mine").encode()))
+	relay.recv(reconstruct_packet(Packet(1, 3, "msg", "bad").encode().replace(b"bad", b"\xff\xfe\xfd")))
+	assert [packet.body for packet in delivered] == ["mine"]
+
+def test_secret_relay_does_not_copy_the_ciphertext():
+	private_key = PrivateKey()
+	secret = reconstruct_packet(encrypt_packet(Packet(1, 2, "msg", "x" * 4096), private_key.public_key()).encode())
+	relayed = secret.hop("9001")
+
+	assert type(relayed._body) == memoryview
+	assert relayed.size() == len(secret.body)
+	assert decrypt_packet(reconstruct_packet(relayed.encode()), private_key).body == "x" * 4096
+
+def test_relay_inflates_for_links_without_compression():
+	body = "relay me " * 64
+	received = reconstruct_packet(Packet(1, 2, "msg", body).hop("9000", LinkCodec()).encode())
+	data = received.hop("9001").encode()
+
+	assert not data[2] & WIRE_ZLIB
+	assert reconstruct_packet(data).body == body
+	assert received.hop("9001", LinkCodec()).encode()[2] & WIRE_ZLIB
+
+def test_version_one_frames_are_still_decoded():
+	def v1(kind, mid, src, dest, fields, body):
+		parts = [WIRE_HEADER.pack(WIRE_MAGIC | 1, kind, 0, mid, src, dest, 7)]
+		for field in fields: parts += [WIRE_SHORT.pack(len(field.encode())), field.encode()]
+		return b"".join(parts + [WIRE_LONG.pack(len(body.encode())), body.encode()])
+
+	plain = v1(WIRE_PLAIN, 11, 1, 2, ("msg", "2024-01-01T00:00:00+00:00", "9000"), "hello")
+	private_key = PrivateKey()
+	key = AES_create_key()
+	nonce, cipher = AES_encrypt(key, Packet(1, 2, "msg", "secret").form())
+	meta = private_key.public_key().encrypt(json.dumps({
+		"decrypted" : True,
+		"key" : base64.b64encode(key).decode(),
+		"nonce" : base64.b64encode(nonce).decode(),
+		}).encode())
+	secret = v1(WIRE_SECRET, 12, 0, 2, (base64.b64encode(meta).decode(), "", "9000"), base64.b64encode(cipher).decode())
+	batch = bytes([WIRE_MAGIC | 1, WIRE_BATCH]) + WIRE_COUNT.pack(2)
+	for packet in (plain, secret): batch += WIRE_LONG.pack(len(packet)) + packet
+
+	first, second = reconstruct_packet(batch).packets
+	assert (first.mid, first.mtype, first.body, first.via, first.hops, first.timestamp) == (11, "msg", "hello", "9000", 7, 0)
+	assert (second.mid, second.dest) == (12, 2)
+	assert decrypt_packet(second, private_key).body == "secret"
@@ -0,0 +1,65 @@
+import pytest
+import json
+import concurrent.futures
+from wavenetcore.WaveNetMesh import PendingRequests
+from wavenetcore.WaveNetPacketeering import Packet
+
+class FakeClock:
+	def __init__(self):
+		self.now = 0.0
+
+	def __call__(self):
+		return self.now
+
+def reply(rid):
+	return Packet(2, 1, "pong", json.dumps({"rid" : rid}))
+
+def test_each_request_gets_its_own_answer():
+	pending = PendingRequests()
+	first_rid, first = pending.open()
+	second_rid, second = pending.open()
+	assert first_rid != second_rid
+
+	assert pending.resolve(second_rid, reply(second_rid))
+	assert second.result(timeout=0).body == json.dumps({"rid" : second_rid})
+	assert not first.done()
+
+	assert pending.resolve(first_rid, reply(first_rid))
+	assert PendingRequests.rid_of(first.result(timeout=0)) == first_rid
+	assert len(pending) == 0
+
+def test_unknown_and_repeated_answers_are_ignored():
+	pending = PendingRequests()
+	rid, future = pending.open()
+
+	assert not pending.resolve(rid + 1, reply(rid + 1))
+	assert pending.resolve(rid, reply(rid))
+	assert not pending.resolve(rid, reply(rid))
+	assert pending.stats()["unmatched"] == 2
+
+def test_cancelled_requests_are_removed():
+	pending = PendingRequests()
+	rid, future = pending.open()
+
+	with pytest.raises(concurrent.futures.TimeoutError): future.result(timeout=0.01)
+	future.cancel()
+	assert len(pending) == 0
+	assert not pending.resolve(rid, reply(rid))
+
+def test_stale_requests_expire():
+	clock = FakeClock()
+	pending = PendingRequests(timeout=5.0, clock=clock)
+	_, stale = pending.open()
+
+	clock.now = 10.0
+	pending.open()
+
+	assert stale.cancelled()
+	assert len(pending) == 1
+	assert pending.stats()["expired"] == 1
+
+def test_rid_of_tolerates_other_bodies():
+	assert PendingRequests.rid_of(Packet(1, 2, "pong", "")) is None
+	assert PendingRequests.rid_of(Packet(1, 2, "pong", "[1, 2]")) is None
+	assert PendingRequests.rid_of(Packet(1, 2, "pong", json.dumps({"rid" : "x"}))) is None
+	assert PendingRequests.rid_of(Packet(1, 2, "pong", json.dumps({"rid" : 7}))) == 7
@@ -29,7 +29,7 @@ def test_link_sending_and_receiving_packet_local():
 	receiver = LocalProtocol(port=recv_port)
 	received = []
 
-	thread = receiver.listen(lambda packet: received.append(packet))
+	thread = receiver.listen(lambda packet, link: received.append(packet))
 
 	time.sleep(0.5)
 
@@ -52,7 +52,7 @@ def test_link_sending_and_receiving_packet_ip():
 	receiver = IPProtocol(ip=recv_ip, port=recv_port)
 	received = []
 
-	thread = receiver.listen(lambda packet: received.append(packet))
+	thread = receiver.listen(lambda packet, link: received.append(packet))
 
 	time.sleep(0.5)
 
@@ -68,3 +68,48 @@ def test_link_sending_and_receiving_packet_ip():
 	assert len(received) == 1
 	assert pkt == received[0]
 
+
+def test_listener_reports_arrival_link():
+	time.sleep(0.5)
+	recv_port = 9101
+	receiver = LocalProtocol(port=recv_port)
+	received = []
+
+	thread = receiver.listen(lambda packet, link: received.append((packet, link)))
+
+	time.sleep(0.5)
+
+	link = Link(receiver.public(), LocalProtocol())
+	pkt = Packet(src=1, dest=2, mtype="msg", body="hello")
+	link.send(pkt.hop("9001"))
+
+	time.sleep(0.5)
+	receiver.kill()
+
+	assert len(received) == 1
+	packet, arrival = received[0]
+	assert packet == pkt
+	assert packet.hops == pkt.hops - 1
+	assert arrival == Link("9001", LocalProtocol())
+
+def test_slow_packet_does_not_block_other_senders():
+	time.sleep(0.5)
+	recv_port = 9102
+	receiver = LocalProtocol(port=recv_port)
+	handled = []
+	start = time.monotonic()
+
+	def slow(packet, link):
+		time.sleep(1)
+		handled.append(time.monotonic() - start)
+
+	receiver.listen(slow)
+	time.sleep(0.5)
+	start = time.monotonic()
+	for i in range(3): Link(str(recv_port), LocalProtocol()).send(Packet(src=i, dest=2, mtype="msg", body="hello"))
+
+	time.sleep(2)
+	receiver.kill()
+
+	assert len(handled) == 3
+	assert max(handled) < 1.8
@@ -0,0 +1,51 @@
+import pytest
+from wavenetcore.WaveNetRouting import Router
+
+def exchange(routers, edges, rounds=8):
+	for _ in range(rounds):
+		for a, b in edges:
+			routers[b].update(a, routers[a].vector_for(b))
+			routers[a].update(b, routers[b].vector_for(a))
+
+def line(n):
+	routers = {i: Router(i) for i in range(n)}
+	edges = [(i, i + 1) for i in range(n - 1)]
+	for a, b in edges:
+		routers[a].add_link(f"{a}->{b}", b)
+		routers[b].add_link(f"{b}->{a}", a)
+	exchange(routers, edges)
+	return routers, edges
+
+def test_line_converges_to_next_hops():
+	routers, _ = line(4)
+
+	assert routers[0].next_hop(3) == 1
+	assert routers[3].next_hop(0) == 2
+	assert routers[0].table[3] == (3, 1)
+	assert routers[1].links_to(2) == ["1->2"]
+
+def test_unknown_destination_has_no_route():
+	routers, _ = line(3)
+
+	assert routers[0].next_hop(42) is None
+
+def test_split_horizon_omits_routes_through_neighbor():
+	routers, _ = line(3)
+
+	assert 2 not in routers[1].vector_for(2)
+	assert routers[1].vector_for(0)[2] == 1
+
+def test_link_loss_withdraws_routes():
+	routers, edges = line(4)
+
+	assert routers[2].link_down("2->3")
+	exchange(routers, edges[:2])
+
+	assert routers[2].next_hop(3) is None
+	assert routers[0].next_hop(3) is None
+	assert routers[0].next_hop(2) == 1
+
+	assert routers[2].link_up("2->3")
+	exchange(routers, edges)
+
+	assert routers[0].next_hop(3) == 1
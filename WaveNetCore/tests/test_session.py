@@ -0,0 +1,162 @@
+import pytest
+from wavenetcore.WaveNetCrypto import PrivateKey
+from wavenetcore.WaveNetPacketeering import Packet, SecretPacket, encrypt_packet
+from wavenetcore.WaveNetSession import Session, SessionManager
+
+class FakeClock:
+	def __init__(self):
+		self.now = 0.0
+
+	def __call__(self):
+		return self.now
+
+@pytest.fixture(scope="module")
+def keys():
+	return PrivateKey(), PrivateKey()
+
+def handshake(keys, clock=None):
+	key_a, key_b = keys
+	public = {1: key_a.public_key(), 2: key_b.public_key()}
+	kwargs = {} if clock is None else {"clock": clock}
+	a = SessionManager(1, key_a, public.get, **kwargs)
+	b = SessionManager(2, key_b, public.get, **kwargs)
+	init, future = a.start(2, public[2])
+	ack = b.respond(1, init)
+	a.complete(2, ack)
+	return a, b, future.result(timeout=0)
+
+def test_handshake_agrees_on_a_key(keys):
+	a, b, session = handshake(keys)
+
+	packet = Packet(1, 2, "data", "hello")
+	secret = a.get(2).encrypt_packet(packet)
+	assert type(secret) == SecretPacket
+	assert secret.sid == session.sid
+	assert secret.mid == packet.mid
+
+	plain = b.decrypt_packet(secret)
+	assert plain.body == "hello" and plain.src == 1
+
+	answer = b.get(1).encrypt_packet(Packet(2, 1, "data", "bye"))
+	assert a.decrypt_packet(answer).body == "bye"
+
+def test_concurrent_starts_share_one_handshake(keys):
+	key_a, _ = keys
+	manager = SessionManager(1, key_a, lambda peer: None)
+
+	init, first = manager.start(2, None)
+	again, second = manager.start(2, None)
+
+	assert init is not None and again is None
+	assert first is second
+	assert manager.stats()["handshakes"] == 1
+
+def test_replayed_packets_are_rejected(keys):
+	a, b, _ = handshake(keys)
+
+	secret = a.get(2).encrypt_packet(Packet(1, 2, "data", "once"))
+	assert type(b.decrypt_packet(secret)) == Packet
+	assert type(b.decrypt_packet(secret)) == SecretPacket
+
+def test_reordered_packets_within_window_are_accepted(keys):
+	a, b, _ = handshake(keys)
+
+	session = a.get(2)
+	packets = [session.encrypt_packet(Packet(1, 2, "data", str(i))) for i in range(5)]
+	for secret in reversed(packets): assert type(b.decrypt_packet(secret)) == Packet
+
+def test_tampered_header_fails_authentication(keys):
+	a, b, _ = handshake(keys)
+
+	secret = a.get(2).encrypt_packet(Packet(1, 2, "data", "hello"))
+	forged = SecretPacket(secret.meta, secret.body, secret.mid + 1, secret.hops, sid=secret.sid)
+	assert type(b.decrypt_packet(forged)) == SecretPacket
+
+def test_forged_signature_is_rejected(keys):
+	key_a, key_b = keys
+	impostor = PrivateKey()
+	public = {1: key_a.public_key(), 2: key_b.public_key()}
+	a = SessionManager(1, impostor, public.get)
+	b = SessionManager(2, key_b, public.get)
+
+	init, _ = a.start(2, public[2])
+	with pytest.raises(Exception): b.respond(1, init)
+	assert b.get(1) is None
+
+def test_sessions_expire_and_old_ones_still_decrypt(keys):
+	clock = FakeClock()
+	a, b, old = handshake(keys, clock)
+	in_flight = old.encrypt_packet(Packet(1, 2, "data", "late"))
+
+	clock.now = Session.max_age
+	assert a.get(2) is None
+
+	init, future = a.start(2, keys[1].public_key())
+	a.complete(2, b.respond(1, init))
+	assert future.result(timeout=0).sid != old.sid
+	assert b.decrypt_packet(in_flight).body == "late"
+
+def test_replayed_session_init_is_rejected(keys):
+	key_a, key_b = keys
+	public = {1: key_a.public_key(), 2: key_b.public_key()}
+	a = SessionManager(1, key_a, public.get)
+	b = SessionManager(2, key_b, public.get)
+	init, future = a.start(2, public[2])
+	a.complete(2, b.respond(1, init))
+	live = b.get(1)
+
+	with pytest.raises(Exception): b.respond(1, init)
+	assert b.get(1) is live
+	assert b.decrypt_packet(a.get(2).encrypt_packet(Packet(1, 2, "data", "still"))).body == "still"
+
+def test_stale_session_init_is_rejected(keys):
+	key_a, key_b = keys
+	public = {1: key_a.public_key(), 2: key_b.public_key()}
+	a = SessionManager(1, key_a, public.get, wall=lambda: 1000.0)
+	b = SessionManager(2, key_b, public.get, wall=lambda: 1000.0 + SessionManager.replay_window + 1)
+
+	init, _ = a.start(2, public[2])
+	with pytest.raises(Exception): b.respond(1, init)
+	assert b.get(1) is None
+
+def test_session_packet_must_come_from_the_peer(keys):
+	a, b, _ = handshake(keys)
+
+	secret = a.get(2).encrypt_packet(Packet(3, 2, "data", "spoofed"))
+	assert type(b.decrypt_packet(secret)) == SecretPacket
+
+def test_rsa_packets_are_not_session_packets(keys):
+	key_a, _ = keys
+	secret = encrypt_packet(Packet(2, 1, "data", "hello"), key_a.public_key())
+	assert secret.sid == ""
+
+def test_handshake_completes_with_a_single_send_worker():
+	import time
+	from wavenetcore.WaveNetAdaptors import WaveNetBasicMeshHub, WaveNetBasicMeshNode
+	from wavenetcore.WaveNetForwarding import BoundedExecutor
+	from wavenetcore.WaveNetProtocols import LocalProtocol
+
+	ports = [9120, 9121, 9122]
+	protocols = [[LocalProtocol(port)] for port in ports]
+	hub = WaveNetBasicMeshHub(protocols[0])
+	nodes = [WaveNetBasicMeshNode(protocols[i], ID=i, executor=BoundedExecutor(workers=1)) for i in range(1, 3)]
+	hub.run()
+	for node in nodes: node.run()
+	try:
+		nodes[0].connect(0, protocols[1][0], str(ports[0]))
+		nodes[1].connect(1, protocols[2][0], str(ports[1]))
+		time.sleep(0.3)
+		for node in nodes: node.join()
+
+		start = time.monotonic()
+		nodes[0].send(2, "hello").result(timeout=10)
+		elapsed = time.monotonic() - start
+
+		assert nodes[1].recv(1, timeout=5.0) == (1, "hello")
+		assert elapsed < SessionManager.timeout
+		assert nodes[0].stats()["sessions"]["established"] == 1
+		assert nodes[0].stats()["sessions"]["failures"] == 0
+	finally:
+		hub.kill()
+		for node in nodes: node.kill()
+		time.sleep(1)
@@ -12,7 +12,7 @@ def manual_test_link_receiving_packet_sound():
 	receiver = SoundProtocol(mac=B)
 	received = []
 
-	thread = receiver.listen(lambda packet: received.append(packet))
+	thread = receiver.listen(lambda packet, link: received.append(packet))
 
 	time.sleep(60*4)
 
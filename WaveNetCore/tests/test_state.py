@@ -0,0 +1,109 @@
+import pytest
+import os
+import json
+import time
+from wavenetcore.WaveNetMesh import MeshHub, MeshNode
+from wavenetcore.WaveNetCrypto import PrivateKey
+from wavenetcore.WaveNetPacketeering import Packet
+from wavenetcore.WaveNetProtocols import LocalProtocol
+from wavenetcore.WaveNetState import NodeState
+
+def test_private_key_round_trip():
+	key = PrivateKey()
+	loaded = PrivateKey(pem=key.pem().encode())
+
+	assert str(loaded.public_key()) == str(key.public_key())
+
+def test_state_file_is_private_and_tolerates_garbage(tmp_path):
+	path = str(tmp_path / "node.json")
+	state = NodeState(path)
+	assert state.load() == {}
+
+	state.save({"id" : 5})
+	assert state.load() == {"id" : 5}
+	assert os.stat(path).st_mode & 0o077 == 0
+
+	with open(path, "w") as f: f.write("{not json")
+	assert state.load() == {}
+
+def test_node_keeps_its_identity(tmp_path):
+	path = str(tmp_path / "node.json")
+	node = MeshNode([LocalProtocol(9170)], encrypt=False, state=path)
+	node.hub_key = PrivateKey().public_key()
+	node.keys.put(5, PrivateKey().public_key())
+	node.save()
+	node.kill()
+
+	restarted = MeshNode([LocalProtocol(9170)], encrypt=False, state=path)
+	assert restarted.node.info.ID == node.node.info.ID
+	assert str(restarted.private_key.public_key()) == str(node.private_key.public_key())
+	assert str(restarted.hub_key) == str(node.hub_key)
+	assert str(restarted.keys.snapshot()[5]) == str(node.keys.snapshot()[5])
+	restarted.kill()
+
+def test_other_id_keeps_the_saved_identity(tmp_path):
+	path = str(tmp_path / "node.json")
+	node = MeshNode([LocalProtocol(9170)], ID=5, encrypt=False, state=path)
+	node.save()
+	node.kill()
+
+	with pytest.raises(Exception): MeshNode([LocalProtocol(9170)], ID=6, encrypt=False, state=path)
+	assert NodeState(path).load()["id"] == 5
+
+def test_hub_keeps_its_directory(tmp_path):
+	path = str(tmp_path / "hub.json")
+	hub = MeshHub([LocalProtocol(9171)], encrypt=False, state=path)
+	key = PrivateKey()
+	hub.process_join(Packet(5, 0, "join", json.dumps({"id" : 5, "pem" : str(key.public_key())})))
+	hub.kill()
+
+	restarted = MeshHub([LocalProtocol(9171)], encrypt=False, state=path)
+	assert str(restarted.private_key.public_key()) == str(hub.private_key.public_key())
+	assert str(restarted.nodes[5]) == str(key.public_key())
+	assert restarted.entries[5][3] == hub.entries[5][3]
+	restarted.process_join(Packet(5, 0, "join", json.dumps({"id" : 5, "pem" : str(key.public_key())})))
+	restarted.kill()
+
+def test_hub_saves_in_the_background(tmp_path, monkeypatch):
+	monkeypatch.setattr(MeshHub, "save_interval", 0.1)
+	path = str(tmp_path / "hub.json")
+	hub = MeshHub([LocalProtocol(9177)], encrypt=False, state=path)
+	pems = [str(PrivateKey().public_key()) for _ in range(20)]
+	writes = []
+	save = hub.state.save
+	hub.state.save = lambda data: writes.append(data) or save(data)
+	hub.listen()
+	for ID, pem in enumerate(pems, 5):
+		with hub.mutex: hub.process_join(Packet(ID, 0, "join", json.dumps({"id" : ID, "pem" : pem})))
+
+	time.sleep(0.5)
+	assert 1 <= len(writes) <= 3
+	assert len(NodeState(path).load()["entries"]) == 20
+	hub.kill()
+
+def test_restarted_node_reenters_without_join_handshake(tmp_path):
+	paths = [str(tmp_path / "hub.json"), str(tmp_path / "a.json"), str(tmp_path / "b.json")]
+	ports = [9172, 9173, 9174]
+
+	def start():
+		protocols = [LocalProtocol(port) for port in ports]
+		hub = MeshHub([protocols[0]], state=paths[0])
+		nodes = [MeshNode([protocols[i]], ID=i, sessions=False, state=paths[i]) for i in (1, 2)]
+		for node in [hub] + nodes: node.listen()
+		for i, node in enumerate(nodes, 1): node.connect(0, protocols[i], str(ports[0]))
+		time.sleep(0.5)
+		return hub, nodes
+
+	hub, nodes = start()
+	for node in nodes: node.join()
+	for node in [hub] + nodes: node.kill()
+	time.sleep(0.5)
+
+	hub, nodes = start()
+	start_join = time.monotonic()
+	for node in nodes: node.join()
+	assert time.monotonic() - start_join < 0.5
+	nodes[0].send_data(2, "after restart").result(10)
+	assert nodes[1].recv_data(1, timeout=10) == (1, "after restart")
+	for node in [hub] + nodes: node.kill()
+	time.sleep(0.5)
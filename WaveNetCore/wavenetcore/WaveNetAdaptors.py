@@ -1,25 +1,37 @@
 import wavenetcore.WaveNetMesh as mesh
 import wavenetcore.WaveNetProtocols as prot
+import wavenetcore.WaveNetForwarding as fwd
 
 class WaveNetBasicMeshHub(mesh.MeshHub):
 	"""
 	El adaptador del MeshHub.
 	"""
 
-	def __init__(self, protocols, encrypt=True):
+	def __init__(self, protocols, encrypt=True, executor=None, index=0, private_key=None, state=None, batching=False, compression=False):
 		"""
 		Constructor del adaptador del mesh hub.
 
 		@param protocols Los protocolos disponibles del mesh hub
 		@param encrypt Si se debería cifrar la comuniación
+		@param executor El executor acotado para los envíos (opcional)
+		@param index El número de réplica del hub
+		@param private_key La llave del directorio compartida por las réplicas (opcional)
+		@param state La ruta del archivo de estado del hub (opcional)
+		@param batching Si se deberían juntar en frames los paquetes hacia un mismo vecino
+		@param compression Si se debería acordar compresión con los vecinos
 		"""
 
 		assert type(protocols) == list
 		assert len(protocols) > 0
 		for protocol in protocols: assert isinstance(protocol, prot.Protocol)
 		assert type(encrypt) == bool
+		assert executor is None or isinstance(executor, fwd.BoundedExecutor)
+		assert type(index) == int and 0 <= index < mesh.HUB_COUNT
+		assert state is None or type(state) == str
+		assert type(batching) == bool
+		assert type(compression) == bool
 		self.is_alive = False
-		super().__init__(protocols, encrypt=encrypt)
+		super().__init__(protocols, encrypt=encrypt, executor=executor, index=index, private_key=private_key, state=state, batching=batching, compression=compression)
 
 	def my_id(self):
 		"""
@@ -28,7 +40,7 @@ class WaveNetBasicMeshHub(mesh.MeshHub):
 		@return El id del nodo
 		"""
 
-		return 0
+		return self.ID
 	
 	def run(self):
 		"""
@@ -65,13 +77,20 @@ class WaveNetBasicMeshNode(mesh.MeshNode):
 	Clase que maneja el adaptador del nodo mesh.
 	"""
 
-	def __init__(self, protocols, ID=None, encrypt=True):
+	def __init__(self, protocols, ID=None, encrypt=True, executor=None, sessions=True, inbox=None, gossip=False, state=None, batching=False, compression=False):
 		"""
 		Constructor del adaptador del mesh node.
 
 		@param protocols Los protocolos disponibles del mesh node
 		@param ID El identificador que se debería asociar al nodo
 		@param encrypt Si se debería cifrar la comuniación
+		@param executor El executor acotado para los envíos (opcional)
+		@param sessions Si se deberían negociar sesiones cifradas con los otros nodos
+		@param inbox Las colas de entrada de los mensajes (opcional)
+		@param gossip Si se deberían intercambiar con los vecinos las llaves certificadas por el hub
+		@param state La ruta del archivo de estado del nodo (opcional)
+		@param batching Si se deberían juntar en frames los paquetes hacia un mismo vecino
+		@param compression Si se debería acordar compresión con los vecinos
 		"""
 
 		assert ID is None or type(ID) == int
@@ -79,8 +98,15 @@ class WaveNetBasicMeshNode(mesh.MeshNode):
 		assert len(protocols) > 0
 		for protocol in protocols: assert isinstance(protocol, prot.Protocol)
 		assert type(encrypt) == bool
+		assert executor is None or isinstance(executor, fwd.BoundedExecutor)
+		assert type(sessions) == bool
+		assert inbox is None or isinstance(inbox, mesh.Inbox)
+		assert type(gossip) == bool
+		assert state is None or type(state) == str
+		assert type(batching) == bool
+		assert type(compression) == bool
 		self.is_alive = False
-		super().__init__(protocols, ID=ID, encrypt=encrypt)
+		super().__init__(protocols, ID=ID, encrypt=encrypt, executor=executor, sessions=sessions, inbox=inbox, gossip=gossip, state=state, batching=batching, compression=compression)
 
 	def ping(self, ID):
 		"""
@@ -131,13 +157,14 @@ class WaveNetBasicMeshNode(mesh.MeshNode):
 		Manda un mensaje.
 
 		@param dest El identificador del destinario
-		@param message El cuerpo del mensaje
+		@param message El cuerpo del mensaje (texto o bytes)
+		@return El Future del envío
 		"""
 
 		assert self.is_alive
 		assert type(dest) == int
-		assert type(message) == str
-		super().send_data(dest, message)
+		assert type(message) in (str, bytes, bytearray, memoryview)
+		return super().send_data(dest, message)
 	
 	def listen(self, timeout=None):
 		"""
@@ -166,6 +193,23 @@ class WaveNetBasicMeshNode(mesh.MeshNode):
 		assert timeout is None or type(timeout) is float
 		if timeout is None: timeout = 60.0
 		return super().recv_data(ID=ID, timeout=timeout)
+
+	def recv_many(self, ID=None, limit=64, timeout=None):
+		"""
+		Recibe de una vez varios mensajes en espera.
+
+		@param ID El ID de quien se esperan los mensajes (o None para cualquiera)
+		@param limit La cantidad máxima de mensajes
+		@param timeout El tiempo máximo de espera por el primer mensaje
+		@return La lista de tuplas (ID fuente, el cuerpo del mensaje)
+		"""
+
+		assert self.is_alive
+		assert ID is None or type(ID) == int
+		assert type(limit) == int and limit > 0
+		assert timeout is None or type(timeout) is float
+		if timeout is None: timeout = 60.0
+		return super().recv_many(ID=ID, limit=limit, timeout=timeout)
 	
 	def run(self):
 		"""
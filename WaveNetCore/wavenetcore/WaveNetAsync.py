@@ -0,0 +1,266 @@
+import asyncio
+import wavenetcore.WaveNetMesh as mesh
+import wavenetcore.WaveNetAdaptors as adaptors
+
+class AsyncInbox(mesh.Inbox):
+	"""
+	Colas de entrada que además despiertan a las corrutinas que esperan mensajes.
+
+	El thread de escucha guarda los mensajes como siempre y agenda en el event
+	loop un aviso; las corrutinas revisan las colas sin bloquear el loop.
+	"""
+
+	def __init__(self, *args, **kwargs):
+		"""
+		Constructor de la clase (recibe los mismos parámetros que Inbox).
+		"""
+
+		super().__init__(*args, **kwargs)
+		self.loop = None
+		self.changed = None
+
+	def bind(self):
+		"""
+		Asocia las colas al event loop actual (debe llamarse desde una corrutina).
+		"""
+
+		loop = asyncio.get_running_loop()
+		if self.loop is loop: return
+		self.changed = asyncio.Event()
+		self.loop = loop
+
+	def put(self, packet):
+		"""
+		Guarda un mensaje y avisa al event loop.
+
+		@param packet El paquete recibido
+		@return Si el mensaje fue guardado
+		"""
+
+		stored = super().put(packet)
+		loop = self.loop
+		if stored and loop is not None and not loop.is_closed():
+			loop.call_soon_threadsafe(self.changed.set)
+		return stored
+
+	async def wait_many(self, ID=None, limit=64, timeout=None):
+		"""
+		Espera (sin bloquear el event loop) a que haya mensajes y saca varios de una vez.
+
+		@param ID La identificación de la fuente (o None para cualquiera)
+		@param limit La cantidad máxima de mensajes a sacar
+		@param timeout El tiempo máximo de espera (None para esperar siempre)
+		@return La lista de paquetes (vacía si se acabó el tiempo)
+		"""
+
+		self.bind()
+		deadline = None if timeout is None else self.loop.time() + timeout
+		while True:
+			packets = self.get_many(ID, limit, 0)
+			if packets: return packets
+			self.changed.clear()
+			packets = self.get_many(ID, limit, 0)
+			if packets: return packets
+			remaining = None if deadline is None else deadline - self.loop.time()
+			if remaining is not None and remaining <= 0: return []
+			try:
+				await asyncio.wait_for(self.changed.wait(), remaining)
+			except asyncio.TimeoutError:
+				return []
+
+class AsyncMeshNode:
+	"""
+	Interfaz de asyncio de los nodos del mesh.
+
+	Los envíos se esperan como Futures del executor de envíos, los mensajes
+	entrantes se esperan sobre las colas de entrada y los pings sobre el
+	Future de su pong, por lo que ninguna corrutina ocupa un thread mientras
+	espera.
+	"""
+
+	def __init__(self, protocols, ID=None, encrypt=True, executor=None, sessions=True, inbox=None):
+		"""
+		Constructor de la clase (recibe los mismos parámetros que WaveNetBasicMeshNode).
+
+		@param protocols Los protocolos disponibles del mesh node
+		@param ID El identificador que se debería asociar al nodo
+		@param encrypt Si se debería cifrar la comuniación
+		@param executor El executor acotado para los envíos (opcional)
+		@param sessions Si se deberían negociar sesiones cifradas con los otros nodos
+		@param inbox Las colas de entrada de los mensajes (por defecto un AsyncInbox propio)
+		"""
+
+		assert inbox is None or isinstance(inbox, AsyncInbox)
+		self.inbox = inbox if inbox is not None else AsyncInbox()
+		self.node = adaptors.WaveNetBasicMeshNode(protocols, ID=ID, encrypt=encrypt, executor=executor, sessions=sessions, inbox=self.inbox)
+
+	def my_id(self):
+		"""
+		Devuelve el id del nodo.
+
+		@return El id del nodo
+		"""
+
+		return self.node.my_id()
+
+	def run(self):
+		"""
+		Inicializa el nodo.
+		"""
+
+		self.node.run()
+
+	def kill(self):
+		"""
+		Mata el nodo.
+		"""
+
+		self.node.kill()
+
+	def connect(self, ID, protocol, dest):
+		"""
+		Conecta el nodo con otro nodo en el mesh.
+
+		@param ID La identificación del otro nodo
+		@param protocol El protocolo utilizado para la conexión
+		@param dest El destinario en formato aceptado por el protocolo
+		"""
+
+		self.node.connect(ID, protocol, dest)
+
+	async def join(self):
+		"""
+		Une el nodo a la red mesh (en el executor por defecto del loop, ya que el join espera al hub).
+		"""
+
+		await asyncio.get_running_loop().run_in_executor(None, self.node.join)
+
+	async def send(self, dest, message):
+		"""
+		Manda un mensaje y espera a que salga del nodo.
+
+		@param dest El identificador del destinario
+		@param message El cuerpo del mensaje
+		"""
+
+		assert self.node.is_alive
+		await asyncio.wrap_future(self.node.send(dest, message))
+
+	async def recv(self, ID=None, timeout=None):
+		"""
+		Espera un mensaje.
+
+		@param ID El ID de quien se espera el mensaje (o None para cualquiera)
+		@param timeout El tiempo máximo de espera (None para esperar siempre)
+		@return La tupla de (ID fuente, el cuerpo del mensaje)
+		"""
+
+		assert self.node.is_alive
+		packets = await self.inbox.wait_many(ID, 1, timeout)
+		if not packets: raise asyncio.TimeoutError("Timeout")
+		return packets[0].src, packets[0].body
+
+	async def recv_many(self, ID=None, limit=64, timeout=None):
+		"""
+		Espera y recibe de una vez varios mensajes.
+
+		@param ID El ID de quien se esperan los mensajes (o None para cualquiera)
+		@param limit La cantidad máxima de mensajes
+		@param timeout El tiempo máximo de espera por el primer mensaje
+		@return La lista de tuplas (ID fuente, el cuerpo del mensaje), vacía si se acabó el tiempo
+		"""
+
+		assert self.node.is_alive
+		return [(packet.src, packet.body) for packet in await self.inbox.wait_many(ID, limit, timeout)]
+
+	def __aiter__(self):
+		"""
+		Permite iterar con async for sobre los mensajes entrantes.
+
+		@return El iterador
+		"""
+
+		return self
+
+	async def __anext__(self):
+		"""
+		Espera el siguiente mensaje entrante.
+
+		@return La tupla de (ID fuente, el cuerpo del mensaje)
+		"""
+
+		if not self.node.is_alive: raise StopAsyncIteration
+		return await self.recv()
+
+	async def ping(self, ID, timeout=None):
+		"""
+		Ejecuta un ping a un nodo.
+
+		@param ID Algún nodo
+		@param timeout El tiempo máximo de espera
+		@return Si el nodo respondió
+		"""
+
+		assert self.node.is_alive
+		if timeout is None: timeout = mesh.PacketWaiter.timeout
+		try:
+			packet = await asyncio.wait_for(asyncio.wrap_future(self.node.ping_future(ID)), timeout)
+		except asyncio.TimeoutError:
+			return False
+		return packet.src == ID
+
+class AsyncMeshHub:
+	"""
+	Interfaz de asyncio del mesh hub.
+	"""
+
+	def __init__(self, protocols, encrypt=True, executor=None):
+		"""
+		Constructor de la clase (recibe los mismos parámetros que WaveNetBasicMeshHub).
+
+		@param protocols Los protocolos disponibles del mesh hub
+		@param encrypt Si se debería cifrar la comuniación
+		@param executor El executor acotado para los envíos (opcional)
+		"""
+
+		self.hub = adaptors.WaveNetBasicMeshHub(protocols, encrypt=encrypt, executor=executor)
+
+	def my_id(self):
+		"""
+		Devuelve el id del hub.
+
+		@return El id del hub
+		"""
+
+		return self.hub.my_id()
+
+	def run(self):
+		"""
+		Inicializa el hub.
+		"""
+
+		self.hub.run()
+
+	def kill(self):
+		"""
+		Mata el hub.
+		"""
+
+		self.hub.kill()
+
+	async def ping(self, ID, timeout=None):
+		"""
+		Ejecuta un ping a un nodo.
+
+		@param ID Algún nodo
+		@param timeout El tiempo máximo de espera
+		@return Si el nodo respondió
+		"""
+
+		assert self.hub.is_alive
+		if timeout is None: timeout = mesh.PacketWaiter.timeout
+		try:
+			packet = await asyncio.wait_for(asyncio.wrap_future(self.hub.ping_future(ID)), timeout)
+		except asyncio.TimeoutError:
+			return False
+		return packet.src == ID
@@ -0,0 +1,259 @@
+from collections import deque
+from concurrent.futures import Future
+from threading import Lock
+import time
+
+class MessageCache:
+	"""
+	Clase que maneja la supresión de duplicados con memoria acotada.
+
+	Guarda las llaves de los mensajes vistos en un buffer circular junto a un
+	set. Las llaves se desalojan por capacidad (la más vieja primero) o por
+	tiempo de vida, por lo que la memoria usada no depende del tráfico total.
+	"""
+
+	def __init__(self, capacity=1 << 16, ttl=300.0, clock=time.monotonic):
+		"""
+		Constructor de la clase.
+
+		@param capacity La cantidad máxima de llaves recordadas
+		@param ttl El tiempo de vida de cada llave en segundos (o None para no expirar)
+		@param clock La función que devuelve el tiempo actual
+		"""
+
+		self.capacity = capacity
+		self.ttl = ttl
+		assert type(self.capacity) == int and self.capacity > 0
+		self.clock = clock
+		self.ring = deque()
+		self.keys = set()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def expire(self, now=None):
+		"""
+		Desaloja las llaves cuyo tiempo de vida ya pasó.
+
+		@param now El tiempo actual
+		"""
+
+		if self.ttl is None: return
+		if now is None: now = self.clock()
+		limit = now - self.ttl
+		while self.ring and self.ring[0][1] <= limit: self.evict()
+
+	def evict(self):
+		"""
+		Desaloja la llave más vieja.
+		"""
+
+		key, _ = self.ring.popleft()
+		self.keys.discard(key)
+		self.evictions += 1
+
+	def add(self, key):
+		"""
+		Registra una llave sin contarla como acierto o fallo.
+
+		@param key La llave del mensaje
+		"""
+
+		now = self.clock()
+		self.expire(now)
+		if key in self.keys: return
+		while len(self.ring) >= self.capacity: self.evict()
+		self.ring.append((key, now))
+		self.keys.add(key)
+
+	def check(self, key):
+		"""
+		Determina si una llave ya fue vista y la registra si no.
+
+		@param key La llave del mensaje
+		@return Si la llave ya había sido vista
+		"""
+
+		self.expire()
+		if key in self.keys:
+			self.hits += 1
+			return True
+		self.misses += 1
+		self.add(key)
+		return False
+
+	def __contains__(self, key):
+		"""
+		Determina si una llave sigue registrada.
+
+		@param key La llave del mensaje
+		@return Si la llave está registrada
+		"""
+
+		self.expire()
+		return key in self.keys
+
+	def __len__(self):
+		"""
+		Devuelve la cantidad de llaves registradas.
+
+		@return La cantidad de llaves
+		"""
+
+		return len(self.keys)
+
+	def stats(self):
+		"""
+		Devuelve los contadores del cache.
+
+		@return Un diccionario con los contadores
+		"""
+
+		return {
+			"size" : len(self.keys),
+			"capacity" : self.capacity,
+			"ttl" : self.ttl,
+			"hits" : self.hits,
+			"misses" : self.misses,
+			"evictions" : self.evictions,
+			}
+
+class KeyCache:
+	"""
+	Clase que maneja el cache de llaves públicas de otros nodos.
+
+	Las entradas expiran después de su tiempo de vida y se pueden invalidar
+	explícitamente. Si varios threads piden la misma llave a la vez, solo el
+	primero hace la consulta y el resto espera su resultado.
+	"""
+
+	def __init__(self, ttl=600.0, clock=time.monotonic):
+		"""
+		Constructor de la clase.
+
+		@param ttl El tiempo de vida de cada llave en segundos (o None para no expirar)
+		@param clock La función que devuelve el tiempo actual
+		"""
+
+		self.ttl = ttl
+		self.clock = clock
+		self.entries = dict()
+		self.inflight = dict()
+		self.versions = dict()
+		self.hits = 0
+		self.misses = 0
+		self.merged = 0
+		self.invalidations = 0
+		self.mutex = Lock()
+
+	def lookup(self, ID):
+		"""
+		Busca una llave vigente (se asume que el mutex está tomado).
+
+		@param ID La identificación del nodo
+		@return La llave o None si no hay una vigente
+		"""
+
+		if ID not in self.entries: return None
+		key, expires = self.entries[ID]
+		if expires is not None and expires <= self.clock():
+			self.entries.pop(ID)
+			return None
+		return key
+
+	def get(self, ID, fetch):
+		"""
+		Devuelve la llave de un nodo, consultándola si no está en el cache.
+
+		@param ID La identificación del nodo
+		@param fetch La función que consulta la llave de un ID
+		@return La llave pública
+		"""
+
+		with self.mutex:
+			key = self.lookup(ID)
+			if key is not None:
+				self.hits += 1
+				return key
+			if ID in self.inflight:
+				self.merged += 1
+				future = self.inflight[ID]
+				leader = False
+			else:
+				self.misses += 1
+				future = Future()
+				self.inflight[ID] = future
+				version = self.versions.get(ID, 0)
+				leader = True
+		if not leader: return future.result()
+		try:
+			key = fetch(ID)
+		except Exception as e:
+			with self.mutex: self.inflight.pop(ID, None)
+			future.set_exception(e)
+			raise
+		with self.mutex:
+			self.inflight.pop(ID, None)
+			if self.versions.get(ID, 0) == version: self.store(ID, key)
+		future.set_result(key)
+		return key
+
+	def store(self, ID, key):
+		"""
+		Guarda una llave (se asume que el mutex está tomado).
+
+		@param ID La identificación del nodo
+		@param key La llave pública
+		"""
+
+		expires = None if self.ttl is None else self.clock() + self.ttl
+		self.entries[ID] = (key, expires)
+
+	def put(self, ID, key):
+		"""
+		Guarda una llave conocida por otro medio.
+
+		@param ID La identificación del nodo
+		@param key La llave pública
+		"""
+
+		with self.mutex: self.store(ID, key)
+
+	def snapshot(self):
+		"""
+		Devuelve las llaves vigentes del cache.
+
+		@return Diccionario de identificación a llave
+		"""
+
+		with self.mutex:
+			return {ID: key for ID, key in ((ID, self.lookup(ID)) for ID in list(self.entries)) if key is not None}
+
+	def invalidate(self, ID):
+		"""
+		Descarta la llave de un nodo (incluyendo una consulta en curso).
+
+		@param ID La identificación del nodo
+		"""
+
+		with self.mutex:
+			self.versions[ID] = self.versions.get(ID, 0) + 1
+			if self.entries.pop(ID, None) is not None: self.invalidations += 1
+
+	def stats(self):
+		"""
+		Devuelve los contadores del cache.
+
+		@return Un diccionario con los contadores
+		"""
+
+		with self.mutex:
+			lookups = self.hits + self.misses + self.merged
+			return {
+				"size" : len(self.entries),
+				"hits" : self.hits,
+				"misses" : self.misses,
+				"merged" : self.merged,
+				"invalidations" : self.invalidations,
+				"hit_rate" : self.hits / lookups if lookups else 0.0,
+				}
@@ -0,0 +1,154 @@
+from threading import Lock
+import time
+import zlib
+
+CODEC = "zlib-1" # Nombre del único códec disponible (zlib con el diccionario de abajo)
+MAX_INFLATED = 16 << 20 # Bytes máximos que puede producir un cuerpo comprimido
+
+# Diccionario de zlib armado con los mensajes de control de WaveNet. Los
+# fragmentos más frecuentes van al final, donde zlib los alcanza con
+# distancias más cortas.
+DICTIONARY = "".join((
+	'{"type": "RESPONSE", "resource": "file_list", "body": {"files": []}}',
+	'{"type": "REQUEST", "resource": "file_transfer_init", "body": {"filename": ""}}',
+	'{"type": "REQUEST", "resource": "who_has", "body": {"filename": ""}}{"nodes": []}',
+	'{"type": "DATA", "resource": "file_chunk"}{"type": "DATA", "resource": "file_end"',
+	'{"payload": "{\\"digest\\": \\"", \\"entries\\": [], \\"want\\": []}", "sig": "',
+	'{"id": , "epoch": , "pem": , "sig": , "issued": , "load": }',
+	'{"sid": "", "eph": "", "sig": ""}{"fid": , "missing": []}',
+	'"-----BEGIN PUBLIC KEY-----\\nMIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEA',
+	'IDAQAB\\n-----END PUBLIC KEY-----\\n"',
+	'{"protocol": "SOUND", "dest": "", "compress": ["zlib-1"], "id": , "reply": true}',
+	'{"protocol": "IP", "dest": "{\\"ip\\": \\"\\", \\"port\\": }", "routes": {}}',
+	'{"protocol": "LOCAL", "dest": "", "routes": {"": 1, "": 2, "": 3}}',
+	'{"rid": , "pem": "", "error": ""}{"rid": }{"id": , "pem": "", "rid": }',
+	)).encode()
+
+def inflate(data, limit=MAX_INFLATED):
+	"""
+	Descomprime un cuerpo comprimido con el códec.
+
+	@param data Los bytes comprimidos
+	@param limit La cantidad máxima de bytes descomprimidos
+	@return Los bytes descomprimidos
+	"""
+
+	decompressor = zlib.decompressobj(wbits=-15, zdict=DICTIONARY)
+	result = decompressor.decompress(data, limit)
+	if decompressor.unconsumed_tail: raise Exception("Compressed body too large")
+	if not decompressor.eof: raise Exception("Truncated compressed body")
+	return result
+
+class InflateBudget:
+	"""
+	Clase que acota el total de bytes descomprimidos de un frame recibido.
+
+	Todos los cuerpos de un frame (incluidos los de un BatchPacket y los que
+	se descifran dentro de él) comparten el mismo presupuesto, por lo que un
+	frame no puede ocupar más memoria que total aunque lleve muchos cuerpos
+	que se expanden mucho.
+	"""
+
+	def __init__(self, total=MAX_INFLATED):
+		"""
+		Constructor de la clase.
+
+		@param total La cantidad máxima de bytes descomprimidos del frame
+		"""
+
+		self.remaining = min(total, MAX_INFLATED)
+		self.mutex = Lock()
+
+	def inflate(self, data):
+		"""
+		Descomprime un cuerpo del frame descontándolo del presupuesto.
+
+		@param data Los bytes comprimidos
+		@return Los bytes descomprimidos
+		"""
+
+		with self.mutex: limit = self.remaining
+		result = inflate(data, limit)
+		with self.mutex:
+			if len(result) > self.remaining: raise Exception("Frame inflates too much")
+			self.remaining -= len(result)
+		return result
+
+class LinkCodec:
+	"""
+	Clase que comprime los cuerpos enviados por una conexión y lleva sus estadísticas.
+
+	Un cuerpo solo se envía comprimido si se achica; cuando varios seguidos
+	no se achican (por ejemplo datos ya comprimidos) se intenta solo uno de
+	cada retry_every hasta que vuelva a servir.
+	"""
+
+	min_size = 64 # Los cuerpos más chicos no se comprimen
+	level = 6 # Nivel de compresión de zlib
+	max_misses = 8 # Intentos fallidos seguidos antes de espaciar los intentos
+	retry_every = 16 # Cada cuántos cuerpos se vuelve a intentar al estar espaciando
+
+	def __init__(self, name=CODEC):
+		"""
+		Constructor de la clase.
+
+		@param name El nombre del códec acordado con el vecino
+		"""
+
+		assert name == CODEC
+		self.name = name
+		self.attempts = 0
+		self.compressed = 0
+		self.skipped = 0
+		self.bytes_in = 0
+		self.bytes_out = 0
+		self.cpu = 0.0
+		self.misses = 0
+		self.mutex = Lock()
+
+	def compress(self, data):
+		"""
+		Comprime un cuerpo si vale la pena.
+
+		@param data Los bytes del cuerpo
+		@return Los bytes comprimidos o None si se debería enviar sin comprimir
+		"""
+
+		if len(data) < LinkCodec.min_size: return None
+		with self.mutex:
+			self.attempts += 1
+			if self.misses >= LinkCodec.max_misses and self.attempts % LinkCodec.retry_every != 0:
+				self.skipped += 1
+				return None
+		start = time.thread_time()
+		compressor = zlib.compressobj(LinkCodec.level, zlib.DEFLATED, -15, zdict=DICTIONARY)
+		result = compressor.compress(data) + compressor.flush()
+		elapsed = time.thread_time() - start
+		with self.mutex:
+			self.cpu += elapsed
+			if len(result) >= len(data):
+				self.misses += 1
+				self.skipped += 1
+				return None
+			self.misses = 0
+			self.compressed += 1
+			self.bytes_in += len(data)
+			self.bytes_out += len(result)
+		return result
+
+	def stats(self):
+		"""
+		Devuelve las estadísticas de compresión de la conexión.
+
+		@return Un diccionario con las estadísticas
+		"""
+
+		with self.mutex:
+			return {
+				"codec" : self.name,
+				"compressed" : self.compressed,
+				"skipped" : self.skipped,
+				"ratio" : self.bytes_out / self.bytes_in if self.bytes_in else 1.0,
+				"saved" : self.bytes_in - self.bytes_out,
+				"cpu" : self.cpu,
+				}
@@ -1,5 +1,8 @@
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import x25519
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
@@ -52,16 +55,55 @@ class PublicKey:
 					)
 				)
 
+	def verify(self, signature, data):
+		"""
+		Verifica una firma hecha con la llave privada correspondiente.
+
+		@param signature La firma
+		@param data La información firmada
+		@return Si la firma es válida
+		"""
+		try:
+			self.public_key.verify(
+					signature,
+					data,
+					padding.PSS(
+						mgf=padding.MGF1(hashes.SHA256()),
+						salt_length=padding.PSS.MAX_LENGTH
+						),
+					hashes.SHA256()
+					)
+			return True
+		except InvalidSignature:
+			return False
+
 class PrivateKey:
 	"""
 	Clase que maneja la llave privada y funcionalidades asociadas.
 	"""
 
-	def __init__(self):
+	def __init__(self, pem=None):
 		"""
 		Constructor de la llave privada.
+
+		@param pem El pem fuente (por defecto se genera una llave nueva)
+		"""
+		if pem is not None:
+			self.private_key = serialization.load_pem_private_key(pem, password=None)
+		else:
+			self.private_key = rsa.generate_private_key(65537, 2048)
+
+	def pem(self):
+		"""
+		Serializa la llave privada (sin cifrar, para guardarla en disco).
+
+		@return La llave en formato PEM
 		"""
-		self.private_key = rsa.generate_private_key(65537, 2048)
+		return self.private_key.private_bytes(
+				encoding=serialization.Encoding.PEM,
+				format=serialization.PrivateFormat.PKCS8,
+				encryption_algorithm=serialization.NoEncryption()
+				).decode()
 
 	def public_key(self):
 		"""
@@ -87,44 +129,85 @@ class PrivateKey:
 					)
 				)
 
+	def sign(self, data):
+		"""
+		Firma información utilizando la llave privada.
+
+		@param data La información a firmar
+		@return La firma
+		"""
+		return self.private_key.sign(
+				data,
+				padding.PSS(
+					mgf=padding.MGF1(hashes.SHA256()),
+					salt_length=padding.PSS.MAX_LENGTH
+					),
+				hashes.SHA256()
+				)
+
+class EphemeralKey:
+	"""
+	Clase que maneja una llave X25519 efímera para acordar llaves de sesión.
+	"""
+
+	def __init__(self):
+		"""
+		Constructor de la llave efímera.
+		"""
+		self.private_key = x25519.X25519PrivateKey.generate()
+
+	def public64(self):
+		"""
+		Genera la versión pública de la llave.
+
+		@return La llave pública en base 64
+		"""
+		data = self.private_key.public_key().public_bytes(
+				encoding=serialization.Encoding.Raw,
+				format=serialization.PublicFormat.Raw
+				)
+		return base64.b64encode(data).decode()
+
+	def derive(self, peer64, salt, info):
+		"""
+		Deriva una llave AES compartida con otro nodo.
+
+		@param peer64 La llave pública efímera del otro nodo en base 64
+		@param salt La sal de la derivación
+		@param info El contexto de la derivación
+		@return La llave AES en bytes
+		"""
+		peer = x25519.X25519PublicKey.from_public_bytes(base64.b64decode(peer64.encode()))
+		shared = self.private_key.exchange(peer)
+		return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=info).derive(shared)
+
 def AES_create_key():
 	"""
 	Genera una llave AES.
 
-	@return Una llave AES en base 64
+	@return Una llave AES en bytes
 	"""
-	key = AESGCM.generate_key(bit_length=256)
-	key64 = base64.b64encode(key).decode()
-	return key64
+	return AESGCM.generate_key(bit_length=256)
 
-def AES_encrypt(key64, data):
+def AES_encrypt(key, data):
 	"""
-	Cifra información con una llave AES en base 64.
+	Cifra información con una llave AES.
 
-	@param key64 La llave AES en base 64
-	@param data La información a cifrar
-	@return El nonce asociado y la información cifrada, todo en base 64
+	@param key La llave AES en bytes
+	@param data La información a cifrar (bytes o texto)
+	@return El nonce asociado y la información cifrada, ambos en bytes
 	"""
-	key = base64.b64decode(key64.encode())
-	aesgcm = AESGCM(key)
+	if type(data) == str: data = data.encode()
 	nonce = os.urandom(12)
-	body = aesgcm.encrypt(nonce, data.encode(), None)
-	nonce64 = base64.b64encode(nonce).decode()
-	body64 = base64.b64encode(body).decode()
-	return nonce64, body64
+	return nonce, AESGCM(key).encrypt(nonce, data, None)
 
-def AES_decrypt(key64, nonce64, body64):
+def AES_decrypt(key, nonce, body):
 	"""
 	Decifra información con AES.
 
-	@param key64 La llave AES en base 64
-	@param nonce64 El nonce asociado en base 64
-	@param body64 La información cifrada en base 64
-	@return La información decifrada
+	@param key La llave AES en bytes
+	@param nonce El nonce asociado en bytes
+	@param body La información cifrada en bytes
+	@return La información decifrada en bytes
 	"""
-	key = base64.b64decode(key64.encode())
-	aesgcm = AESGCM(key)
-	nonce = base64.b64decode(nonce64.encode())
-	body = base64.b64decode(body64.encode())
-	data = aesgcm.decrypt(nonce, body, None)
-	return data.decode()
+	return AESGCM(key).decrypt(nonce, body, None)
@@ -0,0 +1,349 @@
+from enum import Enum
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Thread, Lock, Condition, BoundedSemaphore
+from wavenetcore.WaveNetPacketeering import BatchPacket
+import time
+import logging
+
+class DropPolicy(Enum):
+	"""
+	Enum que maneja qué hacer cuando la cola de un vecino está llena.
+	"""
+
+	DROP_NEW = 1 # Descarta el paquete que se intenta encolar
+	DROP_OLD = 2 # Descarta el paquete más viejo de la cola
+	BLOCK = 3 # Bloquea al productor hasta que haya espacio (o hasta el timeout)
+
+class OutboundQueue:
+	"""
+	Clase que maneja la cola de salida hacia un vecino.
+	"""
+
+	def __init__(self):
+		"""
+		Constructor de la clase.
+		"""
+
+		self.packets = deque()
+		self.active = False
+		self.enqueued = 0
+		self.sent = 0
+		self.dropped = 0
+		self.failed = 0
+		self.max_depth = 0
+		self.frames = 0
+
+	def stats(self):
+		"""
+		Devuelve los contadores de la cola.
+
+		@return Un diccionario con los contadores
+		"""
+
+		return {
+			"depth" : len(self.packets),
+			"max_depth" : self.max_depth,
+			"enqueued" : self.enqueued,
+			"sent" : self.sent,
+			"dropped" : self.dropped,
+			"failed" : self.failed,
+			"frames" : self.frames,
+			}
+
+class Forwarder:
+	"""
+	Clase que maneja la etapa de reenvío de paquetes a los vecinos.
+
+	Cada vecino tiene su propia cola de salida y a lo sumo un worker del pool
+	la vacía a la vez, por lo que el orden por vecino se mantiene y un vecino
+	lento o muerto solo retrasa su propia cola.
+
+	Con batching, el worker espera hasta batch_window del protocolo de la
+	conexión (o hasta juntar batch_bytes) y manda los paquetes acumulados en
+	un solo frame, pagando una sola conexión por todos.
+	"""
+
+	overhead = 256 # Bytes estimados de encabezado por paquete al armar un frame
+
+	def __init__(self, workers=8, queue_size=256, policy=DropPolicy.DROP_OLD, block_timeout=1.0, on_result=None, batching=False):
+		"""
+		Constructor de la clase.
+
+		@param workers La cantidad máxima de threads enviando a la vez
+		@param queue_size La cantidad máxima de paquetes en espera por vecino
+		@param policy La política a aplicar cuando una cola está llena
+		@param block_timeout El tiempo máximo de espera con la política BLOCK
+		@param on_result Función opcional llamada con (link, paquete o frame, error, duración) después de cada envío
+		@param batching Si se deberían juntar en un frame los paquetes hacia un mismo vecino
+		"""
+
+		assert type(workers) == int and workers > 0
+		assert type(queue_size) == int and queue_size > 0
+		assert isinstance(policy, DropPolicy)
+		self.workers = workers
+		self.queue_size = queue_size
+		self.policy = policy
+		self.block_timeout = block_timeout
+		self.on_result = on_result
+		self.batching = batching
+		self.queues = dict()
+		self.executor = None
+		self.mutex = Lock()
+		self.space = Condition(self.mutex)
+		self.arrived = Condition(self.mutex)
+
+	def submit(self, link, packet):
+		"""
+		Encola un paquete hacia un vecino.
+
+		@param link La conexión al vecino
+		@param packet El paquete a enviar
+		@return Si el paquete fue encolado
+		"""
+
+		with self.mutex:
+			if link not in self.queues: self.queues[link] = OutboundQueue()
+			queue = self.queues[link]
+			if len(queue.packets) >= self.queue_size:
+				if self.policy == DropPolicy.DROP_NEW:
+					queue.dropped += 1
+					return False
+				if self.policy == DropPolicy.DROP_OLD:
+					queue.packets.popleft()
+					queue.dropped += 1
+				if self.policy == DropPolicy.BLOCK:
+					waited = self.space.wait_for(lambda: len(queue.packets) < self.queue_size, self.block_timeout)
+					if not waited:
+						queue.dropped += 1
+						return False
+			queue.packets.append(packet)
+			queue.enqueued += 1
+			queue.max_depth = max(queue.max_depth, len(queue.packets))
+			if queue.active:
+				if self.batching: self.arrived.notify_all()
+				return True
+			queue.active = True
+			if self.executor is None:
+				self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="wavenet-forward")
+			try:
+				self.executor.submit(self.drain, link, queue)
+			except RuntimeError:
+				queue.active = False
+				queue.dropped += len(queue.packets)
+				queue.packets.clear()
+				return False
+		return True
+
+	def drain(self, link, queue):
+		"""
+		Vacía la cola de un vecino enviando sus paquetes en orden.
+
+		@param link La conexión al vecino
+		@param queue La cola del vecino
+		"""
+
+		while True:
+			with self.mutex:
+				if not queue.packets:
+					queue.active = False
+					return
+				if self.batching: packets = self.collect(link, queue)
+				else: packets = [queue.packets.popleft()]
+				self.space.notify_all()
+				if not packets:
+					queue.active = False
+					return
+			packet = packets[0] if len(packets) == 1 else BatchPacket(packets)
+			error = None
+			start = time.monotonic()
+			try:
+				result = link.send(packet)
+				if isinstance(result, Thread): result.join()
+			except Exception as e:
+				error = e
+				logging.info(f"Couldn't forward a packet through {link}: {str(e)}")
+			elapsed = time.monotonic() - start
+			with self.mutex:
+				queue.frames += 1
+				if error is None: queue.sent += len(packets)
+				else: queue.failed += len(packets)
+			if self.on_result is None: continue
+			try:
+				self.on_result(link, packet, error, elapsed)
+			except Exception as e:
+				logging.error(f"Couldn't record the result of a send through {link}: {str(e)}")
+
+	def collect(self, link, queue):
+		"""
+		Junta los paquetes del siguiente frame hacia un vecino (se asume que el mutex está tomado).
+
+		Espera a lo sumo batch_window del protocolo de la conexión a que
+		lleguen más paquetes, y corta el frame al llegar a batch_bytes.
+
+		@param link La conexión al vecino
+		@param queue La cola del vecino
+		@return La lista de paquetes del frame (vacía si se detuvo el forwarder mientras esperaba)
+		"""
+
+		budget = link.protocol.batch_bytes
+		def pending():
+			return sum(packet.size() + Forwarder.overhead for packet in queue.packets)
+		if link.protocol.batch_window > 0 and pending() < budget:
+			self.arrived.wait_for(lambda: pending() >= budget or self.executor is None, link.protocol.batch_window)
+		if not queue.packets: return []
+		packets = [queue.packets.popleft()]
+		size = packets[0].size() + Forwarder.overhead
+		while queue.packets and size + queue.packets[0].size() + Forwarder.overhead <= budget:
+			packet = queue.packets.popleft()
+			size += packet.size() + Forwarder.overhead
+			packets.append(packet)
+		return packets
+
+	def stats(self):
+		"""
+		Devuelve las métricas de las colas de salida.
+
+		@return Un diccionario con las métricas de cada vecino
+		"""
+
+		with self.mutex:
+			return {str(link): queue.stats() for link, queue in self.queues.items()}
+
+	def shutdown(self):
+		"""
+		Detiene el pool de workers y descarta los paquetes pendientes.
+		"""
+
+		with self.mutex:
+			executor = self.executor
+			self.executor = None
+			for queue in self.queues.values():
+				queue.dropped += len(queue.packets)
+				queue.packets.clear()
+				queue.active = False
+			self.space.notify_all()
+			self.arrived.notify_all()
+		if executor is not None: executor.shutdown(wait=False, cancel_futures=True)
+
+class ExecutorFull(Exception):
+	"""
+	Excepción que indica que el executor no aceptó más trabajo.
+	"""
+
+	pass
+
+class BoundedExecutor:
+	"""
+	Clase que maneja un pool de threads con una cantidad acotada de trabajos pendientes.
+
+	Cada trabajo devuelve un Future. Cuando el pool está saturado, la política
+	DROP_NEW rechaza el trabajo de inmediato y BLOCK espera a que se libere un
+	espacio (hasta el timeout); en ambos casos el Future rechazado termina con
+	ExecutorFull en vez de lanzar la excepción en el thread que envía.
+	"""
+
+	def __init__(self, workers=8, queue_size=1024, policy=DropPolicy.BLOCK, block_timeout=5.0, name="wavenet-send"):
+		"""
+		Constructor de la clase.
+
+		@param workers La cantidad máxima de threads trabajando a la vez
+		@param queue_size La cantidad máxima de trabajos en espera
+		@param policy DropPolicy.DROP_NEW o DropPolicy.BLOCK
+		@param block_timeout El tiempo máximo de espera con la política BLOCK (None para esperar siempre)
+		@param name El prefijo de los nombres de los threads
+		"""
+
+		assert type(workers) == int and workers > 0
+		assert type(queue_size) == int and queue_size >= 0
+		assert policy in (DropPolicy.DROP_NEW, DropPolicy.BLOCK)
+		self.workers = workers
+		self.queue_size = queue_size
+		self.policy = policy
+		self.block_timeout = block_timeout
+		self.name = name
+		self.slots = BoundedSemaphore(workers + queue_size)
+		self.executor = None
+		self.pending = 0
+		self.completed = 0
+		self.failed = 0
+		self.rejected = 0
+		self.mutex = Lock()
+
+	def submit(self, func, *args):
+		"""
+		Agenda un trabajo.
+
+		@param func La función a ejecutar
+		@param args Los argumentos de la función
+		@return El Future asociado al trabajo
+		"""
+
+		if self.policy == DropPolicy.BLOCK: acquired = self.slots.acquire(timeout=self.block_timeout)
+		else: acquired = self.slots.acquire(blocking=False)
+		if not acquired: return self.reject()
+		with self.mutex:
+			if self.executor is None:
+				self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+			try:
+				future = self.executor.submit(func, *args)
+			except RuntimeError:
+				self.slots.release()
+				return self.reject()
+			self.pending += 1
+		future.add_done_callback(self.done)
+		return future
+
+	def reject(self):
+		"""
+		Genera el Future de un trabajo rechazado.
+
+		@return Un Future que terminó con ExecutorFull
+		"""
+
+		with self.mutex: self.rejected += 1
+		future = Future()
+		future.set_exception(ExecutorFull("Send executor is saturated"))
+		return future
+
+	def done(self, future):
+		"""
+		Libera el espacio de un trabajo terminado.
+
+		@param future El Future del trabajo
+		"""
+
+		error = None if future.cancelled() else future.exception()
+		if error is not None: logging.warning(f"A queued send failed: {str(error)}")
+		with self.mutex:
+			self.pending -= 1
+			if future.cancelled() or error is not None: self.failed += 1
+			else: self.completed += 1
+		self.slots.release()
+
+	def stats(self):
+		"""
+		Devuelve las métricas del executor.
+
+		@return Un diccionario con las métricas
+		"""
+
+		with self.mutex:
+			return {
+				"workers" : self.workers,
+				"queue_size" : self.queue_size,
+				"pending" : self.pending,
+				"completed" : self.completed,
+				"failed" : self.failed,
+				"rejected" : self.rejected,
+				}
+
+	def shutdown(self):
+		"""
+		Detiene el pool y cancela los trabajos que no empezaron.
+		"""
+
+		with self.mutex:
+			executor = self.executor
+			self.executor = None
+		if executor is not None: executor.shutdown(wait=False, cancel_futures=True)
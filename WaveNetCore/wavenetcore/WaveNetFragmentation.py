@@ -0,0 +1,242 @@
+from collections import OrderedDict
+from threading import Lock
+import struct
+import time
+
+FRAGMENT_HEADER = struct.Struct("!QIIB") # Identificador, índice, cantidad y si el mensaje es texto
+
+def pack_fragment(fid, index, count, text, data):
+	"""
+	Genera el cuerpo de un paquete de fragmento.
+
+	@param fid El identificador del mensaje fragmentado
+	@param index El índice del fragmento
+	@param count La cantidad total de fragmentos
+	@param text Si el mensaje original era texto
+	@param data Los bytes del fragmento
+	@return El cuerpo en bytes
+	"""
+
+	return FRAGMENT_HEADER.pack(fid, index, count, int(text)) + data
+
+def unpack_fragment(body):
+	"""
+	Separa el cuerpo de un paquete de fragmento.
+
+	@param body El cuerpo en bytes
+	@return La tupla (identificador, índice, cantidad, si es texto, bytes del fragmento)
+	"""
+
+	if type(body) != bytes or len(body) < FRAGMENT_HEADER.size: raise Exception("Bad fragment")
+	fid, index, count, text = FRAGMENT_HEADER.unpack_from(body)
+	return fid, index, count, bool(text), body[FRAGMENT_HEADER.size:]
+
+def split(body, mtu):
+	"""
+	Divide un cuerpo en fragmentos de a lo sumo mtu bytes.
+
+	@param body El cuerpo del mensaje
+	@param mtu El tamaño máximo de cada fragmento
+	@return La lista de fragmentos
+	"""
+
+	assert mtu > 0
+	return [body[i:i + mtu] for i in range(0, len(body), mtu)] or [body]
+
+class SentFragments:
+	"""
+	Clase que guarda por un tiempo los fragmentos enviados para poder reenviar los que se pierdan.
+	"""
+
+	def __init__(self, capacity=64, ttl=30.0, clock=time.monotonic):
+		"""
+		Constructor de la clase.
+
+		@param capacity La cantidad máxima de mensajes guardados
+		@param ttl El tiempo que se guarda cada mensaje en segundos
+		@param clock La función que devuelve el tiempo actual
+		"""
+
+		self.capacity = capacity
+		self.ttl = ttl
+		self.clock = clock
+		self.messages = OrderedDict()
+		self.resent = 0
+		self.mutex = Lock()
+
+	def put(self, fid, dest, fragments, text=False):
+		"""
+		Guarda los fragmentos de un mensaje.
+
+		@param fid El identificador del mensaje fragmentado
+		@param dest El destinario del mensaje
+		@param fragments La lista de fragmentos
+		@param text Si el mensaje original era texto
+		"""
+
+		with self.mutex:
+			self.messages[fid] = (dest, fragments, text, self.clock() + self.ttl)
+			while len(self.messages) > self.capacity: self.messages.popitem(last=False)
+
+	def get(self, fid, dest, indices):
+		"""
+		Devuelve fragmentos guardados de un mensaje para reenviarlos.
+
+		@param fid El identificador del mensaje fragmentado
+		@param dest Quien pide los fragmentos (debe ser el destinario original)
+		@param indices Los índices de los fragmentos pedidos
+		@return La tupla (cantidad de fragmentos, si es texto, lista de tuplas (índice, fragmento) disponibles)
+		"""
+
+		with self.mutex:
+			if fid not in self.messages: return 0, False, []
+			owner, fragments, text, expires = self.messages[fid]
+			if expires <= self.clock():
+				self.messages.pop(fid)
+				return 0, False, []
+			if owner != dest: return 0, False, []
+			found = [(i, fragments[i]) for i in indices if type(i) == int and 0 <= i < len(fragments)]
+			self.resent += len(found)
+			return len(fragments), text, found
+
+	def stats(self):
+		"""
+		Devuelve las estadísticas de los fragmentos guardados.
+
+		@return Un diccionario con las estadísticas
+		"""
+
+		with self.mutex:
+			return {"messages" : len(self.messages), "resent" : self.resent}
+
+class Reassembly:
+	"""
+	Clase que rearma en el destino los mensajes fragmentados.
+
+	La memoria está acotada por la cantidad de mensajes incompletos y por el
+	total de bytes en espera: al superarse se descartan los mensajes más
+	viejos. Un mensaje que no avanza por nack_after segundos pide los
+	fragmentos que le faltan y uno que no se completa en timeout segundos se
+	descarta. Ambos tiempos se estiran según lo que tarda cada fragmento en
+	llegar por la conexión (pace), para que los enlaces lentos no pidan
+	fragmentos que todavía están en camino ni venzan antes de terminar.
+	"""
+
+	nack_limit = 512 # Fragmentos pedidos como máximo en cada aviso
+	slack = 3.0 # Veces el tiempo de un fragmento que se espera antes de darlo por perdido
+
+	def __init__(self, capacity=256, max_bytes=16 << 20, max_fragments=1 << 16, timeout=30.0, nack_after=0.5, clock=time.monotonic):
+		"""
+		Constructor de la clase.
+
+		@param capacity La cantidad máxima de mensajes incompletos
+		@param max_bytes La cantidad máxima de bytes en espera
+		@param max_fragments La cantidad máxima de fragmentos por mensaje
+		@param timeout El tiempo máximo para completar un mensaje en segundos
+		@param nack_after El tiempo sin fragmentos nuevos antes de pedir los que faltan en segundos
+		@param clock La función que devuelve el tiempo actual
+		"""
+
+		self.capacity = capacity
+		self.max_bytes = max_bytes
+		self.max_fragments = max_fragments
+		self.timeout = timeout
+		self.nack_after = nack_after
+		self.clock = clock
+		self.messages = OrderedDict()
+		self.size = 0
+		self.completed = 0
+		self.expired = 0
+		self.evicted = 0
+		self.mutex = Lock()
+
+	def drop(self, key):
+		"""
+		Descarta un mensaje incompleto (se asume que el mutex está tomado).
+
+		@param key La tupla (fuente, identificador del mensaje)
+		"""
+
+		entry = self.messages.pop(key)
+		self.size -= entry["size"]
+
+	def put(self, src, fid, index, count, data, pace=0.0):
+		"""
+		Guarda un fragmento.
+
+		@param src La identificación de la fuente
+		@param fid El identificador del mensaje fragmentado
+		@param index El índice del fragmento
+		@param count La cantidad total de fragmentos
+		@param data El contenido del fragmento
+		@param pace El tiempo estimado que tarda en llegar cada fragmento en segundos
+		@return El mensaje completo si este fragmento lo completó, o None
+		"""
+
+		if not (0 < count <= self.max_fragments and 0 <= index < count): raise Exception("Bad fragment")
+		if len(data) > self.max_bytes: raise Exception("Fragment too large")
+		key = (src, fid)
+		now = self.clock()
+		with self.mutex:
+			entry = self.messages.get(key)
+			if entry is None:
+				entry = {
+					"count" : count,
+					"parts" : dict(),
+					"size" : 0,
+					"deadline" : now + self.timeout + Reassembly.slack * count * pace,
+					"wait" : max(self.nack_after, Reassembly.slack * pace),
+					"touched" : now,
+					}
+				self.messages[key] = entry
+			if entry["count"] != count: raise Exception("Inconsistent fragment count")
+			if index in entry["parts"]: return None
+			entry["parts"][index] = data
+			entry["size"] += len(data)
+			entry["touched"] = now
+			self.size += len(data)
+			if len(entry["parts"]) == count:
+				self.drop(key)
+				self.completed += 1
+				return b"".join(entry["parts"][i] for i in range(count))
+			while self.size > self.max_bytes or len(self.messages) > self.capacity:
+				self.drop(next(iter(self.messages)))
+				self.evicted += 1
+		return None
+
+	def missing(self):
+		"""
+		Descarta los mensajes vencidos y devuelve los fragmentos que faltan de los mensajes detenidos.
+
+		@return La lista de tuplas (fuente, identificador del mensaje, índices faltantes)
+		"""
+
+		now = self.clock()
+		result = []
+		with self.mutex:
+			for key in list(self.messages):
+				entry = self.messages[key]
+				if entry["deadline"] <= now:
+					self.drop(key)
+					self.expired += 1
+				elif now - entry["touched"] >= entry["wait"]:
+					entry["touched"] = now
+					lost = [i for i in range(entry["count"]) if i not in entry["parts"]]
+					result.append((key[0], key[1], lost[:Reassembly.nack_limit]))
+		return result
+
+	def stats(self):
+		"""
+		Devuelve las estadísticas del rearmado.
+
+		@return Un diccionario con las estadísticas
+		"""
+
+		with self.mutex:
+			return {
+				"incomplete" : len(self.messages),
+				"bytes" : self.size,
+				"completed" : self.completed,
+				"expired" : self.expired,
+				"evicted" : self.evicted,
+				}
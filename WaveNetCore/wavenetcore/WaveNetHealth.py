@@ -0,0 +1,167 @@
+import time
+
+class LinkHealth:
+	"""
+	Clase que maneja el estado de salud de una conexión a un vecino.
+
+	Cada fallo consecutivo duplica el tiempo de espera antes de volver a usar
+	la conexión. Después de varios fallos la conexión queda en cuarentena: el
+	tráfico normal la ignora y solo un sondeo en segundo plano la puede revivir.
+	"""
+
+	alpha = 0.2 # Peso de la última muestra en los promedios móviles
+	small = 1024 # Envíos de hasta esta cantidad de bytes solo miden la latencia
+	base_backoff = 0.5 # En segundos
+	max_backoff = 60.0 # En segundos
+	quarantine_after = 3 # Fallos consecutivos
+
+	def __init__(self, latency=None, throughput=None, clock=time.monotonic):
+		"""
+		Constructor de la clase.
+
+		@param latency La latencia inicial estimada en segundos (normalmente la del tipo de protocolo)
+		@param throughput El rendimiento inicial estimado en bytes por segundo
+		@param clock La función que devuelve el tiempo actual
+		"""
+
+		self.clock = clock
+		self.failures = 0
+		self.last_success = None
+		self.last_failure = None
+		self.failing_since = None
+		self.retry_at = 0.0
+		self.latency = latency
+		self.throughput = throughput
+		self.sent = 0
+		self.failed = 0
+
+	def average(old, sample):
+		"""
+		Calcula el promedio móvil exponencial.
+
+		@param old El promedio anterior (o None)
+		@param sample La muestra nueva
+		@return El promedio actualizado
+		"""
+
+		if old is None: return sample
+		return LinkHealth.alpha * sample + (1 - LinkHealth.alpha) * old
+
+	def success(self, elapsed, size=0):
+		"""
+		Registra un envío exitoso.
+
+		@param elapsed La duración del envío en segundos
+		@param size La cantidad aproximada de bytes enviados
+		"""
+
+		self.failures = 0
+		self.failing_since = None
+		self.retry_at = 0.0
+		self.last_success = self.clock()
+		self.sent += 1
+		if size <= LinkHealth.small or self.latency is None:
+			self.latency = LinkHealth.average(self.latency, elapsed)
+		else:
+			transfer = max(elapsed - self.latency, 1e-6)
+			self.throughput = LinkHealth.average(self.throughput, size / transfer)
+
+	def cost(self, size=0):
+		"""
+		Estima cuánto tardaría en enviarse un paquete por la conexión.
+
+		@param size La cantidad de bytes a enviar
+		@return La duración estimada en segundos
+		"""
+
+		cost = self.latency if self.latency is not None else 0.0
+		if self.throughput: cost += size / self.throughput
+		return cost
+
+	def failure(self):
+		"""
+		Registra un envío fallido y calcula el siguiente momento para reintentar.
+		"""
+
+		now = self.clock()
+		self.failures += 1
+		self.failed += 1
+		self.last_failure = now
+		if self.failing_since is None: self.failing_since = now
+		backoff = min(LinkHealth.base_backoff * (1 << min(self.failures - 1, 16)), LinkHealth.max_backoff)
+		self.retry_at = now + backoff
+
+	def quarantined(self):
+		"""
+		Determina si la conexión está en cuarentena.
+
+		@return Si la conexión está en cuarentena
+		"""
+
+		return self.failures >= LinkHealth.quarantine_after
+
+	def usable(self):
+		"""
+		Determina si el tráfico normal puede usar la conexión.
+
+		@return Si la conexión se puede usar
+		"""
+
+		if self.failures == 0: return True
+		return not self.quarantined() and self.clock() >= self.retry_at
+
+	def should_probe(self):
+		"""
+		Determina si toca sondear una conexión en cuarentena.
+
+		@return Si se debería sondear la conexión
+		"""
+
+		return self.quarantined() and self.clock() >= self.retry_at
+
+	def probing(self):
+		"""
+		Marca que hay un sondeo en curso para no lanzar otro hasta conocer su resultado.
+		"""
+
+		self.retry_at = float("inf")
+
+	def dead_for(self):
+		"""
+		Devuelve cuánto tiempo lleva fallando la conexión.
+
+		@return La duración en segundos (0 si no está fallando)
+		"""
+
+		if self.failing_since is None: return 0.0
+		return self.clock() - self.failing_since
+
+	def state(self):
+		"""
+		Devuelve el nombre del estado actual.
+
+		@return "up", "backoff" o "quarantine"
+		"""
+
+		if self.failures == 0: return "up"
+		if self.quarantined(): return "quarantine"
+		return "backoff"
+
+	def stats(self):
+		"""
+		Devuelve las estadísticas de la conexión.
+
+		@return Un diccionario con las estadísticas
+		"""
+
+		now = self.clock()
+		return {
+			"state" : self.state(),
+			"failures" : self.failures,
+			"last_success" : None if self.last_success is None else now - self.last_success,
+			"latency" : self.latency,
+			"throughput" : self.throughput,
+			"retry_in" : max(0.0, self.retry_at - now),
+			"sent" : self.sent,
+			"failed" : self.failed,
+			}
@@ -2,12 +2,48 @@ from wavenetcore.WaveNetNode import *
 from wavenetcore.WaveNetPacketeering import *
 from wavenetcore.WaveNetProtocols import *
 from wavenetcore.WaveNetCrypto import *
+from wavenetcore.WaveNetForwarding import *
+from wavenetcore.WaveNetCache import *
+from wavenetcore.WaveNetSession import *
+from wavenetcore.WaveNetState import *
+from wavenetcore.WaveNetFragmentation import *
 from random import randint
+from collections import deque
+from concurrent.futures import Future
+import concurrent.futures
 import json
+import base64
+import hashlib
 import time
 from threading import Thread, Lock, Condition
 import logging
 
+HUB_COUNT = 16 # Cantidad de identificaciones reservadas para hubs
+
+def hub_id(index):
+	"""
+	Devuelve la identificación reservada de un hub.
+
+	El primer hub es el 0 (como siempre) y el resto toma los últimos valores
+	del espacio de 64 bits, por lo que no chocan con los IDs de los nodos.
+
+	@param index El número del hub (de 0 a HUB_COUNT - 1)
+	@return La identificación del hub
+	"""
+
+	assert type(index) == int and 0 <= index < HUB_COUNT
+	return 0 if index == 0 else (1 << 64) - index
+
+def is_hub(ID):
+	"""
+	Determina si una identificación pertenece al rango reservado para hubs.
+
+	@param ID La identificación
+	@return Si es la identificación de un hub
+	"""
+
+	return ID == 0 or (1 << 64) - HUB_COUNT < ID < (1 << 64)
+
 class PacketWaiter:
 	"""
 	Clase que abstrae la acción de "esperar por una respuesta".
@@ -64,25 +100,335 @@ class PacketWaiter:
 		self.condition.release()
 		return False
 
+class PendingRequests:
+	"""
+	Clase que maneja la tabla de solicitudes en curso (requests y pings).
+
+	Cada solicitud lleva un identificador propio ("rid") en el cuerpo del
+	paquete y la respuesta lo repite, por lo que varias solicitudes al mismo
+	nodo pueden estar en curso a la vez sin compartir la espera. Las entradas
+	se borran al completarse o cancelarse el Future, o al vencer su tiempo.
+	"""
+
+	def __init__(self, timeout=None, clock=time.monotonic):
+		"""
+		Constructor de la clase.
+
+		@param timeout El tiempo después del cual una solicitud sin respuesta se descarta
+		@param clock La función que devuelve el tiempo actual
+		"""
+
+		self.timeout = timeout if timeout is not None else PacketWaiter.timeout
+		self.clock = clock
+		self.futures = dict()
+		self.issued = 0
+		self.answered = 0
+		self.expired = 0
+		self.unmatched = 0
+		self.mutex = Lock()
+
+	def rid_of(packet):
+		"""
+		Extrae el identificador de solicitud del cuerpo de un paquete.
+
+		@param packet El paquete
+		@return El identificador o None si el paquete no trae uno
+		"""
+
+		try:
+			data = json.loads(packet.body)
+		except Exception:
+			return None
+		if type(data) != dict: return None
+		status, rid = verify_tag(data, "rid", int)
+		return rid if status else None
+
+	def open(self):
+		"""
+		Registra una solicitud nueva.
+
+		@return La tupla (identificador de la solicitud, Future que se completa con la respuesta)
+		"""
+
+		future = Future()
+		with self.mutex:
+			stale = self.expire()
+			rid = new_message_id()
+			while rid in self.futures: rid = new_message_id()
+			self.futures[rid] = (future, self.clock() + self.timeout)
+			self.issued += 1
+		for old in stale: old.cancel()
+		future.add_done_callback(lambda _: self.discard(rid))
+		return rid, future
+
+	def resolve(self, rid, packet):
+		"""
+		Completa una solicitud con su respuesta.
+
+		@param rid El identificador de la solicitud
+		@param packet El paquete de respuesta
+		@return Si había una solicitud en curso con ese identificador
+		"""
+
+		with self.mutex:
+			entry = self.futures.pop(rid, None)
+			if entry is None:
+				self.unmatched += 1
+				return False
+			self.answered += 1
+		if not entry[0].done(): entry[0].set_result(packet)
+		return True
+
+	def discard(self, rid):
+		"""
+		Olvida una solicitud (por ejemplo, cuando quien la esperaba se rindió).
+
+		@param rid El identificador de la solicitud
+		"""
+
+		with self.mutex: self.futures.pop(rid, None)
+
+	def expire(self):
+		"""
+		Saca de la tabla las solicitudes cuyo tiempo venció (se asume que el mutex está tomado).
+
+		Los Futures se devuelven sin cancelar: cancelarlos ejecuta sus callbacks,
+		que toman el mutex, por lo que se deben cancelar después de soltarlo.
+
+		@return La lista de Futures vencidos
+		"""
+
+		now = self.clock()
+		stale = []
+		for rid in [rid for rid, (_, deadline) in self.futures.items() if deadline <= now]:
+			future, _ = self.futures.pop(rid)
+			self.expired += 1
+			stale.append(future)
+		return stale
+
+	def __len__(self):
+		"""
+		Devuelve la cantidad de solicitudes en curso.
+
+		@return La cantidad de solicitudes
+		"""
+
+		with self.mutex: return len(self.futures)
+
+	def stats(self):
+		"""
+		Devuelve los contadores de la tabla.
+
+		@return Un diccionario con los contadores
+		"""
+
+		with self.mutex:
+			return {
+				"in_flight" : len(self.futures),
+				"issued" : self.issued,
+				"answered" : self.answered,
+				"expired" : self.expired,
+				"unmatched" : self.unmatched,
+				}
+
+class Inbox:
+	"""
+	Clase que maneja las colas de entrada de mensajes data, una por cada nodo fuente.
+
+	Los mensajes que llegan mientras nadie los está esperando se guardan en
+	orden hasta el límite de cada cola y hasta un límite total; al llenarse
+	se aplica la política de descarte (con DROP_OLD se descarta el más viejo
+	de la misma fuente o, si se llenó el total, el más viejo de todos). Las
+	colas vacías se eliminan, por lo que la memoria queda acotada aunque
+	lleguen mensajes de muchas fuentes distintas. Recibir de cualquier fuente
+	devuelve el mensaje más viejo.
+	"""
+
+	def __init__(self, capacity=1024, policy=DropPolicy.DROP_OLD, block_timeout=1.0, total=8192):
+		"""
+		Constructor de la clase.
+
+		@param capacity La cantidad máxima de mensajes en espera por fuente
+		@param policy La política a aplicar cuando una cola está llena
+		@param block_timeout El tiempo máximo de espera con la política BLOCK
+		@param total La cantidad máxima de mensajes en espera entre todas las fuentes
+		"""
+
+		assert type(capacity) == int and capacity > 0
+		assert type(total) == int and total > 0
+		assert isinstance(policy, DropPolicy)
+		self.capacity = capacity
+		self.total = total
+		self.policy = policy
+		self.block_timeout = block_timeout
+		self.queues = dict()
+		self.size = 0
+		self.sequence = 0
+		self.received = 0
+		self.delivered = 0
+		self.dropped = 0
+		self.mutex = Lock()
+		self.arrival = Condition(self.mutex)
+		self.space = Condition(self.mutex)
+
+	def put(self, packet):
+		"""
+		Guarda un mensaje en la cola de su fuente.
+
+		@param packet El paquete recibido
+		@return Si el mensaje fue guardado
+		"""
+
+		def full():
+			return len(self.queues.get(packet.src, ())) >= self.capacity or self.size >= self.total
+
+		with self.mutex:
+			if full():
+				if self.policy == DropPolicy.DROP_NEW:
+					self.dropped += 1
+					return False
+				if self.policy == DropPolicy.DROP_OLD:
+					queue = self.queues.get(packet.src, ())
+					self.take(queue if len(queue) >= self.capacity else self.source(None))
+					self.dropped += 1
+				if self.policy == DropPolicy.BLOCK:
+					waited = self.space.wait_for(lambda: not full(), self.block_timeout)
+					if not waited:
+						self.dropped += 1
+						return False
+			self.sequence += 1
+			self.queues.setdefault(packet.src, deque()).append((self.sequence, packet))
+			self.size += 1
+			self.received += 1
+			self.arrival.notify_all()
+		return True
+
+	def take(self, queue):
+		"""
+		Saca el mensaje más viejo de una cola y la elimina si queda vacía (se asume que el mutex está tomado).
+
+		@param queue La cola
+		@return El paquete
+		"""
+
+		packet = queue.popleft()[1]
+		self.size -= 1
+		if not queue: self.queues.pop(packet.src, None)
+		return packet
+
+	def source(self, ID):
+		"""
+		Elige la cola de la que se debería sacar el siguiente mensaje (se asume que el mutex está tomado).
+
+		@param ID La identificación de la fuente (o None para cualquiera)
+		@return La cola o None si no hay mensajes
+		"""
+
+		if ID is not None:
+			queue = self.queues.get(ID)
+			return queue if queue else None
+		oldest = None
+		for queue in self.queues.values():
+			if queue and (oldest is None or queue[0][0] < oldest[0][0]): oldest = queue
+		return oldest
+
+	def get_many(self, ID=None, limit=64, timeout=None):
+		"""
+		Espera a que haya mensajes y saca varios de una vez.
+
+		@param ID La identificación de la fuente (o None para cualquiera)
+		@param limit La cantidad máxima de mensajes a sacar
+		@param timeout El tiempo máximo de espera (None para esperar siempre)
+		@return La lista de paquetes (vacía si se acabó el tiempo)
+		"""
+
+		packets = []
+		with self.mutex:
+			if not self.arrival.wait_for(lambda: self.source(ID) is not None, timeout): return packets
+			while len(packets) < limit:
+				queue = self.source(ID)
+				if queue is None: break
+				packets.append(self.take(queue))
+			self.delivered += len(packets)
+			self.space.notify_all()
+		return packets
+
+	def get(self, ID=None, timeout=None):
+		"""
+		Espera a que haya un mensaje y lo saca.
+
+		@param ID La identificación de la fuente (o None para cualquiera)
+		@param timeout El tiempo máximo de espera (None para esperar siempre)
+		@return El paquete o None si se acabó el tiempo
+		"""
+
+		packets = self.get_many(ID, 1, timeout)
+		return packets[0] if packets else None
+
+	def stats(self):
+		"""
+		Devuelve las métricas de las colas de entrada.
+
+		@return Un diccionario con las métricas
+		"""
+
+		with self.mutex:
+			return {
+				"depth" : {ID: len(queue) for ID, queue in self.queues.items() if queue},
+				"received" : self.received,
+				"delivered" : self.delivered,
+				"dropped" : self.dropped,
+				}
+
 class MeshHub(Node):
 	"""
 	Clase que maneja el mesh hub.
+
+	Puede haber varias réplicas del hub, cada una con una identificación del
+	rango reservado y todas con la misma llave (la llave del directorio). Las
+	réplicas se sincronizan entre sí por anti-entropía: cada cierto tiempo
+	intercambian un resumen firmado del directorio y se envían las entradas
+	que le faltan o que tiene desactualizadas la otra.
 	"""
 
-	def __init__(self, protocols, encrypt=True):
+	sync_interval = 5.0 # Tiempo entre rondas de anti-entropía en segundos
+	save_interval = 1.0 # Tiempo máximo que un cambio del directorio espera para guardarse en segundos
+
+	def __init__(self, protocols, encrypt=True, executor=None, index=0, private_key=None, state=None, batching=False, compression=False):
 		"""
 		El constructor del mesh hub.
 
 		@param protocols Los protocolos disponibles al hub
 		@param encrypt Si se debería cifrar las comunicaciones o no
-		"""
-
-		self.private_key = PrivateKey()
-		info = NodeInfo(0, self.private_key)
-		self.node = Node(info, protocols, self.delegate)
-		self.nodes = {0: self.private_key.public_key()}
+		@param executor El executor acotado para los envíos (por defecto un BoundedExecutor propio; uno recibido no se apaga en kill)
+		@param index El número de réplica del hub (define su identificación)
+		@param private_key La llave del directorio compartida por las réplicas (por defecto la guardada o una nueva)
+		@param state La ruta del archivo donde se guardan la llave y el directorio entre reinicios (opcional)
+		@param batching Si se deberían juntar en frames los paquetes hacia un mismo vecino
+		@param compression Si se debería acordar compresión con los vecinos
+		"""
+
+		self.state = NodeState(state) if state is not None else None
+		saved = self.state.load() if self.state is not None else dict()
+		if private_key is None and "private_key" in saved: private_key = PrivateKey(pem=saved["private_key"].encode())
+		self.private_key = private_key if private_key is not None else PrivateKey()
+		self.ID = hub_id(index)
+		info = NodeInfo(self.ID, self.private_key)
+		self.node = Node(info, protocols, self.delegate, batching=batching, compression=compression)
+		public_key = self.private_key.public_key()
+		self.nodes = {self.ID: public_key}
+		self.entries = dict()
+		self.certificates = dict()
+		self.issued = dict()
+		self.store(self.ID, 0, str(public_key))
+		for ID, entry in saved.get("entries", {}).items():
+			if not is_hub(int(ID)): self.store(int(ID), entry[0], entry[1], entry[2] if len(entry) > 2 else 0.0)
+		self.synced = 0
+		self.dirty = self.state is not None and "private_key" not in saved
 		self.encrypt = encrypt
-		self.awaits = dict()
+		self.executor = executor if executor is not None else BoundedExecutor()
+		self.owns_executor = executor is None
+		self.pending = PendingRequests()
 		self.mutex = Lock()
 	
 	def __send(self, dest, mtype, message):
@@ -94,19 +440,38 @@ class MeshHub(Node):
 		@param message El cuerpo del mensaje
 		"""
 
-		key = self.nodes[dest] if dest in self.nodes and self.encrypt else None
+		key = None
+		if self.encrypt and dest in self.nodes: key = self.nodes[dest]
+		elif self.encrypt and is_hub(dest): key = self.nodes[self.ID]
 		self.node.send(dest, mtype, message, public_key=key)
+
+	def stats(self):
+		"""
+		Devuelve las estadísticas del hub.
+
+		@return Un diccionario con las estadísticas
+		"""
+
+		return {
+			"node" : self.node.stats(),
+			"executor" : self.executor.stats(),
+			"pending" : self.pending.stats(),
+			"nodes" : len(self.nodes),
+			"synced" : self.synced,
+			"peers" : self.peers(),
+			}
 	
 	def sends(self, dest, mtype, message):
 		"""
-		Método que genera un thread para enviar un mensaje a la red (para evitar deadlocks).
+		Método que agenda el envío de un mensaje a la red en el executor (para evitar deadlocks).
 
 		@param dest El destinario
 		@param mtype El tipo de mensaje
 		@param message El cuerpo del mensaje
+		@return El Future del envío
 		"""
 
-		Thread(target=self.__send, args=(dest, mtype, message,), daemon=True).start()
+		return self.executor.submit(self.__send, dest, mtype, message)
 	
 	def ping(self, ID):
 		"""
@@ -115,13 +480,25 @@ class MeshHub(Node):
 		@param ID Algún nodo
 		"""
 
-		with self.mutex:
-			if (ID, "pong") not in self.awaits: self.awaits[(ID, "pong")] = PacketWaiter()
-			waiter = self.awaits[(ID, "pong")]
-		self.sends(ID, "ping", "")
-		packet = waiter.recv()
-		if packet.is_null(): return False
+		future = self.ping_future(ID)
+		try:
+			packet = future.result(PacketWaiter.timeout)
+		except concurrent.futures.TimeoutError:
+			future.cancel()
+			return False
 		return packet.src == ID
+
+	def ping_future(self, ID):
+		"""
+		Envía un ping a un nodo sin esperar la respuesta.
+
+		@param ID Algún nodo
+		@return El Future que se completa con el paquete pong
+		"""
+
+		rid, future = self.pending.open()
+		self.sends(ID, "ping", json.dumps({"rid" : rid}))
+		return future
 	
 	def process_connect(self, packet):
 		"""
@@ -135,6 +512,9 @@ class MeshHub(Node):
 		{
 			"protocol" : str
 			"dest" : str
+			"id" : int (opcional)
+			"compress" : list (opcional)
+			"reply" : bool (opcional)
 		}
 		"""
 		status, protocol = verify_tag(data, "protocol", str)
@@ -143,6 +523,8 @@ class MeshHub(Node):
 		if not status: raise Exception(dest)
 		link = Link(dest, empty_protocol_from_str(protocol))
 		self.node.info.add_neighbor(link)
+		reply = self.node.negotiate(link, data)
+		if reply is not None: self.executor.submit(link.send, reply)
 
 	def process_ping(self, packet):
 		"""
@@ -151,7 +533,8 @@ class MeshHub(Node):
 		@param packet El paquete recibido
 		"""
 
-		self.sends(packet.src, "pong", "")
+		rid = PendingRequests.rid_of(packet)
+		self.sends(packet.src, "pong", "" if rid is None else json.dumps({"rid" : rid}))
 
 	def process_pong(self, packet):
 		"""
@@ -160,9 +543,8 @@ class MeshHub(Node):
 		@param packet El paquete recibido
 		"""
 
-		if (packet.src, packet.mtype) in self.awaits:
-			waiter = self.awaits.pop((packet.src, packet.mtype))
-			with waiter: waiter.send(packet)
+		rid = PendingRequests.rid_of(packet)
+		if rid is not None: self.pending.resolve(rid, packet)
 
 	def process_request(self, packet):
 		"""
@@ -175,13 +557,26 @@ class MeshHub(Node):
 		"""
 		{
 			"id" : int
+			"rid" : int (opcional)
 		}
 		"""
 		status, ID = verify_tag(data, "id", int)
 		if not status: raise Exception(ID)
-		if ID not in self.nodes: raise Exception("ID not found")
-		pem = str(self.nodes[ID])
-		ans = {"id" : ID, "pem" : pem}
+		rid = PendingRequests.rid_of(packet)
+		if is_hub(ID): ID = self.ID
+		if ID not in self.nodes:
+			if rid is not None: self.sends(packet.src, "answer", json.dumps({"id" : ID, "rid" : rid, "error" : "ID not found"}))
+			raise Exception("ID not found")
+		epoch, pem, _, _ = self.entries[ID]
+		ans = {
+			"id" : ID,
+			"pem" : pem,
+			"epoch" : epoch,
+			"sig" : self.certify(ID),
+			"issued" : self.issued[ID],
+			"load" : self.executor.stats()["pending"],
+			}
+		if rid is not None: ans["rid"] = rid
 		message = json.dumps(ans)
 		self.sends(packet.src, "answer", message)
 	
@@ -189,6 +584,9 @@ class MeshHub(Node):
 		"""
 		Procesa una solicitud de un nodo para unirse a la red.
 
+		Si la solicitud trae un rid se responde con un join_ack que incluye la
+		llave del hub (o el error por el cual se rechazó).
+
 		@param packet El paquete recibido
 		"""
 
@@ -197,15 +595,281 @@ class MeshHub(Node):
 		{
 			"id" : int
 			"pem" : str
+			"sig" : str (opcional, la llave nueva firmada con la llave registrada)
+			"rid" : int (opcional)
 		}
 		"""
+		rid = PendingRequests.rid_of(packet)
+		try:
+			ID = self.register(data)
+		except Exception as e:
+			if rid is not None: self.executor.submit(self.node.send, packet.src, "join_ack", json.dumps({"rid" : rid, "error" : str(e)}))
+			raise
+		if rid is not None: self.sends(ID, "join_ack", json.dumps({"rid" : rid, "pem" : str(self.nodes[self.ID])}))
+
+	def register(self, data):
+		"""
+		Registra (o rota) la llave de un nodo en el directorio.
+
+		@param data El cuerpo de la solicitud de join
+		@return La identificación del nodo
+		"""
+
 		status, ID = verify_tag(data, "id", int)
 		if not status: raise Exception(ID)
 		status, pem = verify_tag(data, "pem", str)
 		if not status: raise Exception(pem)
-		public_key = PublicKey(pem=pem.encode())
-		if ID in self.nodes: raise Exception("Repeated ID")
-		self.nodes[ID] = public_key
+		PublicKey(pem=pem.encode())
+		if is_hub(ID): raise Exception("Repeated ID")
+		epoch = 0
+		if ID in self.nodes:
+			if self.entries[ID][1] == pem: return ID
+			status, sig = verify_tag(data, "sig", str)
+			if not status or not self.nodes[ID].verify(base64.b64decode(sig.encode()), pem.encode()):
+				raise Exception("Repeated ID")
+			logging.info(f"Node {ID} rotated its key")
+			epoch = self.entries[ID][0] + 1
+			notice = MeshHub.rekey_notice(ID, epoch)
+			self.sends(Node.BROADCAST, "rekey", json.dumps({
+				"id" : ID,
+				"epoch" : epoch,
+				"sig" : base64.b64encode(self.private_key.sign(notice)).decode(),
+				}))
+		self.store(ID, epoch, pem)
+		self.dirty = True
+		entry = {ID: self.entries[ID]}
+		for peer in self.peers(): self.sends(peer, "sync", self.sync_body(None, entry, []))
+		return ID
+
+	def save(self):
+		"""
+		Guarda en disco la llave y el directorio del hub si cambiaron (y si se pidió persistencia).
+
+		Solo la copia del directorio se hace con el mutex tomado; la escritura
+		a disco se hace afuera para no frenar los joins.
+		"""
+
+		if self.state is None: return
+		with self.mutex:
+			if not self.dirty: return
+			data = {
+				"private_key" : self.private_key.pem(),
+				"entries" : {str(ID): [epoch, pem, registered] for ID, (epoch, pem, _, registered) in self.entries.items() if not is_hub(ID)},
+				}
+			self.dirty = False
+		try:
+			self.state.save(data)
+		except Exception:
+			with self.mutex: self.dirty = True
+			raise
+
+	def saver(self, switch):
+		"""
+		Guarda periódicamente los cambios del directorio.
+
+		@param switch El indicador de terminación para el thread
+		"""
+
+		while not switch.wait(MeshHub.save_interval):
+			try:
+				self.save()
+			except Exception as e:
+				logging.warning(f"Couldn't save the hub state: {str(e)}")
+
+	def fingerprint(pem):
+		"""
+		Calcula la huella corta de una llave pública.
+
+		@param pem La llave en formato PEM
+		@return La huella en hexadecimal
+		"""
+
+		return hashlib.sha256(pem.encode()).hexdigest()[:16]
+
+	def newer(entry, other):
+		"""
+		Determina si una entrada del directorio le gana a otra.
+
+		Gana la de época mayor (cada rotación de llave aumenta la época). A
+		igual época gana la registrada primero, para que nadie pueda reemplazar
+		una llave registrando el mismo ID en otra réplica durante una
+		partición; solo si ambas se registraron en el mismo momento gana la de
+		huella menor, para que todas las réplicas elijan igual.
+
+		@param entry La tupla (época, huella, momento del registro)
+		@param other La otra tupla (época, huella, momento del registro)
+		@return Si la primera entrada gana
+		"""
+
+		if entry[0] != other[0]: return entry[0] > other[0]
+		if entry[2] != other[2]: return entry[2] < other[2]
+		return entry[1] < other[1]
+
+	def summary(entry):
+		"""
+		Resume una entrada del directorio para compararla con newer.
+
+		@param entry La tupla (época, pem, huella, momento del registro)
+		@return La tupla (época, huella, momento del registro)
+		"""
+
+		return entry[0], entry[2], entry[3]
+
+	def store(self, ID, epoch, pem, registered=None):
+		"""
+		Guarda una entrada en el directorio (se asume que el mutex está tomado).
+
+		@param ID La identificación del nodo
+		@param epoch La época de la llave
+		@param pem La llave en formato PEM
+		@param registered El momento (time.time) en que la réplica de origen registró la llave (por defecto ahora)
+		"""
+
+		self.nodes[ID] = PublicKey(pem=pem.encode())
+		self.entries[ID] = (epoch, pem, MeshHub.fingerprint(pem), time.time() if registered is None else registered)
+		self.certificates.pop(ID, None)
+		self.issued[ID] = time.time()
+
+	def certificate(ID, epoch, pem):
+		"""
+		Genera el texto que el hub firma para certificar la llave de un nodo.
+
+		@param ID La identificación del nodo
+		@param epoch La época de la llave
+		@param pem La llave en formato PEM
+		@return El texto en bytes
+		"""
+
+		return f"key|{ID}|{epoch}|{pem}".encode()
+
+	def certify(self, ID):
+		"""
+		Devuelve la firma de la entrada de un nodo, calculándola solo una vez por entrada (se asume que el mutex está tomado).
+
+		@param ID La identificación del nodo
+		@return La firma en base64
+		"""
+
+		if ID not in self.certificates:
+			epoch, pem, _, _ = self.entries[ID]
+			signature = self.private_key.sign(MeshHub.certificate(ID, epoch, pem))
+			self.certificates[ID] = base64.b64encode(signature).decode()
+		return self.certificates[ID]
+
+	def merge(self, ID, epoch, pem, registered):
+		"""
+		Incorpora una entrada recibida de otra réplica si es más nueva (se asume que el mutex está tomado).
+
+		@param ID La identificación del nodo
+		@param epoch La época de la llave
+		@param pem La llave en formato PEM
+		@param registered El momento en que la réplica de origen registró la llave
+		@return Si la entrada cambió el directorio
+		"""
+
+		current = self.entries.get(ID)
+		if current is not None and not MeshHub.newer((epoch, MeshHub.fingerprint(pem), registered), MeshHub.summary(current)): return False
+		self.store(ID, epoch, pem, registered)
+		self.synced += 1
+		return True
+
+	def peers(self):
+		"""
+		Devuelve las otras réplicas del hub alcanzables según la tabla de rutas.
+
+		@return La lista de identificaciones de las réplicas
+		"""
+
+		if self.node.router is None: return []
+		return [ID for ID in self.node.router.routes() if is_hub(ID) and ID != self.ID]
+
+	def sync_body(self, digest, entries, want):
+		"""
+		Genera el cuerpo firmado de un mensaje de sincronización.
+
+		@param digest El resumen del directorio {ID: (época, huella, momento del registro)} o None si no es una ronda nueva
+		@param entries Las entradas a enviar {ID: (época, pem, huella, momento del registro)}
+		@param want Las identificaciones que se le piden a la otra réplica
+		@return El cuerpo del mensaje
+		"""
+
+		payload = json.dumps({
+			"digest" : None if digest is None else {str(ID): list(value) for ID, value in digest.items()},
+			"entries" : {str(ID): [entry[0], entry[1], entry[3]] for ID, entry in entries.items()},
+			"want" : list(want),
+			})
+		return json.dumps({
+			"payload" : payload,
+			"sig" : base64.b64encode(self.private_key.sign(payload.encode())).decode(),
+			})
+
+	def sync(self):
+		"""
+		Ejecuta una ronda de anti-entropía con las otras réplicas.
+		"""
+
+		with self.mutex: digest = {ID: MeshHub.summary(entry) for ID, entry in self.entries.items()}
+		for peer in self.peers(): self.sends(peer, "sync", self.sync_body(digest, {}, []))
+
+	def anti_entropy(self, switch):
+		"""
+		Ejecuta rondas de anti-entropía periódicamente.
+
+		@param switch El indicador de terminación para el thread
+		"""
+
+		while not switch.wait(MeshHub.sync_interval):
+			try:
+				self.sync()
+			except Exception as e:
+				logging.warning(f"Couldn't sync the directory: {str(e)}")
+
+	def process_sync(self, packet):
+		"""
+		Procesa un mensaje de sincronización de otra réplica.
+
+		@param packet El paquete recibido
+		"""
+
+		if not is_hub(packet.src) or packet.src == self.ID: return
+		data = json.loads(packet.body)
+		"""
+		{
+			"payload" : str
+			"sig" : str
+		}
+		"""
+		status, payload = verify_tag(data, "payload", str)
+		if not status: raise Exception(payload)
+		status, sig = verify_tag(data, "sig", str)
+		if not status: raise Exception(sig)
+		if not self.private_key.public_key().verify(base64.b64decode(sig.encode()), payload.encode()):
+			raise Exception("Bad sync signature")
+		payload = json.loads(payload)
+		changed = [self.merge(int(ID), entry[0], entry[1], entry[2]) for ID, entry in payload["entries"].items()]
+		if any(changed): self.dirty = True
+		replies = {int(ID): self.entries[int(ID)] for ID in payload["want"] if int(ID) in self.entries}
+		want = []
+		if payload["digest"] is not None:
+			digest = {int(ID): tuple(value) for ID, value in payload["digest"].items()}
+			for ID, theirs in digest.items():
+				mine = self.entries.get(ID)
+				if mine is None or MeshHub.newer(theirs, MeshHub.summary(mine)): want.append(ID)
+				elif MeshHub.newer(MeshHub.summary(mine), theirs): replies[ID] = mine
+			for ID, mine in self.entries.items():
+				if ID not in digest: replies[ID] = mine
+		if replies or want: self.sends(packet.src, "sync", self.sync_body(None, replies, want))
+
+	def rekey_notice(ID, epoch):
+		"""
+		Genera el texto que el hub firma al avisar que un nodo cambió de llave.
+
+		@param ID La identificación del nodo
+		@param epoch La época de la llave nueva
+		@return El texto en bytes
+		"""
+
+		return f"rekey|{ID}|{epoch}".encode()
 	
 	def delegate(self, packet):
 		"""
@@ -215,15 +879,21 @@ class MeshHub(Node):
 		@return Si se puede propagar el paquete a los vecinos o no
 		"""
 
+		if packet.mtype == "ping":
+			try:
+				self.process_ping(packet)
+			except Exception as e:
+				logging.warning(f"Couldn't answer a ping: {str(e)}")
+			return True
 		with self.mutex:
 			try:
 				if packet.mtype == "connect":
 					self.process_connect(packet)
 					return False
-				if packet.mtype == "ping": self.process_ping(packet)
 				if packet.mtype == "pong": self.process_pong(packet)
 				if packet.mtype == "request": self.process_request(packet)
 				if packet.mtype == "join": self.process_join(packet)
+				if packet.mtype == "sync": self.process_sync(packet)
 			except Exception as e:
 				logging.warning("Couldn't process a message properly...")
 				logging.error(str(e))
@@ -235,6 +905,8 @@ class MeshHub(Node):
 		"""
 
 		self.node.listen()
+		Thread(target=self.anti_entropy, args=[self.node.switch], daemon=True).start()
+		Thread(target=self.saver, args=[self.node.switch], daemon=True).start()
 	
 	def kill(self):
 		"""
@@ -242,29 +914,73 @@ class MeshHub(Node):
 		"""
 
 		self.node.kill()
+		if self.owns_executor: self.executor.shutdown()
+		try:
+			self.save()
+		except Exception as e:
+			logging.warning(f"Couldn't save the hub state: {str(e)}")
 
 class MeshNode(Node):
 	"""
 	Clase que maneja los nodos del mesh.
 	"""
 
-	def __init__(self, protocols, ID=None, encrypt=True):
+	join_timeout = 2.0 # Espera inicial por el join_ack en segundos (se duplica en cada reintento)
+	join_retries = 4 # Intentos de join antes de fallar
+	gossip_interval = 2.0 # Tiempo entre rondas de gossip en segundos
+	gossip_fanout = 32 # Cantidad de llaves recientes enviadas en cada ronda
+
+	def __init__(self, protocols, ID=None, encrypt=True, executor=None, sessions=True, inbox=None, gossip=False, state=None, batching=False, compression=False):
 		"""
 		Constructor de los nodos del mesh.
 
 		@param protocols Los protocolos disponibles al nodo
 		@param ID La identificación del nodo
 		@param encrypt Si la comunicación del nodo se debería cifrar o no
-		"""
-
-		self.private_key = PrivateKey()
-		if ID is None: ID = randint(1, (1 << 64) - 1)
+		@param executor El executor acotado para los envíos (por defecto un BoundedExecutor propio; uno recibido no se apaga en kill)
+		@param sessions Si se deberían negociar sesiones cifradas con los otros nodos (en vez de usar RSA en cada mensaje)
+		@param inbox Las colas de entrada de los mensajes data (por defecto un Inbox propio)
+		@param gossip Si se deberían intercambiar con los vecinos las llaves certificadas por el hub
+		@param state La ruta del archivo donde se guarda la identidad del nodo entre reinicios (opcional, falla si guarda la de otro ID)
+		@param batching Si se deberían juntar en frames los paquetes hacia un mismo vecino
+		@param compression Si se debería acordar compresión con los vecinos
+		"""
+
+		self.state = NodeState(state) if state is not None else None
+		saved = self.state.load() if self.state is not None else dict()
+		if "id" in saved and "private_key" in saved:
+			if ID is not None and ID != saved["id"]: raise Exception(f"The state in {state} belongs to node {saved['id']}, not {ID}")
+			ID = saved["id"]
+			self.private_key = PrivateKey(pem=saved["private_key"].encode())
+		else:
+			saved = dict()
+			self.private_key = PrivateKey()
+		if ID is None: ID = randint(1, (1 << 64) - HUB_COUNT)
+		assert not is_hub(ID)
 		info = NodeInfo(ID, self.private_key)
-		self.node = Node(info, protocols, self.delegate)
+		self.keys = KeyCache()
+		for peer, pem in saved.get("keys", {}).items(): self.keys.put(int(peer), PublicKey(pem=pem.encode()))
+		self.sessions = None
+		if encrypt and sessions: self.sessions = SessionManager(ID, self.private_key, lambda peer: self.keys.get(peer, self.request))
+		self.node = Node(info, protocols, self.delegate, sessions=self.sessions, batching=batching, compression=compression)
 		self.encrypt = encrypt
-		self.awaits = dict()
+		self.executor = executor if executor is not None else BoundedExecutor()
+		self.owns_executor = executor is None
+		self.control = BoundedExecutor(workers=2, queue_size=64, policy=DropPolicy.DROP_NEW, name="wavenet-control")
+		self.inbox = inbox if inbox is not None else Inbox()
+		self.pending = PendingRequests()
+		self.sent_fragments = SentFragments()
+		self.reassembly = Reassembly()
 		self.mutex = Lock()
-		self.hub_key = None
+		self.hub_key = PublicKey(pem=saved["hub_key"].encode()) if "hub_key" in saved else None
+		self.hub_health = dict()
+		self.hub_loads = dict()
+		self.failovers = 0
+		self.join_time = None
+		self.gossip = gossip
+		self.certificates = dict()
+		self.floors = dict()
+		self.gossip_stats = {"sent" : 0, "learned" : 0, "rejected" : 0, "convergence" : None, "max_convergence" : 0.0}
 	
 	def __basic_send(self, dest, mtype, message):
 		"""
@@ -279,44 +995,164 @@ class MeshNode(Node):
 
 	def basic_send(self, dest, mtype, message):
 		"""
-		Crea un thread que envía un mensaje sin procesamiento adicional.
+		Agenda en el executor el envío de un mensaje sin procesamiento adicional.
 
 		@param dest El destinario
 		@param mtype El tipo de mensaje
 		@param message El cuerpo del mensaje
+		@return El Future del envío
 		"""
 
-		Thread(target=self.__basic_send, args=(dest, mtype, message,), daemon=True).start()
+		return self.executor.submit(self.__basic_send, dest, mtype, message)
 	
+	hub_timeout = 5.0 # Tiempo de espera por un hub antes de probar con otra réplica
+
+	def hubs(self):
+		"""
+		Devuelve las réplicas del hub conocidas, de la más a la menos conveniente.
+
+		Se prefieren las réplicas sanas, luego las más cercanas según la tabla
+		de rutas, luego las menos cargadas y por último las de menor latencia.
+
+		@return La lista de identificaciones de las réplicas
+		"""
+
+		routes = self.node.router.routes() if self.node.router is not None else dict()
+		candidates = set(ID for ID in routes if is_hub(ID))
+		candidates.add(0)
+		def rank(ID):
+			health = self.hub_health.get(ID)
+			usable = health is None or health.usable()
+			cost = health.cost() if health is not None else 0.0
+			return (not usable, routes.get(ID, float("inf")), self.hub_loads.get(ID, 0), cost)
+		with self.mutex: return sorted(candidates, key=rank)
+
 	def request(self, ID):
 		"""
-		Solicita la llave de un nodo en particular al hub central.
+		Solicita la llave de un nodo en particular a alguna réplica del hub.
+
+		Si una réplica no responde a tiempo se prueba con la siguiente.
 
 		@param ID La identificación del nodo
 		@return La llave pública del nodo solicitado
 		"""
 
+		hubs = self.hubs()
+		timeout = MeshNode.hub_timeout if len(hubs) > 1 else PacketWaiter.timeout
+		for hub in hubs:
+			try:
+				return self.request_from(hub, ID, timeout)
+			except concurrent.futures.TimeoutError:
+				with self.mutex: self.failovers += 1
+		raise Exception("Timeout")
+
+	def request_from(self, hub, ID, timeout):
+		"""
+		Solicita la llave de un nodo a una réplica del hub en particular.
+
+		@param hub La identificación de la réplica
+		@param ID La identificación del nodo
+		@param timeout El tiempo máximo de espera
+		@return La llave pública del nodo solicitado
+		"""
+
 		with self.mutex:
 			key = self.hub_key if self.encrypt else None
-			if (ID, "answer") not in self.awaits: self.awaits[(ID, "answer")] = PacketWaiter()
-			waiter = self.awaits[(ID, "answer")]
-		message = json.dumps({"id" : ID})
-		self.node.send(0, "request", message, public_key=key)
-		packet = waiter.recv()
-		if packet.is_null(): raise Exception(packet.body)
+			health = self.hub_health.setdefault(hub, LinkHealth())
+		rid, future = self.pending.open()
+		message = json.dumps({"id" : ID, "rid" : rid})
+		start = time.monotonic()
+		self.node.send(hub, "request", message, public_key=key)
+		try:
+			packet = future.result(timeout)
+		except concurrent.futures.TimeoutError:
+			future.cancel()
+			with self.mutex: health.failure()
+			raise
 		data = json.loads(packet.body)
 		"""
 		{
 			"id" : int
 			"pem" : str
+			"rid" : int
+			"load" : int (opcional)
 		}
 		"""
-		status, ID = verify_tag(data, "id", int)
-		if not status: raise Exception(ID)
+		with self.mutex:
+			health.success(time.monotonic() - start)
+			if type(data.get("load")) == int: self.hub_loads[hub] = data["load"]
+		if "error" in data: raise Exception(str(data["error"]))
+		status, answered = verify_tag(data, "id", int)
+		if not status: raise Exception(answered)
+		if answered != ID: raise Exception(f"Asked hub {hub} for node {ID} but got node {answered}")
 		status, pem = verify_tag(data, "pem", str)
 		if not status: raise Exception(pem)
 		public_key = PublicKey(pem=pem.encode())
+		if self.gossip and not is_hub(ID) and "sig" in data:
+			with self.mutex: self.learn(ID, data.get("epoch"), pem, data["sig"], data.get("issued"))
 		return public_key
+
+	def learn(self, ID, epoch, pem, sig, issued):
+		"""
+		Incorpora una llave certificada por el hub (se asume que el mutex está tomado).
+
+		Solo se aceptan llaves firmadas por el hub y de una época igual o más
+		nueva que la conocida, por lo que un vecino no puede inyectar llaves
+		ni volver a una llave ya rotada.
+
+		@param ID La identificación del nodo
+		@param epoch La época de la llave
+		@param pem La llave en formato PEM
+		@param sig La firma del hub en base64
+		@param issued El momento (time.time) en que el hub registró la llave
+		@return Si la llave era nueva para este nodo
+		"""
+
+		if type(ID) != int or type(epoch) != int or type(pem) != str or type(sig) != str: return False
+		if is_hub(ID) or self.hub_key is None: return False
+		current = self.certificates.get(ID)
+		if epoch < self.floors.get(ID, 0) or (current is not None and (epoch, pem) == current[:2]): return False
+		if current is not None and epoch < current[0]: return False
+		if not self.hub_key.verify(base64.b64decode(sig.encode()), MeshHub.certificate(ID, epoch, pem)):
+			self.gossip_stats["rejected"] += 1
+			return False
+		self.keys.put(ID, PublicKey(pem=pem.encode()))
+		self.certificates.pop(ID, None)
+		self.certificates[ID] = (epoch, pem, sig, issued)
+		self.gossip_stats["learned"] += 1
+		if type(issued) in (int, float):
+			elapsed = max(time.time() - issued, 0.0)
+			self.gossip_stats["convergence"] = LinkHealth.average(self.gossip_stats["convergence"], elapsed)
+			self.gossip_stats["max_convergence"] = max(self.gossip_stats["max_convergence"], elapsed)
+		return True
+
+	def spread(self):
+		"""
+		Envía a los vecinos las llaves certificadas aprendidas más recientemente.
+		"""
+
+		if self.hub_key is None or self.node.router is None: return
+		with self.mutex:
+			recent = list(self.certificates.items())[-MeshNode.gossip_fanout:]
+			entries = [[ID, epoch, pem, sig, issued] for ID, (epoch, pem, sig, issued) in recent]
+		if not entries: return
+		message = json.dumps({"entries" : entries})
+		neighbors = [ID for ID, dist in self.node.router.routes().items() if dist == 1 and not is_hub(ID)]
+		for ID in neighbors: self.sends(ID, "gossip", message)
+		with self.mutex: self.gossip_stats["sent"] += len(neighbors)
+
+	def gossiping(self, switch):
+		"""
+		Ejecuta rondas de gossip periódicamente.
+
+		@param switch El indicador de terminación para el thread
+		"""
+
+		while not switch.wait(MeshNode.gossip_interval):
+			try:
+				self.spread()
+			except Exception as e:
+				logging.warning(f"Couldn't gossip keys: {str(e)}")
 	
 	def __send(self, dest, mtype, message):
 		"""
@@ -328,34 +1164,144 @@ class MeshNode(Node):
 		"""
 
 		if self.hub_key is None: raise Exception("Node is not yet joined")
-		key = self.request(dest) if self.encrypt else None
-		self.node.send(dest, mtype, message, public_key=key)
+		session, key = self.protection(dest)
+		self.node.send(dest, mtype, message, public_key=key, session=session)
+
+	def protection(self, dest):
+		"""
+		Determina cómo se cifran los mensajes hacia un destino.
+
+		@param dest El destinario
+		@return La tupla (sesión, llave pública), con None en lo que no se usa
+		"""
+
+		session = self.session(dest) if self.encrypt else None
+		if session is not None: return session, None
+		return None, self.keys.get(dest, self.request) if self.encrypt else None
+
+	def session(self, dest):
+		"""
+		Devuelve la sesión cifrada con un nodo, negociándola si hace falta.
+
+		@param dest La identificación del nodo
+		@return La sesión o None si se debería usar la llave pública del nodo
+		"""
+
+		if self.sessions is None or is_hub(dest) or dest == Node.BROADCAST: return None
+		session = self.sessions.get(dest)
+		if session is not None: return session
+		if not self.sessions.available(dest): return None
+		key = self.keys.get(dest, self.request)
+		message, future = self.sessions.start(dest, key)
+		try:
+			if message is not None: self.node.send(dest, "session_init", message, public_key=key)
+			return future.result(timeout=SessionManager.timeout)
+		except Exception as e:
+			logging.info(f"Couldn't establish a session with {dest}: {str(e)}")
+			self.sessions.fail(dest, future, e)
+			return None
+
+	def stats(self):
+		"""
+		Devuelve las estadísticas del nodo.
+
+		@return Un diccionario con las estadísticas
+		"""
+
+		return {
+			"node" : self.node.stats(),
+			"executor" : self.executor.stats(),
+			"keys" : self.keys.stats(),
+			"pending" : self.pending.stats(),
+			"sessions" : self.sessions.stats() if self.sessions is not None else None,
+			"inbox" : self.inbox.stats(),
+			"fragments" : dict(self.reassembly.stats(), **self.sent_fragments.stats()),
+			"hubs" : {ID: health.state() for ID, health in self.hub_health.items()},
+			"failovers" : self.failovers,
+			"join_time" : self.join_time,
+			"gossip" : dict(self.gossip_stats, known=len(self.certificates)) if self.gossip else None,
+			}
 	
 	def sends(self, dest, mtype, message):
 		"""
-		Método que genera un thread para enviar un mensaje a la red (para evitar deadlocks).
+		Método que agenda el envío de un mensaje a la red en el executor (para evitar deadlocks).
 
 		@param dest El destinario
 		@param mtype El tipo de mensaje
 		@param message El cuerpo del mensaje
+		@return El Future del envío
 		"""
 
-		Thread(target=self.__send, args=(dest, mtype, message,), daemon=True).start()
+		return self.executor.submit(self.__send, dest, mtype, message)
 	
 	def join(self):
 		"""
 		Ejecuta la conexión a la red mesh.
+
+		El hub responde con un join_ack que trae su llave, por lo que el join
+		toma un viaje de ida y vuelta. Si no llega a tiempo se reintenta (con
+		la siguiente réplica, si hay varias) duplicando la espera. Si el nodo
+		recuperó de disco la llave del hub, solo le vuelve a anunciar su llave
+		(por si el hub la olvidó) sin esperar respuesta.
+		"""
+
+		hubs = self.hubs()
+		pem = str(self.private_key.public_key())
+		with self.mutex: restored = self.hub_key is not None
+		if restored:
+			self.basic_send(hubs[0], "join", json.dumps({"id" : self.node.info.ID, "pem" : pem}))
+			return
+		start = time.monotonic()
+		for attempt in range(MeshNode.join_retries):
+			hub = hubs[attempt % len(hubs)]
+			with self.mutex: health = self.hub_health.setdefault(hub, LinkHealth())
+			rid, future = self.pending.open()
+			sent = time.monotonic()
+			self.basic_send(hub, "join", json.dumps({"id" : self.node.info.ID, "pem" : pem, "rid" : rid}))
+			try:
+				packet = future.result(MeshNode.join_timeout * (1 << attempt))
+			except concurrent.futures.TimeoutError:
+				future.cancel()
+				with self.mutex: health.failure()
+				logging.info(f"Join attempt {attempt + 1} with hub {hub} timed out")
+				continue
+			with self.mutex: health.success(time.monotonic() - sent)
+			data = json.loads(packet.body)
+			"""
+			{
+				"rid" : int
+				"pem" : str
+				"error" : str (opcional)
+			}
+			"""
+			if "error" in data: raise Exception(str(data["error"]))
+			status, hub_pem = verify_tag(data, "pem", str)
+			if not status: raise Exception(hub_pem)
+			key = PublicKey(pem=hub_pem.encode())
+			break
+		else:
+			raise Exception("Join timeout")
+		for ID in set(hubs) | {hub}: self.keys.put(ID, key)
+		with self.mutex:
+			self.hub_key = key
+			self.join_time = time.monotonic() - start
+		if self.gossip: self.request(self.node.info.ID)
+		self.save()
+
+	def save(self):
+		"""
+		Guarda en disco la identidad del nodo, la llave del hub y las llaves aprendidas (si se pidió persistencia).
 		"""
 
+		if self.state is None: return
+		data = {
+			"id" : self.node.info.ID,
+			"private_key" : self.private_key.pem(),
+			"keys" : {str(ID): str(key) for ID, key in self.keys.snapshot().items()},
+			}
 		with self.mutex:
-			message = json.dumps({
-				"id" : self.node.info.ID,
-				"pem" : str(self.private_key.public_key())
-				})
-			self.basic_send(0, "join", message)
-		time.sleep(0.5)
-		key = self.request(0)
-		with self.mutex: self.hub_key = key
+			if self.hub_key is not None: data["hub_key"] = str(self.hub_key)
+		self.state.save(data)
 	
 	def ping(self, ID):
 		"""
@@ -364,24 +1310,90 @@ class MeshNode(Node):
 		@param ID Algún nodo
 		"""
 
-		with self.mutex:
-			if (ID, "pong") not in self.awaits: self.awaits[(ID, "pong")] = PacketWaiter()
-			waiter = self.awaits[(ID, "pong")]
-		if self.hub_key is None: self.basic_send(ID, "ping", "")
-		else: self.sends(ID, "ping", "")
-		packet = waiter.recv()
-		if packet.is_null(): return False
+		future = self.ping_future(ID)
+		try:
+			packet = future.result(PacketWaiter.timeout)
+		except concurrent.futures.TimeoutError:
+			future.cancel()
+			return False
 		return packet.src == ID
 
+	def ping_future(self, ID):
+		"""
+		Envía un ping a un nodo sin esperar la respuesta.
+
+		@param ID Algún nodo
+		@return El Future que se completa con el paquete pong
+		"""
+
+		rid, future = self.pending.open()
+		message = json.dumps({"rid" : rid})
+		if self.hub_key is None: self.basic_send(ID, "ping", message)
+		else: self.sends(ID, "ping", message)
+		return future
+
 	def send_data(self, dest, message):
 		"""
 		Envia un paquete de tipo data.
 
+		Los mensajes cuyo paquete no entraría en el MTU de la conexión hacia el
+		destino se envían en fragmentos que el destino rearma.
+
 		@param dest El destinario del paquete
 		@param message El cuerpo del mensaje
+		@return El Future del envío
+		"""
+
+		text = type(message) == str
+		data = message.encode() if text else message
+		limit = min((link.protocol.mtu for link in self.node.exits(dest)), default=Protocol.mtu)
+		if dest == Node.BROADCAST or len(data) * 4 // 3 + Node.max_overhead <= limit: return self.sends(dest, "data", message)
+		return self.executor.submit(self.__send_data, dest, bytes(data), text)
+
+	def __send_data(self, dest, data, text):
+		"""
+		Método privado que envía un mensaje data, fragmentándolo si no entra en un paquete.
+
+		@param dest El destinario del paquete
+		@param data El cuerpo del mensaje en bytes
+		@param text Si el mensaje original era texto
+		"""
+
+		if self.hub_key is None: raise Exception("Node is not yet joined")
+		session, key = self.protection(dest)
+		size = self.node.mtu(dest, "fragment", FRAGMENT_HEADER.size, public_key=key, session=session)
+		if len(data) <= size:
+			self.node.send(dest, "data", data.decode() if text else data, public_key=key, session=session)
+			return
+		fid = new_message_id()
+		fragments = split(data, size)
+		self.sent_fragments.put(fid, dest, fragments, text)
+		self.send_fragments(dest, fid, len(fragments), text, list(enumerate(fragments)))
+
+	def send_fragments(self, dest, fid, count, text, fragments):
+		"""
+		Envía fragmentos de un mensaje.
+
+		@param dest El destinario
+		@param fid El identificador del mensaje fragmentado
+		@param count La cantidad total de fragmentos del mensaje
+		@param text Si el mensaje original era texto
+		@param fragments La lista de tuplas (índice, fragmento) a enviar
+		"""
+
+		for index, data in fragments:
+			self.__send(dest, "fragment", pack_fragment(fid, index, count, text, data))
+
+	def request_fragments(self, switch):
+		"""
+		Pide periódicamente los fragmentos perdidos de los mensajes incompletos.
+
+		@param switch El indicador de terminación para el thread
 		"""
 
-		self.sends(dest, "data", message)
+		while not switch.wait(self.reassembly.nack_after / 2):
+			for src, fid, lost in self.reassembly.missing():
+				self.sends(src, "fragment_nack", json.dumps({"fid" : fid, "missing" : lost}))
 	
 	def recv_data(self, ID=None, timeout=None):
 		"""
@@ -392,14 +1404,24 @@ class MeshNode(Node):
 		@return La tupla de (ID fuente, texto del cuerpo)
 		"""
 
-		with self.mutex:
-			waiter = None
-			if (ID, "data") not in self.awaits: self.awaits[(ID, "data")] = PacketWaiter()
-			waiter = self.awaits[(ID, "data")]
-		packet = waiter.recv(timeout)
-		if packet.is_null(): raise Exception(packet.body)
+		if timeout is None: timeout = PacketWaiter.timeout
+		packet = self.inbox.get(ID, timeout)
+		if packet is None: raise Exception("Timeout")
 		return packet.src, packet.body
 
+	def recv_many(self, ID=None, limit=64, timeout=None):
+		"""
+		Recibe de una vez varios paquetes de tipo data que ya estén en espera.
+
+		@param ID La identificación del nodo fuente (o nulo si se puede recibir un mensaje de cualquiera)
+		@param limit La cantidad máxima de mensajes a recibir
+		@param timeout El tiempo máximo de espera por el primer mensaje
+		@return La lista de tuplas (ID fuente, texto del cuerpo), vacía si se acabó el tiempo
+		"""
+
+		if timeout is None: timeout = PacketWaiter.timeout
+		return [(packet.src, packet.body) for packet in self.inbox.get_many(ID, limit, timeout)]
+
 	def connect(self, ID, protocol, dest):
 		"""
 		Ejecuta una solicitud de conexión a otro nodo en el mesh.
@@ -410,10 +1432,12 @@ class MeshNode(Node):
 		"""
 
 		link = Link(dest, protocol)
-		self.node.info.add_neighbor(link)
+		self.node.add_link(link, ID)
 		message = json.dumps({
 			"protocol" : protocol.protocol_type.name,
-			"dest" : protocol.public()
+			"dest" : protocol.public(),
+			"id" : self.node.info.ID,
+			"compress" : self.node.offer(),
 			})
 		link.send(Packet(-1, ID, "connect", message))
 
@@ -429,6 +1453,9 @@ class MeshNode(Node):
 		{
 			"protocol" : str
 			"dest" : str
+			"id" : int (opcional)
+			"compress" : list (opcional)
+			"reply" : bool (opcional)
 		}
 		"""
 		status, protocol = verify_tag(data, "protocol", str)
@@ -437,6 +1464,8 @@ class MeshNode(Node):
 		if not status: raise Exception(dest)
 		link = Link(dest, empty_protocol_from_str(protocol))
 		self.node.info.add_neighbor(link)
+		reply = self.node.negotiate(link, data)
+		if reply is not None: self.executor.submit(link.send, reply)
 
 	def process_ping(self, packet):
 		"""
@@ -445,7 +1474,8 @@ class MeshNode(Node):
 		@param packet El paquete recibido
 		"""
 
-		self.sends(packet.src, "pong", "")
+		rid = PendingRequests.rid_of(packet)
+		self.sends(packet.src, "pong", "" if rid is None else json.dumps({"rid" : rid}))
 
 	def process_pong(self, packet):
 		"""
@@ -454,9 +1484,8 @@ class MeshNode(Node):
 		@param packet El paquete recibido
 		"""
 
-		if (packet.src, packet.mtype) in self.awaits:
-			waiter = self.awaits.pop((packet.src, packet.mtype))
-			with waiter: waiter.send(packet)
+		rid = PendingRequests.rid_of(packet)
+		if rid is not None: self.pending.resolve(rid, packet)
 	
 	def process_answer(self, packet):
 		"""
@@ -465,12 +1494,121 @@ class MeshNode(Node):
 		@param packet El paquete recibido
 		"""
 
+		if not is_hub(packet.src): return
+		rid = PendingRequests.rid_of(packet)
+		if rid is not None: self.pending.resolve(rid, packet)
+
+	def process_join_ack(self, packet):
+		"""
+		Procesa la respuesta del hub a un join.
+
+		@param packet El paquete recibido
+		"""
+
+		if not is_hub(packet.src): return
+		rid = PendingRequests.rid_of(packet)
+		if rid is not None: self.pending.resolve(rid, packet)
+
+	def process_rekey(self, packet):
+		"""
+		Procesa el aviso del hub de que un nodo cambió de llave.
+
+		Los avisos de una época que ya se conoce (por un aviso anterior o por
+		el certificado de la llave nueva) se ignoran, por lo que repetir un
+		aviso capturado no vuelve a descartar la llave ni las sesiones.
+
+		@param packet El paquete recibido
+		"""
+
+		if not is_hub(packet.src) or self.hub_key is None: return
 		data = json.loads(packet.body)
+		"""
+		{
+			"id" : int
+			"epoch" : int
+			"sig" : str
+		}
+		"""
 		status, ID = verify_tag(data, "id", int)
 		if not status: raise Exception(ID)
-		if (ID, packet.mtype) in self.awaits:
-			waiter = self.awaits.pop((ID, packet.mtype))
-			with waiter: waiter.send(packet)
+		status, epoch = verify_tag(data, "epoch", int)
+		if not status: raise Exception(epoch)
+		status, sig = verify_tag(data, "sig", str)
+		if not status: raise Exception(sig)
+		if not self.hub_key.verify(base64.b64decode(sig.encode()), MeshHub.rekey_notice(ID, epoch)):
+			raise Exception("Bad rekey signature")
+		if epoch <= self.floors.get(ID, 0) or (ID in self.certificates and self.certificates[ID][0] >= epoch): return
+		self.keys.invalidate(ID)
+		self.certificates.pop(ID, None)
+		self.floors[ID] = epoch
+		if self.sessions is not None: self.sessions.forget(ID)
+
+	def process_session_init(self, packet):
+		"""
+		Responde a la solicitud de otro nodo de negociar una sesión.
+
+		@param packet El paquete recibido
+		"""
+
+		message = self.sessions.respond(packet.src, packet.body)
+		key = self.keys.get(packet.src, self.request)
+		self.node.send(packet.src, "session_ack", message, public_key=key)
+
+	def process_session_ack(self, packet):
+		"""
+		Procesa la respuesta de otro nodo a la negociación de una sesión.
+
+		@param packet El paquete recibido
+		"""
+
+		self.sessions.complete(packet.src, packet.body)
+
+	def process_gossip(self, packet):
+		"""
+		Procesa las llaves certificadas que envía un vecino.
+
+		@param packet El paquete recibido
+		"""
+
+		if not self.gossip: return
+		data = json.loads(packet.body)
+		"""
+		{
+			"entries" : [[int, int, str, str, float]] (ID, época, pem, firma, registro)
+		}
+		"""
+		status, entries = verify_tag(data, "entries", list)
+		if not status: raise Exception(entries)
+		for entry in entries:
+			if type(entry) == list and len(entry) == 5: self.learn(*entry)
+
+	def process_fragment(self, packet):
+		"""
+		Procesa un fragmento de un mensaje data.
+
+		@param packet El paquete recibido
+		"""
+
+		fid, index, count, text, body = unpack_fragment(packet.body)
+		pace = self.node.transfer_time(packet.src, packet.size())
+		message = self.reassembly.put(packet.src, fid, index, count, body, pace)
+		if message is not None and text: message = message.decode()
+		if message is not None: self.process_data(Packet(packet.src, packet.dest, "data", message, mid=packet.mid))
+
+	def process_fragment_nack(self, packet):
+		"""
+		Reenvía los fragmentos que el destino no recibió.
+
+		@param packet El paquete recibido
+		"""
+
+		data = json.loads(packet.body)
+		status, fid = verify_tag(data, "fid", int)
+		if not status: raise Exception(fid)
+		status, lost = verify_tag(data, "missing", list)
+		if not status: raise Exception(lost)
+		count, text, fragments = self.sent_fragments.get(fid, packet.src, lost)
+		if fragments: self.executor.submit(self.send_fragments, packet.src, fid, count, text, fragments)
 
 	def process_data(self, packet):
 		"""
@@ -479,12 +1617,7 @@ class MeshNode(Node):
 		@param packet El paquete recibido
 		"""
 
-		if (packet.src, packet.mtype) in self.awaits:
-			waiter = self.awaits.pop((packet.src, packet.mtype))
-			with waiter: waiter.send(packet)
-		elif (None, packet.mtype) in self.awaits:
-			waiter = self.awaits.pop((None, packet.mtype))
-			with waiter: waiter.send(packet)
+		self.inbox.put(packet)
 
 	def delegate(self, packet):
 		"""
@@ -494,15 +1627,35 @@ class MeshNode(Node):
 		@return Si se puede propagar el paquete a los vecinos o no
 		"""
 
+		if packet.mtype == "data":
+			self.process_data(packet)
+			return True
+		if packet.mtype == "fragment":
+			try:
+				self.process_fragment(packet)
+			except Exception as e:
+				logging.warning(f"Couldn't process a fragment: {str(e)}")
+			return True
+		if packet.mtype in ("ping", "fragment_nack"):
+			try:
+				if packet.mtype == "ping": self.process_ping(packet)
+				if packet.mtype == "fragment_nack": self.process_fragment_nack(packet)
+			except Exception as e:
+				logging.warning(f"Couldn't process a {packet.mtype}: {str(e)}")
+			return True
 		with self.mutex:
 			try:
 				if packet.mtype == "connect":
 					self.process_connect(packet)
 					return False
-				if packet.mtype == "ping": self.process_ping(packet)
 				if packet.mtype == "pong": self.process_pong(packet)
 				if packet.mtype == "answer": self.process_answer(packet)
-				if packet.mtype == "data": self.process_data(packet)
+				if packet.mtype == "join_ack": self.process_join_ack(packet)
+				if packet.mtype == "rekey": self.process_rekey(packet)
+				if packet.mtype == "gossip": self.process_gossip(packet)
+				if self.sessions is not None and packet.mtype == "session_init":
+					self.control.submit(self.process_session_init, packet)
+				if self.sessions is not None and packet.mtype == "session_ack": self.process_session_ack(packet)
 			except Exception as e:
 				logging.warning("Couldn't process a message properly...")
 				logging.error(str(e))
@@ -514,6 +1667,8 @@ class MeshNode(Node):
 		"""
 
 		self.node.listen()
+		if self.gossip: Thread(target=self.gossiping, args=[self.node.switch], daemon=True).start()
+		Thread(target=self.request_fragments, args=[self.node.switch], daemon=True).start()
 	
 	def kill(self):
 		"""
@@ -521,4 +1676,10 @@ class MeshNode(Node):
 		"""
 
 		self.node.kill()
+		if self.owns_executor: self.executor.shutdown()
+		self.control.shutdown()
+		try:
+			self.save()
+		except Exception as e:
+			logging.warning(f"Couldn't save the node state: {str(e)}")
 
@@ -1,8 +1,16 @@
-from threading import Thread, Lock
+from threading import Thread, Lock, Event
+import os
 import time
+import json
+import logging
 import hashlib
 from wavenetcore.WaveNetPacketeering import *
 from wavenetcore.WaveNetProtocols import *
+from wavenetcore.WaveNetCache import *
+from wavenetcore.WaveNetForwarding import *
+from wavenetcore.WaveNetRouting import *
+from wavenetcore.WaveNetHealth import *
+from wavenetcore.WaveNetCompression import *
 
 class NodeInfo:
 	"""
@@ -21,6 +29,8 @@ class NodeInfo:
 		self.ID = ID
 		self.neighbors = neighbors if neighbors is not None else set()
 		self.private_key = private_key
+		self.health = dict()
+		self.codecs = dict()
 		self.mutex = Lock()
 	
 	def add_neighbor(self, link):
@@ -32,7 +42,54 @@ class NodeInfo:
 
 		with self.mutex:
 			self.neighbors.add(link)
+
+	def remove_neighbor(self, link):
+		"""
+		Elimina un vecino.
+
+		@param link La conexión al vecino
+		"""
+
+		with self.mutex:
+			self.neighbors.discard(link)
+			self.health.pop(link, None)
+			self.codecs.pop(link, None)
+
+	def get_health(self, link):
+		"""
+		Devuelve el estado de salud de la conexión a un vecino.
+
+		@param link La conexión al vecino
+		@return El LinkHealth de la conexión
+		"""
+
+		with self.mutex:
+			if link not in self.health: self.health[link] = LinkHealth(link.protocol.latency, link.protocol.throughput)
+			return self.health[link]
 	
+	def set_codec(self, link, name):
+		"""
+		Guarda el códec de compresión acordado con un vecino.
+
+		@param link La conexión al vecino
+		@param name El nombre del códec (o None si no se comprime)
+		"""
+
+		with self.mutex:
+			if name is None: self.codecs.pop(link, None)
+			elif link not in self.codecs or self.codecs[link].name != name: self.codecs[link] = LinkCodec(name)
+
+	def get_codec(self, link):
+		"""
+		Devuelve el códec de compresión acordado con un vecino.
+
+		@param link La conexión al vecino
+		@return El LinkCodec de la conexión (o None si no se comprime)
+		"""
+
+		with self.mutex:
+			return self.codecs.get(link)
+
 	def get_neighbors(self):
 		"""
 		Devuelve los vecinos actuales.
@@ -47,19 +104,41 @@ class Node:
 	Clase que maneja la interacción básica entre nodos.
 	"""
 
-	def __init__(self, info, protocols, process):
+	BROADCAST = -1 # Destino de los paquetes que procesan todos los nodos
+	route_refresh = 30.0 # En segundos
+	probe_interval = 1.0 # En segundos
+	prune_after = 300.0 # En segundos
+	probe_size = 48 # Bytes de cuerpo del paquete de prueba con el que se mide cuánto crece un frame
+	max_overhead = 1024 # Cota de los bytes que agregan el paquete y el cifrado a un cuerpo
+	json_slack = 24 # Bytes que pueden variar entre paquetes json (los números no tienen largo fijo)
+
+	def __init__(self, info, protocols, process, messages=None, forwarder=None, routing=True, sessions=None, batching=False, compression=False):
 		"""
 		Constructor para los nodos.
 
 		@param info El contenedor de información del nodo
 		@param protocols Los protocolos disponibles al nodo
 		@param process La función que procesa todos los paquetes destinados para este nodo
+		@param messages El cache de mensajes vistos (por defecto un MessageCache)
+		@param forwarder La etapa de reenvío a los vecinos (por defecto un Forwarder)
+		@param routing Si se deberían usar tablas de rutas en vez de inundar todos los paquetes
+		@param sessions Las sesiones cifradas con otros nodos (o None si no se usan)
+		@param batching Si el forwarder por defecto debería juntar en frames los paquetes hacia un mismo vecino
+		@param compression Si se debería ofrecer compresión a los vecinos al conectarse
 		"""
 
 		self.info = info
 		self.protocols = {i.protocol_type: i for i in protocols}
 		self.process = process
-		self.messages = set()
+		self.messages = messages if messages is not None else MessageCache()
+		self.forwarder = forwarder if forwarder is not None else Forwarder(batching=batching)
+		self.forwarder.on_result = self.link_result
+		self.router = Router(info.ID) if routing else None
+		self.sessions = sessions
+		self.compression = compression
+		self.expired = 0
+		self.relayed = 0
+		self.switch = Event()
 		self.mutex = Lock()
 	
 	def listen(self):
@@ -68,6 +147,9 @@ class Node:
 		"""
 
 		for protocol_type, protocol in self.protocols.items(): protocol.listen(self.recv)
+		self.switch.clear()
+		if self.router is not None: Thread(target=self.refresh_routes, args=[self.switch], daemon=True).start()
+		Thread(target=self.maintain_links, args=[self.switch], daemon=True).start()
 	
 	def kill(self):
 		"""
@@ -75,29 +157,220 @@ class Node:
 		"""
 
 		for protocol_type, protocol in self.protocols.items(): protocol.kill()
+		self.switch.set()
+		self.forwarder.shutdown()
+
+	def add_link(self, link, ID=None):
+		"""
+		Añade una conexión a un vecino y le anuncia las rutas conocidas.
+
+		@param link La conexión al vecino
+		@param ID La identificación del vecino (si se conoce)
+		"""
+
+		self.info.add_neighbor(link)
+		if self.router is None or ID is None: return
+		self.router.add_link(link, ID)
+		self.advertise()
+
+	def advertise(self):
+		"""
+		Anuncia el vector de distancias a todos los vecinos conocidos.
+		"""
+
+		if self.router is None: return
+		for link, ID in self.router.adjacent():
+			via = self.via(link)
+			if not via: continue
+			message = json.dumps({
+				"protocol" : link.protocol.protocol_type.name,
+				"dest" : via,
+				"routes" : self.router.vector_for(ID),
+				})
+			packet = Packet(self.info.ID, ID, "route", message)
+			with self.mutex: self.messages.add(packet.mid)
+			self.forwarder.submit(link, packet)
+
+	def refresh_routes(self, switch):
+		"""
+		Reenvía los anuncios de rutas periódicamente.
+
+		@param switch El indicador de terminación para el thread
+		"""
+
+		while not switch.wait(Node.route_refresh): self.advertise()
+
+	def process_route(self, packet):
+		"""
+		Procesa el anuncio de rutas de un vecino.
+
+		@param packet El paquete recibido
+		"""
+
+		data = json.loads(packet.body)
+		"""
+		{
+			"protocol" : str
+			"dest" : str
+			"routes" : dict
+		}
+		"""
+		status, protocol = verify_tag(data, "protocol", str)
+		if not status: raise Exception(protocol)
+		status, dest = verify_tag(data, "dest", str)
+		if not status: raise Exception(dest)
+		status, routes = verify_tag(data, "routes", dict)
+		if not status: raise Exception(routes)
+		link = Link(dest, empty_protocol_from_str(protocol))
+		self.info.add_neighbor(link)
+		added = self.router.add_link(link, packet.src)
+		changed = self.router.update(packet.src, routes)
+		if added or changed: self.advertise()
+
+	def offer(self):
+		"""
+		Devuelve los códecs de compresión que se ofrecen al conectarse.
+
+		@return La lista de nombres de códecs
+		"""
+
+		return [CODEC] if self.compression else []
+
+	def negotiate(self, link, data):
+		"""
+		Acuerda la compresión con un vecino a partir de su solicitud de conexión.
+
+		Quien se conecta ofrece sus códecs y el otro responde con el elegido
+		(o ninguno); la respuesta no se vuelve a responder. Los nodos que no
+		ofrecen nada no reciben respuesta, por lo que los nodos viejos siguen
+		funcionando sin compresión.
+
+		@param link La conexión al vecino
+		@param data El json de la solicitud de conexión
+		@return El paquete de respuesta para el vecino o None si no hace falta responder
+		"""
+
+		offered = data.get("compress")
+		if type(offered) != list: return None
+		codec = CODEC if self.compression and CODEC in offered else None
+		self.info.set_codec(link, codec)
+		if data.get("reply") is True or type(data.get("id")) != int: return None
+		via = self.via(link)
+		if not via: return None
+		message = json.dumps({
+			"protocol" : link.protocol.protocol_type.name,
+			"dest" : via,
+			"compress" : [codec] if codec is not None else [],
+			"reply" : True,
+			})
+		return Packet(-1, data["id"], "connect", message)
+
+	def link_result(self, link, packet, error, elapsed):
+		"""
+		Actualiza la salud de una conexión y las rutas según el resultado de un envío.
+
+		@param link La conexión utilizada
+		@param packet El paquete enviado
+		@param error La excepción del envío o None si fue exitoso
+		@param elapsed La duración del envío en segundos
+		"""
+
+		health = self.info.get_health(link)
+		size = packet.size()
+		if error is None: health.success(elapsed, size)
+		else: health.failure()
+		if self.router is None: return
+		changed = self.router.link_down(link) if error is not None else self.router.link_up(link)
+		if changed: self.advertise()
+
+	def maintain_links(self, switch):
+		"""
+		Sondea las conexiones en cuarentena y elimina las que llevan demasiado tiempo muertas.
+
+		@param switch El indicador de terminación para el thread
+		"""
+
+		while not switch.wait(Node.probe_interval):
+			for link in self.info.get_neighbors():
+				health = self.info.get_health(link)
+				if health.quarantined() and health.dead_for() >= Node.prune_after:
+					logging.info(f"Pruning dead link {link}")
+					self.remove_link(link)
+				elif health.should_probe():
+					health.probing()
+					self.forwarder.submit(link, Packet(self.info.ID, -1, "probe", ""))
+
+	def remove_link(self, link):
+		"""
+		Elimina la conexión a un vecino.
 
-	def recv(self, original):
+		@param link La conexión al vecino
+		"""
+
+		self.info.remove_neighbor(link)
+		if self.router is not None and self.router.remove_link(link): self.advertise()
+
+	def recv(self, original, link=None):
 		"""
 		Método para procesar paquetes entrantes
 
 		@param original El paquete
+		@param link La conexión por la que llegó el paquete (si se conoce)
 		"""
 
+		if type(original) == BatchPacket:
+			for packet in original.packets:
+				if type(packet) != BatchPacket: self.recv(packet, link)
+			return
+
 		with self.mutex:
-			packet = original
+			if self.messages.check(original.mid): return
 
-			if hash(packet) in self.messages: return
-			self.messages.add(hash(packet))
+		packet = original
 
-			if type(packet) == SecretPacket: packet = decrypt_packet(packet, self.info.private_key)
-			if type(packet) == Packet and packet.is_null(): return
+		if type(packet) == Packet and packet.mtype == "probe": return
 
-			should_prop = True
+		if type(packet) == Packet and packet.mtype == "route":
+			if packet.dest != self.info.ID or self.router is None: return
+			try:
+				self.process_route(packet)
+			except Exception as e:
+				logging.warning("Couldn't process a route advertisement properly...")
+				logging.error(str(e))
+			return
 
-			if type(packet) == Packet and packet.dest == self.info.ID: should_prop = self.process(packet)
-			if should_prop: self.prop(original)
+		if type(packet) == SecretPacket and packet.dest != self.info.ID and packet.dest != Node.BROADCAST:
+			with self.mutex: self.relayed += 1
+			self.prop(original, exclude=link)
+			return
+
+		if type(packet) == SecretPacket:
+			packet = self.decrypt(packet)
+			if type(packet) == SecretPacket and packet.dest == self.info.ID: return
+		if type(packet) == Packet and packet.is_null(): return
+		if type(packet) == Packet and packet.dest in (self.info.ID, Node.BROADCAST) and not packet.decodes(): return
+
+		should_prop = True
+
+		if type(packet) == Packet and packet.dest == self.info.ID:
+			should_prop = self.process(packet) and self.router is None
+		elif type(packet) == Packet and packet.dest == Node.BROADCAST: self.process(packet)
+		if should_prop: self.prop(original, exclude=link)
 		
-	def send(self, dest, mtype, message, show_src=True, public_key=None):
+	def decrypt(self, packet):
+		"""
+		Decifra un paquete cifrado, ya sea con una sesión o con la llave privada.
+
+		@param packet El paquete cifrado
+		@return El paquete decifrado (o el mismo paquete si no es para este nodo)
+		"""
+
+		if packet.sid:
+			if self.sessions is None: return packet
+			return self.sessions.decrypt_packet(packet)
+		return decrypt_packet(packet, self.info.private_key)
+
+	def send(self, dest, mtype, message, show_src=True, public_key=None, session=None):
 		"""
 		Envía un mensaje a la red de nodos.
 
@@ -106,22 +379,216 @@ class Node:
 		@param message El cuerpo del mensaje
 		@param show_src Determina si se debería incluir el emisor
 		@param public_key La llave pública a utilizar para cifrar
+		@param session La sesión a utilizar para cifrar (tiene prioridad sobre la llave pública)
 		"""
 
-		with self.mutex:
-			src = self.info.ID if show_src else -1
-			packet = Packet(src, dest, mtype, message)
-			if public_key is not None:
-				packet = encrypt_packet(packet, public_key)
-				if type(packet) == Packet:return
-			self.messages.add(hash(packet))
-			self.prop(packet)
+		packet = self.wrap(dest, mtype, message, show_src, public_key, session)
+		if packet is None: return
+		with self.mutex: self.messages.add(packet.mid)
+		self.prop(packet)
+
+	def wrap(self, dest, mtype, message, show_src=True, public_key=None, session=None):
+		"""
+		Arma (y cifra si corresponde) el paquete de un mensaje.
+
+		@param dest El destinario
+		@param mtype El tipo del mensaje
+		@param message El cuerpo del mensaje
+		@param show_src Determina si se debería incluir el emisor
+		@param public_key La llave pública a utilizar para cifrar
+		@param session La sesión a utilizar para cifrar (tiene prioridad sobre la llave pública)
+		@return El paquete o None si no se pudo cifrar
+		"""
+
+		src = self.info.ID if show_src else -1
+		encrypted = session is not None or public_key is not None
+		packet = Packet(src, dest, mtype, message, codec=self.codec_for(dest) if encrypted else None)
+		if session is not None: return session.encrypt_packet(packet)
+		if public_key is not None:
+			packet = encrypt_packet(packet, public_key)
+			if type(packet) == Packet: return None
+		return packet
+
+	def stats(self):
+		"""
+		Devuelve las estadísticas del nodo.
+
+		@return Un diccionario con las estadísticas
+		"""
+
+		with self.mutex: messages, expired, relayed = self.messages.stats(), self.expired, self.relayed
+		return {
+			"messages" : messages,
+			"expired" : expired,
+			"relayed" : relayed,
+			"links" : {str(link): self.link_stats(link) for link in self.info.get_neighbors()},
+			"forwarding" : self.forwarder.stats(),
+			"routing" : self.router.stats() if self.router is not None else None,
+			"sessions" : self.sessions.stats() if self.sessions is not None else None,
+			}
 
-	def prop(self, packet):
+	def link_stats(self, link):
+		"""
+		Devuelve las estadísticas de la conexión a un vecino.
+
+		@param link La conexión al vecino
+		@return Un diccionario con la salud y la compresión de la conexión
+		"""
+
+		codec = self.info.get_codec(link)
+		return dict(self.info.get_health(link).stats(), compression=codec.stats() if codec is not None else None)
+
+	def via(self, link):
+		"""
+		Devuelve la dirección pública con la que un vecino ve a este nodo.
+
+		@param link La conexión al vecino
+		@return La dirección pública (o un string vacío si no se escucha en ese protocolo)
 		"""
-		Propaga un paquete a todos sus vecinos.
+
+		protocol_type = link.protocol.protocol_type
+		if protocol_type not in self.protocols: return ""
+		return self.protocols[protocol_type].public()
+
+	def cheapest(self, links, size):
+		"""
+		Elige la conexión utilizable más barata de una lista.
+
+		@param links Las conexiones candidatas
+		@param size La cantidad de bytes a enviar
+		@return Una lista con la conexión elegida (vacía si ninguna se puede usar)
+		"""
+
+		best = None
+		for link in links:
+			health = self.info.get_health(link)
+			if not health.usable(): continue
+			cost = health.cost(size)
+			if best is None or cost < best[0]: best = (cost, link)
+		return [] if best is None else [best[1]]
+
+	def flood_links(self, exclude, size):
+		"""
+		Elige las conexiones por las que se inunda un paquete.
+
+		A cada vecino conocido se le envía solo por su conexión más barata; las
+		conexiones cuyo vecino no se conoce se usan todas.
+
+		@param exclude La conexión por la que llegó el paquete
+		@param size La cantidad de bytes a enviar
+		@return La lista de conexiones
+		"""
+
+		skip = self.router.neighbor_of(exclude) if self.router is not None and exclude is not None else None
+		unknown, grouped = [], dict()
+		for link in self.info.get_neighbors():
+			if link == exclude: continue
+			ID = self.router.neighbor_of(link) if self.router is not None else None
+			if ID is None:
+				if self.info.get_health(link).usable(): unknown.append(link)
+			elif ID != skip:
+				grouped.setdefault(ID, []).append(link)
+		for ID, links in grouped.items(): unknown += self.cheapest(links, size)
+		return unknown
+
+	def exits(self, dest):
+		"""
+		Devuelve las conexiones por las que podría salir un paquete hacia un destino.
+
+		@param dest La identificación del destino
+		@return Las conexiones del siguiente salto si hay ruta, o todos los vecinos si se inunda
+		"""
+
+		links = None
+		if self.router is not None:
+			hop = self.router.next_hop(dest)
+			if hop is not None: links = self.router.links_to(hop)
+		return links if links else self.info.get_neighbors()
+
+	def mtu(self, dest, mtype="data", header=0, public_key=None, session=None):
+		"""
+		Determina cuántos bytes de cuerpo entran en cada paquete hacia un destino.
+
+		El MTU de un protocolo limita el frame completo, por lo que se descuenta
+		lo que agregan el encabezado del paquete y el cifrado. Para medirlo se
+		arman dos paquetes de prueba iguales a los reales (con cuerpos de
+		distinto largo) y se codifican para cada conexión por la que saldrían:
+		así se tiene en cuenta también el base64 de los protocolos que hablan
+		json. Si ni un cuerpo vacío entra en un frame, los paquetes se ajustan
+		para ocupar justo varios frames.
+
+		@param dest La identificación del destino
+		@param mtype El tipo de los mensajes
+		@param header Los bytes que el mensaje agrega a cada cuerpo
+		@param public_key La llave pública con la que se cifraría
+		@param session La sesión con la que se cifraría
+		@return La cantidad máxima de bytes de cuerpo de cada paquete
+		"""
+
+		links = self.exits(dest)
+		limit = min((link.protocol.mtu for link in links), default=Protocol.mtu)
+		probes = [self.wrap(dest, mtype, os.urandom(header + size), public_key=public_key, session=session) for size in (0, Node.probe_size)]
+		if None in probes: return limit
+		result = None
+		for link in links or [None]:
+			mtu = link.protocol.mtu if link is not None else Protocol.mtu
+			empty, full = [len(link.protocol.frame(probe.hop(self.via(link)))) if link is not None else len(probe.encode()) for probe in probes]
+			if link is not None and not link.protocol.binary: empty, full = empty + Node.json_slack, full + Node.json_slack
+			growth = max(full - empty, 1) / Node.probe_size
+			budget = -(-(empty + 1) // mtu) * mtu
+			size = int((budget - empty) / growth)
+			result = size if result is None else min(result, size)
+		return max(result, 1)
+
+	def transfer_time(self, dest, size):
+		"""
+		Estima cuánto tarda un paquete en cruzar la conexión más lenta de las que llevan hacia (o desde) un destino.
+
+		@param dest La identificación del destino
+		@param size La cantidad de bytes del paquete
+		@return El tiempo estimado en segundos
+		"""
+
+		return max((self.info.get_health(link).cost(size) for link in self.exits(dest)), default=0.0)
+
+	def codec_for(self, dest):
+		"""
+		Determina si se comprime un paquete antes de cifrarlo hacia un destino.
+
+		El cuerpo cifrado ya no se puede comprimir en cada salto, por lo que se
+		comprime el paquete original si todas las conexiones por las que
+		saldría acordaron compresión (el destino entiende el mismo formato).
+
+		@param dest La identificación del destino
+		@return El LinkCodec de la primera de esas conexiones (o None)
+		"""
+
+		codecs = [self.info.get_codec(link) for link in self.exits(dest)]
+		if not codecs or None in codecs: return None
+		return codecs[0]
+
+	def prop(self, packet, exclude=None):
+		"""
+		Propaga un paquete a sus vecinos (a través de sus colas de salida).
+
+		Si el destino tiene una ruta conocida el paquete solo sale hacia el
+		siguiente salto; si no, se inunda a todos los vecinos menos al que lo
+		envió. Con cada vecino se usa la conexión utilizable más barata. Los
+		paquetes sin saltos restantes se descartan.
 
 		@param packet El paquete a propagar
+		@param exclude La conexión por la que llegó el paquete
 		"""
 
-		for neighbor in self.info.get_neighbors(): neighbor.send(packet)
+		if packet.hops <= 0:
+			with self.mutex: self.expired += 1
+			return
+		size = packet.size()
+		links = None
+		if self.router is not None:
+			hop = self.router.next_hop(packet.dest)
+			if hop is not None: links = self.cheapest(self.router.links_to(hop), size)
+		if not links: links = self.flood_links(exclude, size)
+		for neighbor in links:
+			if neighbor == exclude: continue
+			self.forwarder.submit(neighbor, packet.hop(self.via(neighbor), self.info.get_codec(neighbor)))
@@ -1,37 +1,250 @@
 import json
 import base64
-from datetime import datetime, timezone
+import random
+import struct
+import time
 from wavenetcore.WaveNetCrypto import *
+from wavenetcore.WaveNetCompression import *
 import logging
 
-class Packet:
+def new_message_id():
+	"""
+	Genera un identificador de mensaje aleatorio de 64 bits.
+
+	@return El identificador
+	"""
+	return random.getrandbits(64)
+
+def new_timestamp():
+	"""
+	Genera la marca de tiempo de un paquete nuevo.
+
+	@return Los nanosegundos del reloj monótono del nodo que crea el paquete
+	"""
+	return time.monotonic_ns()
+
+HOP_LIMIT = 16
+
+WIRE_MAGIC = 0xA0 # Nibble alto del primer byte del formato binario (un json nunca empieza así)
+WIRE_VERSION = 2 # Versión del formato binario (nibble bajo del primer byte)
+WIRE_HEADER = struct.Struct("!BBBQQQB") # Versión, tipo, banderas, mid, fuente, destino y saltos
+WIRE_STAMP = struct.Struct("!Q") # Marca de tiempo de un paquete sin cifrar
+WIRE_COUNT = struct.Struct("!H") # Cantidad de paquetes de un frame
+WIRE_SHORT = struct.Struct("!H") # Largo de un campo corto
+WIRE_LONG = struct.Struct("!I") # Largo de un cuerpo o de un paquete dentro de un frame
+
+WIRE_PLAIN = 0
+WIRE_SECRET = 1
+WIRE_BATCH = 2
+
+WIRE_SIGNS = 3 # Banderas de fuente y destino negativos
+WIRE_BYTES = 4 # Bandera de un cuerpo en bytes (sin ella el cuerpo es texto)
+WIRE_ZLIB = 8 # Bandera de un cuerpo comprimido con el códec de WaveNetCompression
+
+def wire_id(value):
+	"""
+	Separa una identificación en su bandera de signo y su valor absoluto.
+
+	@param value La identificación (puede ser -1)
+	@return La tupla (bandera, valor)
+	"""
+	return (1, -value) if value < 0 else (0, value)
+
+def wire_header(kind, flags, mid, src, dest, hops):
+	"""
+	Genera el encabezado fijo del formato binario.
+
+	@param kind El tipo de paquete
+	@param flags Las banderas del cuerpo (WIRE_BYTES y WIRE_ZLIB)
+	@param mid El identificador único del mensaje
+	@param src La fuente del paquete
+	@param dest El destino del paquete
+	@param hops La cantidad de saltos que le quedan al paquete
+	@return Los bytes del encabezado
+	"""
+	src_flag, src = wire_id(src)
+	dest_flag, dest = wire_id(dest)
+	flags = (flags & ~WIRE_SIGNS) | src_flag | dest_flag << 1
+	return WIRE_HEADER.pack(WIRE_MAGIC | WIRE_VERSION, kind, flags, mid, src, dest, hops)
+
+def wire_fields(fields, body):
+	"""
+	Genera la parte variable del formato binario.
+
+	@param fields Los campos cortos (texto o bytes)
+	@param body El cuerpo del paquete (texto o bytes, que se copian tal cual)
+	@return La lista de bytes a concatenar
+	"""
+	parts = []
+	for field in fields:
+		data = field.encode() if type(field) == str else field
+		parts.append(WIRE_SHORT.pack(len(data)))
+		parts.append(data)
+	if body is None: return parts
+	data = body.encode() if type(body) == str else body
+	parts.append(WIRE_LONG.pack(len(data)))
+	parts.append(data)
+	return parts
+
+def as_bytes(data):
+	"""
+	Normaliza un buffer a bytes sin copiar cuando ya lo es.
+
+	@param data Los bytes, bytearray o memoryview
+	@return Los bytes
+	"""
+	return data if type(data) == bytes else bytes(data)
+
+class Immutable:
+	"""
+	Clase base de los objetos que no cambian una vez construidos.
+
+	Los atributos solo se asignan con _set, en el constructor o al guardar
+	en caché algo que se calcula a partir de los demás.
+	"""
+
+	__slots__ = ()
+
+	def _set(self, name, value):
+		"""
+		Asigna un atributo saltándose la protección.
+
+		@param name El nombre del atributo
+		@param value El valor
+		"""
+		object.__setattr__(self, name, value)
+
+	def __setattr__(self, name, value):
+		raise Exception(f"{type(self).__name__} is immutable")
+
+	def __delattr__(self, name):
+		raise Exception(f"{type(self).__name__} is immutable")
+
+class LazyBody(Immutable):
+	"""
+	Clase que guarda el cuerpo de un paquete recibido sin decodificarlo.
+
+	Los nodos que solo reenvían un paquete nunca necesitan su cuerpo, por lo
+	que se descomprime y se convierte a texto o bytes recién cuando se lee.
+	"""
+
+	__slots__ = ("flags", "data", "budget")
+
+	def __init__(self, flags, data, budget):
+		"""
+		Constructor de la clase.
+
+		@param flags Las banderas del encabezado (WIRE_BYTES y WIRE_ZLIB)
+		@param data Los bytes del cuerpo tal como llegaron
+		@param budget El InflateBudget del frame en el que llegó
+		"""
+		self._set("flags", flags)
+		self._set("data", data)
+		self._set("budget", budget)
+
+	def decode(self):
+		"""
+		Decodifica el cuerpo.
+
+		@return El cuerpo en texto o en bytes
+		"""
+		data = self.budget.inflate(self.data) if self.flags & WIRE_ZLIB else self.data
+		return bytes(data) if self.flags & WIRE_BYTES else str(data, "utf-8")
+
+class Packet(Immutable):
 	"""
 	Clase que maneja los paquetes de la capa 2 y 3.
+
+	Los paquetes no cambian una vez construidos, por lo que su versión
+	textual, su versión binaria y su hash se calculan una sola vez. Un
+	paquete recibido en binario guarda la parte de su codificación que no
+	cambia al reenviarlo, y las copias que se reenvían la reutilizan. Su
+	cuerpo se decodifica recién cuando se lee.
 	"""
 
+	__slots__ = ("src", "dest", "mtype", "_body", "timestamp", "mid", "hops", "via", "codec", "wire", "_form", "_encoded", "_hash")
+
 	params = (
 			("src", int),
 			("dest", int),
 			("mtype", str),
 			("body", str),
-			("timestamp", str),
+			("timestamp", int),
+			("mid", int),
+			("hops", int),
+			("via", str),
 		)
 
-	def __init__(self, src, dest, mtype, body, timestamp=None):
+	def __init__(self, src, dest, mtype, body, timestamp=None, mid=None, hops=HOP_LIMIT, via="", codec=None, wire=None):
 		"""
 		Constructor de la clase.
 
 		@param src El fuente del paquete
 		@param dest El destino del paquete
 		@param mtype El tipo de mensaje del paquete
-		@param body El cuerpo del paquete
-		@param timestamp El tiempo de creación de paquete
-		"""
-		self.src = src
-		self.dest = dest
-		self.mtype = mtype
-		self.body = body
-		self.timestamp = timestamp if timestamp is not None else datetime.now(timezone.utc).isoformat()
+		@param body El cuerpo del paquete (texto, bytes o un LazyBody)
+		@param timestamp El tiempo de creación de paquete (nanosegundos del reloj monótono de la fuente)
+		@param mid El identificador único del mensaje
+		@param hops La cantidad de saltos que le quedan al paquete
+		@param via La dirección pública del último nodo que reenvió el paquete
+		@param codec El LinkCodec con el que se comprime el cuerpo al serializarlo (o None)
+		@param wire La tupla (banderas, bytes que siguen a via) de la codificación recibida (o None; solo se reutiliza si está comprimida justo cuando hay códec)
+		"""
+		self._set("src", src)
+		self._set("dest", dest)
+		self._set("mtype", mtype)
+		self._set("_body", body if type(body) in (str, LazyBody) else as_bytes(body))
+		self._set("timestamp", timestamp if timestamp is not None else new_timestamp())
+		self._set("mid", mid if mid is not None else new_message_id())
+		self._set("hops", hops)
+		self._set("via", via)
+		self._set("codec", codec)
+		self._set("wire", wire)
+		self._set("_form", None)
+		self._set("_encoded", None)
+		self._set("_hash", hash(self.mid))
+
+	@property
+	def body(self):
+		"""
+		El cuerpo del paquete, que se decodifica la primera vez que se lee.
+
+		@return El cuerpo en texto o en bytes
+		"""
+		if type(self._body) == LazyBody: self._set("_body", self._body.decode())
+		return self._body
+
+	def size(self):
+		"""
+		Calcula el tamaño del cuerpo sin decodificarlo.
+
+		@return La cantidad de bytes (o caracteres) del cuerpo
+		"""
+		return len(self._body.data) if type(self._body) == LazyBody else len(self._body)
+
+	def decodes(self):
+		"""
+		Determina si el cuerpo se puede decodificar (y lo decodifica).
+
+		@return Si el cuerpo es válido
+		"""
+		try:
+			self.body
+			return True
+		except Exception as e:
+			logging.warning(f"Received a packet with a bad body: {str(e)}")
+			return False
+
+	def deflated(self):
+		"""
+		Comprime el cuerpo con el códec del paquete si eso lo achica.
+
+		@return La tupla (bytes del cuerpo comprimido, o el cuerpo original; si se comprimió)
+		"""
+		if self.codec is None: return self.body, False
+		data = self.body.encode() if type(self.body) == str else self.body
+		compressed = self.codec.compress(data)
+		return (self.body, False) if compressed is None else (compressed, True)
 	
 	def form(self):
 		"""
@@ -39,15 +252,44 @@ class Packet:
 
 		@return La versión textual del paquete
 		"""
-		return json.dumps({
+		if self._form is not None: return self._form
+		binary = type(self.body) != str
+		body, compressed = self.deflated()
+		if compressed and not binary and (len(body) + 2) // 3 * 4 >= len(self.body): body, compressed = self.body, False
+		self._set("_form", json.dumps({
 			"enc" : False,
 			"src" : self.src,
 			"dest" : self.dest,
 			"mtype" : self.mtype,
-			"body" : self.body,
-			"timestamp" : self.timestamp
-			})
+			"body" : base64.b64encode(body).decode() if binary or compressed else body,
+			"bin" : binary,
+			"zlib" : compressed,
+			"timestamp" : self.timestamp,
+			"mid" : self.mid,
+			"hops" : self.hops,
+			"via" : self.via
+			}))
+		return self._form
 	
+	def encode(self):
+		"""
+		Genera la versión binaria del paquete.
+
+		@return Los bytes del paquete
+		"""
+		if self._encoded is not None: return self._encoded
+		if self.wire is not None and bool(self.wire[0] & WIRE_ZLIB) == (self.codec is not None):
+			flags, tail = self.wire
+			parts = [wire_header(WIRE_PLAIN, flags, self.mid, self.src, self.dest, self.hops), WIRE_STAMP.pack(self.timestamp)]
+			parts += wire_fields((self.via,), None) + [tail]
+		else:
+			body, compressed = self.deflated()
+			flags = (WIRE_BYTES if type(self.body) != str else 0) | (WIRE_ZLIB if compressed else 0)
+			parts = [wire_header(WIRE_PLAIN, flags, self.mid, self.src, self.dest, self.hops), WIRE_STAMP.pack(self.timestamp)]
+			parts += wire_fields((self.via, self.mtype), body)
+		self._set("_encoded", b"".join(parts))
+		return self._encoded
+
 	def null(message):
 		"""
 		Crea un paquete vacío para errores.
@@ -57,6 +299,16 @@ class Packet:
 		"""
 		return Packet(-1, -1, "error", message)
 
+	def hop(self, via, codec=None):
+		"""
+		Genera la copia del paquete que se reenvía a un vecino.
+
+		@param via La dirección pública del nodo que reenvía
+		@param codec El LinkCodec acordado con el vecino (o None)
+		@return El paquete con un salto menos
+		"""
+		return Packet(self.src, self.dest, self.mtype, self._body, self.timestamp, self.mid, self.hops - 1, via, codec, self.wire)
+
 	def is_null(self):
 		"""
 		Determina si un paquete es vacío.
@@ -79,7 +331,7 @@ class Packet:
 
 		@return El hash del paquete.
 		"""
-		return hash(str(self))
+		return self._hash
 
 	def __eq__(self, other):
 		"""
@@ -89,27 +341,92 @@ class Packet:
 		@return Si un paquete es igual a otro
 		"""
 		if type(other) != type(self): return False
-		return self.form() == other.form()
+		return self.mid == other.mid
 
 
-class SecretPacket:
+class SecretPacket(Immutable):
 	"""
 	Clase que maneja paquetes cifrados.
 	"""
+
+	__slots__ = ("_meta", "_body", "mid", "hops", "via", "sid", "dest", "wire", "budget", "_form", "_encoded", "_hash")
+
 	params = (
 			("meta", str),
 			("body", str),
+			("mid", int),
+			("hops", int),
+			("via", str),
+			("sid", str),
+			("dest", int),
 		)
 
-	def __init__(self, meta, body):
+	def __init__(self, meta, body, mid=None, hops=HOP_LIMIT, via="", sid="", dest=-1, wire=None, budget=None):
 		"""
 		Constructor de la clase.
 
-		@param meta La metainformación del paquete
-		@param body El cuerpo del paquete
+		@param meta La metainformación del paquete en bytes (la llave cifrada con RSA o el nonce de la sesión)
+		@param body El cuerpo cifrado del paquete en bytes (un memoryview se copia recién al leerlo)
+		@param mid El identificador único del mensaje
+		@param hops La cantidad de saltos que le quedan al paquete
+		@param via La dirección pública del último nodo que reenvió el paquete
+		@param sid El identificador de la sesión (vacío si se cifró con RSA)
+		@param dest El destinario del paquete (-1 si cualquier nodo debería intentar decifrarlo)
+		@param wire Los bytes que siguen a via en la codificación recibida (o None)
+		@param budget El InflateBudget del frame en el que llegó (o None)
+		"""
+		self._set("_meta", meta)
+		self._set("_body", body)
+		self._set("mid", mid if mid is not None else new_message_id())
+		self._set("hops", hops)
+		self._set("via", via)
+		self._set("sid", sid)
+		self._set("dest", dest)
+		self._set("wire", wire)
+		self._set("budget", budget)
+		self._set("_form", None)
+		self._set("_encoded", None)
+		self._set("_hash", hash(self.mid))
+
+	def hop(self, via, codec=None):
+		"""
+		Genera la copia del paquete que se reenvía a un vecino.
+
+		El cuerpo cifrado no se comprime: la compresión ocurre antes de cifrar.
+
+		@param via La dirección pública del nodo que reenvía
+		@param codec El LinkCodec acordado con el vecino (se ignora)
+		@return El paquete con un salto menos
+		"""
+		return SecretPacket(self._meta, self._body, self.mid, self.hops - 1, via, self.sid, self.dest, self.wire, self.budget)
+
+	@property
+	def meta(self):
+		"""
+		La metainformación del paquete.
+
+		@return Los bytes de la metainformación
+		"""
+		if type(self._meta) != bytes: self._set("_meta", bytes(self._meta))
+		return self._meta
+
+	@property
+	def body(self):
+		"""
+		El cuerpo cifrado del paquete.
+
+		@return Los bytes del cuerpo
+		"""
+		if type(self._body) != bytes: self._set("_body", bytes(self._body))
+		return self._body
+
+	def size(self):
+		"""
+		Calcula el tamaño del cuerpo cifrado sin copiarlo.
+
+		@return La cantidad de bytes del cuerpo
 		"""
-		self.meta = meta
-		self.body = body
+		return len(self._body)
 
 	def form(self):
 		"""
@@ -117,11 +434,31 @@ class SecretPacket:
 
 		@return La versión textual del paquete
 		"""
-		return json.dumps({
+		if self._form is not None: return self._form
+		self._set("_form", json.dumps({
 			"enc" : True,
-			"meta" : self.meta,
-			"body" : self.body
-			})
+			"meta" : base64.b64encode(self.meta).decode(),
+			"body" : base64.b64encode(self.body).decode(),
+			"mid" : self.mid,
+			"hops" : self.hops,
+			"via" : self.via,
+			"sid" : self.sid,
+			"dest" : self.dest
+			}))
+		return self._form
+
+	def encode(self):
+		"""
+		Genera la versión binaria del paquete.
+
+		@return Los bytes del paquete
+		"""
+		if self._encoded is not None: return self._encoded
+		parts = [wire_header(WIRE_SECRET, WIRE_BYTES, self.mid, 0, self.dest, self.hops)]
+		if self.wire is not None: parts += wire_fields((self.via,), None) + [self.wire]
+		else: parts += wire_fields((self.via, self.meta, self.sid), self.body)
+		self._set("_encoded", b"".join(parts))
+		return self._encoded
 
 	def __str__(self):
 		"""
@@ -137,7 +474,7 @@ class SecretPacket:
 
 		@return El hash del paquete.
 		"""
-		return hash(str(self))
+		return self._hash
 
 	def __eq__(self, other):
 		"""
@@ -147,7 +484,71 @@ class SecretPacket:
 		@return Si un paquete es igual a otro
 		"""
 		if type(other) != type(self): return False
-		return self.form() == other.form()
+		return self.mid == other.mid
+
+class BatchPacket(Immutable):
+	"""
+	Clase que maneja un frame con varios paquetes hacia el mismo vecino.
+
+	El frame solo existe en la conexión entre dos vecinos: quien lo recibe lo
+	separa y procesa cada paquete por su cuenta.
+	"""
+
+	__slots__ = ("packets",)
+
+	def __init__(self, packets):
+		"""
+		Constructor de la clase.
+
+		@param packets Los paquetes del frame
+		"""
+		self._set("packets", tuple(packets))
+
+	@property
+	def via(self):
+		"""
+		La dirección pública del vecino que envió el frame.
+
+		@return La dirección del primer paquete
+		"""
+		return self.packets[0].via if self.packets else ""
+
+	def size(self):
+		"""
+		Calcula la cantidad de bytes de los cuerpos del frame.
+
+		@return La suma de los tamaños de los cuerpos
+		"""
+		return sum(packet.size() for packet in self.packets)
+
+	def form(self):
+		"""
+		Genera la versión textual del frame.
+
+		@return La versión textual del frame
+		"""
+		return json.dumps({"batch" : [packet.form() for packet in self.packets]})
+
+	def encode(self):
+		"""
+		Genera la versión binaria del frame.
+
+		@return Los bytes del frame
+		"""
+		parts = [bytes([WIRE_MAGIC | WIRE_VERSION, WIRE_BATCH]), WIRE_COUNT.pack(len(self.packets))]
+		for packet in self.packets:
+			data = packet.encode()
+			parts.append(WIRE_LONG.pack(len(data)))
+			parts.append(data)
+		return b"".join(parts)
+
+	def __str__(self):
+		"""
+		Genera la versión textual del frame.
+
+		@return La versión textual del frame
+		"""
+		return self.form()
 
 def verify_tag(parsed, name, etype):
 	"""
@@ -163,31 +564,148 @@ def verify_tag(parsed, name, etype):
 	if type(v) != etype: return False, f"Bad {name} tag"
 	return True, v
 
-def reconstruct_packet(data):
+def is_binary(data):
+	"""
+	Determina si la información entrante usa el formato binario.
+
+	@param data Información entrante
+	@return Si empieza con el byte mágico del formato binario
+	"""
+	return type(data) != str and len(data) > 0 and data[0] & 0xF0 == WIRE_MAGIC
+
+def read_field(data, offset, prefix):
+	"""
+	Lee un campo con su largo del formato binario.
+
+	@param data Los bytes del paquete
+	@param offset La posición del largo del campo
+	@param prefix El struct del largo (WIRE_SHORT o WIRE_LONG)
+	@return La tupla (bytes del campo, posición siguiente)
+	"""
+	(size,) = prefix.unpack_from(data, offset)
+	offset += prefix.size
+	if offset + size > len(data): raise Exception("Truncated packet")
+	return data[offset:offset + size], offset + size
+
+def decode_packet(data, budget):
+	"""
+	Reconstruye un paquete a partir de su versión binaria.
+
+	@param data Los bytes del paquete
+	@param budget El InflateBudget del frame
+	@return El paquete parseado
+	"""
+	data = memoryview(data)
+	if data[0] & 0x0F == 1: return decode_packet_v1(data, budget)
+	if data[0] & 0x0F != WIRE_VERSION: raise Exception(f"Unsupported wire version {data[0] & 0x0F}")
+	kind = data[1]
+	if kind == WIRE_BATCH:
+		(count,), offset = WIRE_COUNT.unpack_from(data, 2), 2 + WIRE_COUNT.size
+		packets = []
+		for _ in range(count):
+			packet, offset = read_field(data, offset, WIRE_LONG)
+			packets.append(decode_packet(packet, budget))
+		return BatchPacket(packets)
+	if kind not in (WIRE_PLAIN, WIRE_SECRET): raise Exception(f"Unknown wire packet type {kind}")
+	_, _, flags, mid, src, dest, hops = WIRE_HEADER.unpack_from(data)
+	if flags & 1: src = -src
+	if flags & 2: dest = -dest
+	offset = WIRE_HEADER.size
+	if kind == WIRE_PLAIN:
+		(timestamp,) = WIRE_STAMP.unpack_from(data, offset)
+		offset += WIRE_STAMP.size
+	via, offset = read_field(data, offset, WIRE_SHORT)
+	tail = data[offset:]
+	if kind == WIRE_SECRET:
+		meta, offset = read_field(data, offset, WIRE_SHORT)
+		sid, offset = read_field(data, offset, WIRE_SHORT)
+		body, offset = read_field(data, offset, WIRE_LONG)
+		if offset != len(data): raise Exception("Trailing bytes after packet")
+		return SecretPacket(meta, body, mid, hops, str(via, "utf-8"), str(sid, "utf-8"), dest, tail, budget)
+	mtype, offset = read_field(data, offset, WIRE_SHORT)
+	body, offset = read_field(data, offset, WIRE_LONG)
+	if offset != len(data): raise Exception("Trailing bytes after packet")
+	return Packet(src, dest, str(mtype, "utf-8"), LazyBody(flags, body, budget), timestamp, mid, hops, str(via, "utf-8"), wire=(flags, tail))
+
+def decode_packet_v1(data, budget):
+	"""
+	Reconstruye un paquete de la primera versión del formato binario.
+
+	En esa versión todos los campos eran texto (mtype, marca de tiempo, via y
+	cuerpo, o meta, sid, via y cuerpo en base64 para los cifrados), sin
+	banderas de cuerpo.
+
+	@param data Los bytes del paquete
+	@param budget El InflateBudget del frame
+	@return El paquete parseado
+	"""
+	kind = data[1]
+	if kind == WIRE_BATCH:
+		(count,), offset = WIRE_COUNT.unpack_from(data, 2), 2 + WIRE_COUNT.size
+		packets = []
+		for _ in range(count):
+			packet, offset = read_field(data, offset, WIRE_LONG)
+			packets.append(decode_packet_v1(packet, budget))
+		return BatchPacket(packets)
+	if kind not in (WIRE_PLAIN, WIRE_SECRET): raise Exception(f"Unknown wire packet type {kind}")
+	_, _, flags, mid, src, dest, hops = WIRE_HEADER.unpack_from(data)
+	if flags & 1: src = -src
+	if flags & 2: dest = -dest
+	offset = WIRE_HEADER.size
+	fields = []
+	for prefix in (WIRE_SHORT, WIRE_SHORT, WIRE_SHORT, WIRE_LONG):
+		field, offset = read_field(data, offset, prefix)
+		fields.append(str(field, "utf-8"))
+	if offset != len(data): raise Exception("Trailing bytes after packet")
+	if kind == WIRE_SECRET:
+		meta, sid, via, body = fields
+		return SecretPacket(base64.b64decode(meta), base64.b64decode(body), mid, hops, via, sid, dest, budget=budget)
+	mtype, _, via, body = fields
+	return Packet(src, dest, mtype, body, 0, mid, hops, via)
+
+def reconstruct_packet(data, budget=None):
 	"""
 	Reconstruye un paquete a partir de información entrante.
+
+	Acepta tanto el formato binario como el json de las versiones anteriores
+	(cuya marca de tiempo en texto se reemplaza por 0, y cuyos paquetes
+	cifrados sin destinatario quedan con destino -1).
 	
 	@param data Información entrante
+	@param budget El InflateBudget del frame (si no se indica, uno con MAX_INFLATED bytes)
 	@return El paquete parseado
 	"""
+	if budget is None: budget = InflateBudget()
 	try:
+		if is_binary(data): return decode_packet(data, budget)
 		parsed = json.loads(data)
+		if "batch" in parsed:
+			status, packets = verify_tag(parsed, "batch", list)
+			if not status: return Packet.null(packets)
+			return BatchPacket([reconstruct_packet(packet, budget) for packet in packets if type(packet) == str])
 		status, enc = verify_tag(parsed, "enc", bool)
 		if not status: return Packet.null(enc)
 		if enc:
+			parsed.setdefault("dest", -1)
 			data = []
 			for name, etype in SecretPacket.params:
 				status, v = verify_tag(parsed, name, etype)
 				if not status: return Packet.null(v)
 				data.append(v)
-			return SecretPacket(data[0], data[1])
+			data[0], data[1] = base64.b64decode(data[0]), base64.b64decode(data[1])
+			return SecretPacket(*data, budget=budget)
 		else:
+			if type(parsed.get("timestamp")) == str: parsed["timestamp"] = 0
 			data = []
 			for name, etype in Packet.params:
 				status, v = verify_tag(parsed, name, etype)
 				if not status: return Packet.null(v)
 				data.append(v)
-			return Packet(data[0], data[1], data[2], data[3], data[4])
+			if parsed.get("zlib") is True:
+				data[3] = budget.inflate(base64.b64decode(data[3]))
+				if parsed.get("bin") is not True: data[3] = data[3].decode()
+			elif parsed.get("bin") is True: data[3] = base64.b64decode(data[3])
+			return Packet(*data)
 	except Exception as e:
 		logging.warning(f"Received a bad data: {data}")
 		return Packet.null("Formation Error " + str(e))
@@ -202,16 +720,10 @@ def encrypt_packet(packet, public_key):
 	@return El paquete cifrado
 	"""
 	try:
-		data = packet.form()
-		key64 = AES_create_key()
-		nonce64, body64 = AES_encrypt(key64, data)
-		meta = public_key.encrypt(json.dumps({
-			"decrypted" : True,
-			"key" : key64,
-			"nonce" : nonce64,
-			}).encode())
-		meta64 = base64.b64encode(meta).decode()
-		return SecretPacket(meta64, body64)
+		key = AES_create_key()
+		nonce, body = AES_encrypt(key, packet.encode())
+		meta = public_key.encrypt(key + nonce)
+		return SecretPacket(meta, body, packet.mid, packet.hops, dest=packet.dest)
 	except Exception as e:
 		logging.error("Yeah, I couldn't encrypt this packet...")
 		return Packet.null("Formation Error " + str(e))
@@ -225,16 +737,20 @@ def decrypt_packet(packet, private_key):
 	@return El paquete decifrado
 	"""
 	try:
-		meta = base64.b64decode(packet.meta.encode())
-		parsed = json.loads(private_key.decrypt(meta))
-		status, dec = verify_tag(parsed, "decrypted", bool)
-		if not status or not dec: return packet
-		status, key64 = verify_tag(parsed, "key", str)
-		if not status: return packet
-		status, nonce64 = verify_tag(parsed, "nonce", str)
-		if not status: return packet
-		data = AES_decrypt(key64, nonce64, packet.body)
-		return reconstruct_packet(data)
+		meta = private_key.decrypt(packet.meta)
+		if len(meta) == 44: # Llave AES y nonce; si no, es el json de las versiones anteriores
+			key, nonce = meta[:32], meta[32:]
+		else:
+			parsed = json.loads(meta)
+			status, dec = verify_tag(parsed, "decrypted", bool)
+			if not status or not dec: return packet
+			status, key64 = verify_tag(parsed, "key", str)
+			if not status: return packet
+			status, nonce64 = verify_tag(parsed, "nonce", str)
+			if not status: return packet
+			key, nonce = base64.b64decode(key64), base64.b64decode(nonce64)
+		data = AES_decrypt(key, nonce, packet.body)
+		return reconstruct_packet(data, packet.budget)
 	except Exception as e:
 		logging.info("Couldn't decrypt packet, maybe it's not for me?")
 		return packet
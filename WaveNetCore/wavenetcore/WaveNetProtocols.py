@@ -1,8 +1,10 @@
 from enum import Enum
+import asyncio
 import json
 import psutil
 import socket
 from threading import Thread, Event, Lock
+from concurrent.futures import ThreadPoolExecutor
 from wavenetcore.WaveNetPacketeering import *
 from dispositivo_wavenet.dispositivo_wavenet import DispositivoWaveNet as wn
 import logging
@@ -21,6 +23,18 @@ class Protocol:
 	Clase que maneja la base de los protocolos.
 	"""
 
+	latency = 0.01 # Costo inicial por envío en segundos
+	throughput = 1e6 # Bytes por segundo iniciales
+	read_timeout = 30.0 # Tiempo máximo para recibir un paquete en segundos
+	workers = 8 # Threads que procesan los paquetes recibidos
+	backlog = 256 # Paquetes recibidos en espera de un worker
+	batch_window = 0.005 # Espera máxima para juntar paquetes en un frame en segundos
+	batch_bytes = 65536 # Bytes de cuerpo máximos por frame
+	mtu = 16384 # Bytes máximos de un frame enviado (los mensajes más grandes se fragmentan)
+	max_frame = 4 << 20 # Bytes máximos aceptados en una conexión entrante
+	inflate_factor = 4 # Veces max_frame que pueden ocupar descomprimidos los cuerpos de un frame
+	binary = True # Enviar en el formato binario (False para hablar con nodos que solo entienden json)
+
 	def __init__(self, protocol_type, sender, listener, as_public):
 		"""
 		Constructor para los protocolos.
@@ -48,11 +62,30 @@ class Protocol:
 
 		return self.sender(packet, dest)
 
+	def budget(self):
+		"""
+		Genera el presupuesto de descompresión de un frame recibido.
+
+		@return El InflateBudget del frame
+		"""
+
+		return InflateBudget(self.inflate_factor * self.max_frame)
+
+	def frame(self, packet):
+		"""
+		Genera los bytes que se envían por el protocolo.
+
+		@param packet El paquete a enviar
+		@return Los bytes del paquete en el formato del protocolo
+		"""
+
+		return packet.encode() if self.binary else packet.form().encode()
+
 	def listen(self, func):
 		"""
 		Escucha por conexión entrantes y recibe información.
 
-		@param func Funciona a utilizar para procesar los paquetes entrantes
+		@param func Funciona a utilizar para procesar los paquetes entrantes (recibe el paquete y la conexión por la que llegó)
 		@return El thread encargado de escuchar
 		"""
 
@@ -61,6 +94,75 @@ class Protocol:
 		t.start()
 		return t
 
+	def serve(self, host, port, func, switch):
+		"""
+		Atiende conexiones TCP entrantes con un event loop de asyncio.
+
+		El event loop solo hace la entrada y salida: cada conexión se lee hasta
+		el final y el paquete se procesa en un pool acotado de workers, por lo
+		que un paquete lento no detiene la recepción de los demás. Cuando hay
+		demasiados paquetes en proceso se dejan de leer conexiones nuevas, y
+		una conexión que supera max_frame bytes se descarta sin terminar de
+		leerla (los mensajes grandes llegan fragmentados).
+
+		@param host La dirección sobre la cual escuchar
+		@param port El puerto sobre el cual escuchar
+		@param func Funciona a utilizar para procesar los paquetes entrantes
+		@param switch El indicador de terminación para el thread
+		"""
+
+		def process(data):
+			packet = reconstruct_packet(data, self.budget())
+			func(packet, self.arrival(packet))
+
+		async def read_frame(reader):
+			chunks, size = [], 0
+			while True:
+				chunk = await reader.read(65536)
+				if not chunk: return b"".join(chunks)
+				size += len(chunk)
+				if size > Protocol.max_frame: raise Exception("Frame too large")
+				chunks.append(chunk)
+
+		async def run():
+			loop = asyncio.get_running_loop()
+			slots = asyncio.Semaphore(Protocol.workers + Protocol.backlog)
+			executor = ThreadPoolExecutor(max_workers=Protocol.workers, thread_name_prefix="wavenet-recv")
+
+			async def process_conn(reader, writer):
+				async with slots:
+					try:
+						data = await asyncio.wait_for(read_frame(reader), Protocol.read_timeout)
+					except Exception as e:
+						logging.info(f"Dropped an incoming connection: {str(e)}")
+						return
+					finally:
+						writer.close()
+					try:
+						await loop.run_in_executor(executor, process, data)
+					except Exception as e:
+						logging.warning(f"Couldn't process an incoming packet: {str(e)}")
+
+			try:
+				server = await asyncio.start_server(process_conn, host, port, backlog=socket.SOMAXCONN)
+				async with server:
+					while not switch.is_set(): await asyncio.sleep(0.1)
+			finally:
+				executor.shutdown(wait=False, cancel_futures=True)
+
+		asyncio.run(run())
+
+	def arrival(self, packet):
+		"""
+		Determina la conexión por la que llegó un paquete.
+
+		@param packet El paquete recibido
+		@return La conexión hacia el nodo que lo envió o None si no se conoce
+		"""
+
+		if not packet.via: return None
+		return Link(packet.via, empty_protocol_from_str(self.protocol_type.name))
+
 	def public(self):
 		"""
 		Genera la versión pública del protocolo (cómo conectarse al host del protocolo externamente).
@@ -84,6 +186,10 @@ class LocalProtocol(Protocol):
 
 	IP = "127.0.0.1"
 	protocol_type = ProtocolType.LOCAL
+	latency = 0.0005 # Costo inicial por envío en segundos
+	throughput = 1e9 # Bytes por segundo iniciales
+	batch_window = 0.001 # Espera máxima para juntar paquetes en un frame en segundos
+	mtu = 65536 # Bytes máximos de un frame enviado (los mensajes más grandes se fragmentan)
 
 	def __init__(self, port=None):
 		"""
@@ -104,13 +210,13 @@ class LocalProtocol(Protocol):
 		@param dest El destino de la información
 		"""
 
-		data = packet.form()
+		data = self.frame(packet)
 
 		PORT = int(dest)
 
 		with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
 			s.connect((LocalProtocol.IP, PORT))
-			s.sendall(data.encode())
+			s.sendall(data)
 
 	def listener(self, func, switch):
 		"""
@@ -122,29 +228,7 @@ class LocalProtocol(Protocol):
 
 		assert self.port is not None
 
-		PORT = self.port
-
-		def process_conn(conn):
-			parts = []
-			with conn:
-				while True:
-					data = conn.recv(1 << 12)
-					if not data: break
-					parts.append(data)
-			data = b''.join(parts)
-			packet = reconstruct_packet(data)
-			func(packet)
-
-		with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-			s.bind((LocalProtocol.IP, PORT))
-			s.listen(10)
-			s.settimeout(1)
-			while not switch.is_set():
-				try:
-					conn, _ = s.accept()
-					Thread(target=process_conn, args=(conn,), daemon=True).start()
-				except socket.timeout:
-					pass
+		self.serve(LocalProtocol.IP, self.port, func, switch)
 
 	def as_public(self):
 		"""
@@ -162,6 +246,8 @@ class IPProtocol(Protocol):
 	"""
 
 	protocol_type = ProtocolType.IP
+	latency = 0.005 # Costo inicial por envío en segundos
+	throughput = 1e7 # Bytes por segundo iniciales
 
 	def __init__(self, ip=None, port=None):
 		"""
@@ -192,11 +278,11 @@ class IPProtocol(Protocol):
 		status, PORT = verify_tag(data, "port", int)
 		if not status: raise Exception(PORT)
 
-		data = packet.form()
+		data = self.frame(packet)
 
 		with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
 			s.connect((IP, PORT))
-			s.sendall(data.encode())
+			s.sendall(data)
 
 	def listener(self, func, switch):
 		"""
@@ -209,30 +295,7 @@ class IPProtocol(Protocol):
 		assert self.port is not None
 		assert self.ip is not None
 
-		IP = self.ip
-		PORT = self.port
-
-		def process_conn(conn):
-			parts = []
-			with conn:
-				while True:
-					data = conn.recv(1 << 12)
-					if not data: break
-					parts.append(data)
-			data = b''.join(parts)
-			packet = reconstruct_packet(data)
-			func(packet)
-
-		with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-			s.bind((IP, PORT))
-			s.listen(10)
-			s.settimeout(1)
-			while not switch.is_set():
-				try:
-					conn, _ = s.accept()
-					Thread(target=process_conn, args=(conn,), daemon=True).start()
-				except socket.timeout:
-					pass
+		self.serve(self.ip, self.port, func, switch)
 
 	def as_public(self):
 		"""
@@ -278,6 +341,13 @@ class SoundProtocol(Protocol):
 	"""
 
 	protocol_type = ProtocolType.SOUND
+	latency = 30.0 # Preámbulo y handshake de la capa 1 en segundos
+	throughput = 1 / 0.54 # Un byte por BYTE_DURATION + SILENCE_DURATION
+	batch_window = 2.0 # Cada frame paga el preámbulo, por lo que conviene esperar más
+	batch_bytes = 1024 # Bytes de cuerpo máximos por frame
+	mtu = 107 # Bytes útiles de un frame de la capa 1
+	max_frame = 1 << 16 # Bytes máximos aceptados en un frame de la capa 1
+	binary = False # La capa 1 solo transporta strings
 	MAC = None
 	mutex = Lock()
 
@@ -323,8 +393,9 @@ class SoundProtocol(Protocol):
 				with SoundProtocol.mutex:
 					w = wn(self.MAC, "")
 					data = w.listen(timeout=60*3, init_timeout=40)
-				packet = reconstruct_packet(data)
-				func(packet)
+				if len(data) > self.max_frame: raise Exception("Frame too large")
+				packet = reconstruct_packet(data, self.budget())
+				func(packet, self.arrival(packet))
 			except Exception as e:
 				logging.info(f"SoundProtocol listener died again : {str(e)}")
 
@@ -0,0 +1,211 @@
+from threading import Lock
+
+class Router:
+	"""
+	Clase que maneja la tabla de rutas (vector de distancias) de un nodo.
+
+	Cada vecino anuncia su vector de distancias completo y la tabla se recalcula
+	con Bellman-Ford, por lo que un destino omitido en un anuncio queda retirado.
+	Los anuncios hacia un vecino omiten las rutas que pasan por ese mismo vecino
+	(split horizon) y la distancia máxima está acotada para que la cuenta al
+	infinito termine.
+	"""
+
+	infinity = 16
+
+	def __init__(self, ID, infinity=None):
+		"""
+		Constructor de la clase.
+
+		@param ID La identificación del nodo dueño de la tabla
+		@param infinity La distancia a partir de la cual un destino es inalcanzable
+		"""
+
+		self.ID = ID
+		self.infinity = infinity if infinity is not None else Router.infinity
+		self.links = dict()
+		self.down = set()
+		self.vectors = dict()
+		self.table = dict()
+		self.mutex = Lock()
+
+	def add_link(self, link, ID):
+		"""
+		Asocia una conexión con el vecino al que llega.
+
+		@param link La conexión
+		@param ID La identificación del vecino
+		@return Si la tabla de rutas cambió
+		"""
+
+		with self.mutex:
+			if self.links.get(link) == ID and link not in self.down: return False
+			self.links[link] = ID
+			self.down.discard(link)
+			return self.recompute()
+
+	def link_down(self, link):
+		"""
+		Marca una conexión como caída.
+
+		@param link La conexión
+		@return Si la tabla de rutas cambió
+		"""
+
+		with self.mutex:
+			if link not in self.links or link in self.down: return False
+			self.down.add(link)
+			return self.recompute()
+
+	def link_up(self, link):
+		"""
+		Marca una conexión como disponible otra vez.
+
+		@param link La conexión
+		@return Si la tabla de rutas cambió
+		"""
+
+		with self.mutex:
+			if link not in self.down: return False
+			self.down.discard(link)
+			return self.recompute()
+
+	def remove_link(self, link):
+		"""
+		Olvida una conexión.
+
+		@param link La conexión
+		@return Si la tabla de rutas cambió
+		"""
+
+		with self.mutex:
+			if link not in self.links: return False
+			self.links.pop(link)
+			self.down.discard(link)
+			return self.recompute()
+
+	def update(self, ID, routes):
+		"""
+		Procesa el vector de distancias anunciado por un vecino.
+
+		@param ID La identificación del vecino
+		@param routes Diccionario de destino a distancia
+		@return Si la tabla de rutas cambió
+		"""
+
+		vector = {int(dest): int(dist) for dest, dist in routes.items()}
+		with self.mutex:
+			self.vectors[ID] = vector
+			return self.recompute()
+
+	def neighbors(self):
+		"""
+		Devuelve los vecinos que tienen al menos una conexión disponible.
+
+		@return El set de identificaciones de los vecinos
+		"""
+
+		return {ID for link, ID in self.links.items() if link not in self.down}
+
+	def recompute(self):
+		"""
+		Recalcula la tabla de rutas (se asume que el mutex está tomado).
+
+		@return Si la tabla de rutas cambió
+		"""
+
+		table = dict()
+		for neighbor in self.neighbors():
+			if neighbor == self.ID: continue
+			candidates = [(1, neighbor)]
+			for dest, dist in self.vectors.get(neighbor, {}).items():
+				if dest == self.ID or dest == neighbor: continue
+				candidates.append((dist + 1, dest))
+			for dist, dest in candidates:
+				if dist >= self.infinity: continue
+				if dest not in table or (dist, neighbor) < table[dest]: table[dest] = (dist, neighbor)
+		changed = table != self.table
+		self.table = table
+		return changed
+
+	def next_hop(self, dest):
+		"""
+		Devuelve el vecino por el cual se llega a un destino.
+
+		@param dest La identificación del destino
+		@return La identificación del vecino o None si el destino es desconocido
+		"""
+
+		with self.mutex:
+			if dest not in self.table: return None
+			return self.table[dest][1]
+
+	def routes(self):
+		"""
+		Devuelve la distancia a cada destino conocido.
+
+		@return Diccionario de destino a distancia
+		"""
+
+		with self.mutex:
+			return {dest: dist for dest, (dist, neighbor) in self.table.items()}
+
+	def adjacent(self):
+		"""
+		Devuelve las conexiones disponibles junto al vecino al que llegan.
+
+		@return La lista de tuplas (conexión, identificación del vecino)
+		"""
+
+		with self.mutex:
+			return [(link, ID) for link, ID in self.links.items() if link not in self.down]
+
+	def neighbor_of(self, link):
+		"""
+		Devuelve el vecino al que llega una conexión.
+
+		@param link La conexión
+		@return La identificación del vecino o None si no se conoce
+		"""
+
+		with self.mutex:
+			return self.links.get(link)
+
+	def links_to(self, ID):
+		"""
+		Devuelve las conexiones disponibles hacia un vecino.
+
+		@param ID La identificación del vecino
+		@return La lista de conexiones
+		"""
+
+		with self.mutex:
+			return [link for link, neighbor in self.links.items() if neighbor == ID and link not in self.down]
+
+	def vector_for(self, ID):
+		"""
+		Genera el vector de distancias a anunciar a un vecino (con split horizon).
+
+		@param ID La identificación del vecino
+		@return Diccionario de destino a distancia
+		"""
+
+		with self.mutex:
+			vector = {self.ID: 0}
+			for dest, (dist, neighbor) in self.table.items():
+				if neighbor != ID: vector[dest] = dist
+			return vector
+
+	def stats(self):
+		"""
+		Devuelve la tabla de rutas actual.
+
+		@return Diccionario de destino a (distancia, siguiente salto)
+		"""
+
+		with self.mutex:
+			return {
+				"routes" : dict(self.table),
+				"links" : {str(link): ID for link, ID in self.links.items()},
+				"down" : [str(link) for link in self.down],
+				}
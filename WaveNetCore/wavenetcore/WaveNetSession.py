@@ -0,0 +1,377 @@
+from concurrent.futures import Future
+from threading import Lock
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from wavenetcore.WaveNetPacketeering import *
+import os
+import time
+import json
+import base64
+import logging
+
+class Session:
+	"""
+	Clase que maneja una sesión cifrada con otro nodo.
+
+	La llave se acuerda una vez con X25519 y cada paquete se cifra con
+	AES-GCM usando un nonce formado por la dirección (quién inició la sesión)
+	y un contador, por lo que no hace falta ninguna operación de RSA por
+	paquete. Una ventana deslizante de contadores rechaza repeticiones.
+	"""
+
+	window = 1024 # Cantidad de contadores recordados para detectar repeticiones
+	max_messages = 1 << 20 # Mensajes antes de renovar la llave
+	max_age = 3600.0 # Segundos antes de renovar la llave
+
+	def __init__(self, peer, sid, key, initiator, clock=time.monotonic):
+		"""
+		Constructor de la clase.
+
+		@param peer La identificación del otro nodo
+		@param sid El identificador de la sesión
+		@param key La llave AES acordada
+		@param initiator Si este nodo inició la sesión
+		@param clock La función que devuelve el tiempo actual
+		"""
+
+		self.peer = peer
+		self.sid = sid
+		self.aesgcm = AESGCM(key)
+		self.send_prefix = b"\x00\x00\x00\x01" if initiator else b"\x00\x00\x00\x02"
+		self.recv_prefix = b"\x00\x00\x00\x02" if initiator else b"\x00\x00\x00\x01"
+		self.clock = clock
+		self.created = clock()
+		self.counter = 0
+		self.highest = -1
+		self.seen = 0
+		self.mutex = Lock()
+
+	def expired(self):
+		"""
+		Determina si la sesión debería renovarse.
+
+		@return Si la sesión expiró
+		"""
+
+		return self.counter >= Session.max_messages or self.clock() - self.created >= Session.max_age
+
+	def aad(self, packet):
+		"""
+		Genera la información asociada que autentica el encabezado.
+
+		@param packet El paquete (normal o cifrado)
+		@return La información asociada
+		"""
+
+		return f"{self.sid}:{packet.mid}:{packet.dest}".encode()
+
+	def accept(self, counter):
+		"""
+		Registra un contador recibido (se asume que el mutex está tomado).
+
+		@param counter El contador del paquete
+		@return Si el contador es nuevo
+		"""
+
+		if counter > self.highest:
+			shift = counter - self.highest
+			self.seen = ((self.seen << shift) | 1) & ((1 << Session.window) - 1)
+			self.highest = counter
+			return True
+		offset = self.highest - counter
+		if offset >= Session.window or (self.seen >> offset) & 1: return False
+		self.seen |= 1 << offset
+		return True
+
+	def encrypt_packet(self, packet):
+		"""
+		Cifra un paquete con la llave de la sesión.
+
+		@param packet El paquete a cifrar
+		@return El paquete cifrado
+		"""
+
+		with self.mutex:
+			counter = self.counter
+			self.counter += 1
+		nonce = self.send_prefix + counter.to_bytes(8, "big")
+		body = self.aesgcm.encrypt(nonce, packet.encode(), self.aad(packet))
+		return SecretPacket(nonce, body, packet.mid, packet.hops, sid=self.sid, dest=packet.dest)
+
+	def decrypt_packet(self, packet):
+		"""
+		Decifra un paquete de la sesión.
+
+		@param packet El paquete cifrado
+		@return El paquete decifrado
+		"""
+
+		nonce = packet.meta
+		if len(nonce) != 12 or nonce[:4] != self.recv_prefix: raise Exception("Bad session nonce")
+		counter = int.from_bytes(nonce[4:], "big")
+		data = self.aesgcm.decrypt(nonce, packet.body, self.aad(packet))
+		result = reconstruct_packet(data, packet.budget)
+		if type(result) != Packet or result.is_null() or result.src != self.peer: raise Exception("Session packet from another source")
+		with self.mutex:
+			if not self.accept(counter): raise Exception("Replayed session packet")
+		return result
+
+class SessionManager:
+	"""
+	Clase que maneja las sesiones cifradas de un nodo con sus pares.
+
+	El intercambio de llaves es un X25519 efímero en cada dirección, firmado
+	con la identidad RSA de cada nodo para autenticarlo. El session_init
+	firma también la hora de quien lo envía: quien responde rechaza los que
+	están fuera de replay_window y recuerda los sid ya usados durante ese
+	tiempo, por lo que un session_init capturado no se puede repetir.
+	"""
+
+	timeout = 5.0 # Tiempo máximo del intercambio de llaves en segundos
+	retry_after = 60.0 # Tiempo sin reintentar con un par que no respondió
+	kept = 2 # Sesiones por par que se siguen aceptando al renovar la llave
+	replay_window = 300.0 # Diferencia máxima en segundos entre la hora de un session_init y la local
+
+	def __init__(self, ID, private_key, lookup, clock=time.monotonic, wall=time.time):
+		"""
+		Constructor de la clase.
+
+		@param ID La identificación de este nodo
+		@param private_key La llave privada de este nodo
+		@param lookup La función que devuelve la llave pública de un ID
+		@param clock La función que devuelve el tiempo actual
+		@param wall La función que devuelve la hora (comparable entre nodos)
+		"""
+
+		self.ID = ID
+		self.private_key = private_key
+		self.lookup = lookup
+		self.clock = clock
+		self.wall = wall
+		self.used = dict()
+		self.current = dict()
+		self.by_sid = dict()
+		self.history = dict()
+		self.pending = dict()
+		self.failed = dict()
+		self.handshakes = 0
+		self.established = 0
+		self.failures = 0
+		self.mutex = Lock()
+
+	def transcript(*parts):
+		"""
+		Genera el texto firmado en el intercambio de llaves.
+
+		@param parts Las partes del texto
+		@return El texto en bytes
+		"""
+
+		return "|".join(str(part) for part in parts).encode()
+
+	def info(initiator, responder):
+		"""
+		Genera el contexto de la derivación de la llave.
+
+		@param initiator La identificación de quien inició la sesión
+		@param responder La identificación de quien respondió
+		@return El contexto en bytes
+		"""
+
+		return f"wavenet-session|{initiator}|{responder}".encode()
+
+	def get(self, peer):
+		"""
+		Devuelve la sesión vigente con un par.
+
+		@param peer La identificación del par
+		@return La sesión o None si no hay una vigente
+		"""
+
+		with self.mutex:
+			session = self.current.get(peer)
+			if session is None or session.expired(): return None
+			return session
+
+	def available(self, peer):
+		"""
+		Determina si vale la pena intentar una sesión con un par.
+
+		@param peer La identificación del par
+		@return Si no hubo un intercambio fallido reciente
+		"""
+
+		with self.mutex:
+			return self.clock() >= self.failed.get(peer, 0.0)
+
+	def start(self, peer, public_key):
+		"""
+		Inicia (o se une a) un intercambio de llaves con un par.
+
+		@param peer La identificación del par
+		@param public_key La llave pública del par (con la que se verifica su respuesta)
+		@return La tupla (cuerpo del mensaje session_init o None si ya había uno en curso, Future de la sesión)
+		"""
+
+		with self.mutex:
+			if peer in self.pending: return None, self.pending[peer][2]
+			sid = os.urandom(8).hex()
+			ephemeral = EphemeralKey()
+			future = Future()
+			self.pending[peer] = (sid, ephemeral, future, public_key)
+			self.handshakes += 1
+		eph = ephemeral.public64()
+		ts = int(self.wall())
+		signature = self.private_key.sign(SessionManager.transcript("init", sid, eph, ts, self.ID, peer))
+		return json.dumps({
+			"sid" : sid,
+			"eph" : eph,
+			"ts" : ts,
+			"sig" : base64.b64encode(signature).decode(),
+			}), future
+
+	def parse(data):
+		"""
+		Valida el cuerpo de un mensaje del intercambio de llaves.
+
+		@param data El cuerpo en texto
+		@return La tupla (sid, llave efímera, firma)
+		"""
+
+		parsed = json.loads(data)
+		values = []
+		for name in ("sid", "eph", "sig"):
+			status, v = verify_tag(parsed, name, str)
+			if not status: raise Exception(v)
+			values.append(v)
+		return values[0], values[1], base64.b64decode(values[2].encode())
+
+	def respond(self, peer, data):
+		"""
+		Responde a un session_init de un par e instala la sesión.
+
+		@param peer La identificación del par
+		@param data El cuerpo del session_init
+		@return El cuerpo del session_ack
+		"""
+
+		sid, peer_eph, signature = SessionManager.parse(data)
+		status, ts = verify_tag(json.loads(data), "ts", int)
+		if not status: raise Exception(ts)
+		public_key = self.lookup(peer)
+		if not public_key.verify(signature, SessionManager.transcript("init", sid, peer_eph, ts, peer, self.ID)):
+			raise Exception("Bad session_init signature")
+		if abs(self.wall() - ts) > SessionManager.replay_window: raise Exception("Stale session_init")
+		now = self.clock()
+		with self.mutex:
+			for used in [used for used, expires in self.used.items() if expires <= now]: self.used.pop(used)
+			if sid in self.used or sid in self.by_sid: raise Exception("Replayed session_init")
+			self.used[sid] = now + 2 * SessionManager.replay_window
+		ephemeral = EphemeralKey()
+		eph = ephemeral.public64()
+		key = ephemeral.derive(peer_eph, bytes.fromhex(sid), SessionManager.info(peer, self.ID))
+		self.install(Session(peer, sid, key, False, clock=self.clock))
+		signature = self.private_key.sign(SessionManager.transcript("ack", sid, eph, peer_eph, self.ID, peer))
+		return json.dumps({
+			"sid" : sid,
+			"eph" : eph,
+			"sig" : base64.b64encode(signature).decode(),
+			})
+
+	def complete(self, peer, data):
+		"""
+		Procesa el session_ack de un par y termina el intercambio (sin bloquear: la llave del par ya se conoce).
+
+		@param peer La identificación del par
+		@param data El cuerpo del session_ack
+		"""
+
+		sid, peer_eph, signature = SessionManager.parse(data)
+		with self.mutex:
+			if peer not in self.pending or self.pending[peer][0] != sid: raise Exception("Unexpected session_ack")
+			_, ephemeral, future, public_key = self.pending[peer]
+		try:
+			eph = ephemeral.public64()
+			if not public_key.verify(signature, SessionManager.transcript("ack", sid, peer_eph, eph, peer, self.ID)):
+				raise Exception("Bad session_ack signature")
+			key = ephemeral.derive(peer_eph, bytes.fromhex(sid), SessionManager.info(self.ID, peer))
+			session = Session(peer, sid, key, True, clock=self.clock)
+		except Exception as e:
+			self.fail(peer, future, e)
+			raise
+		self.install(session)
+		with self.mutex:
+			if self.pending.get(peer, (None, None, None, None))[2] is future: self.pending.pop(peer)
+		future.set_result(session)
+
+	def fail(self, peer, future, error):
+		"""
+		Cancela un intercambio que no terminó.
+
+		@param peer La identificación del par
+		@param future El Future del intercambio
+		@param error La causa del fallo
+		"""
+
+		with self.mutex:
+			if self.pending.get(peer, (None, None, None, None))[2] is future: self.pending.pop(peer)
+			self.failed[peer] = self.clock() + SessionManager.retry_after
+			self.failures += 1
+		if not future.done(): future.set_exception(error)
+
+	def install(self, session):
+		"""
+		Instala una sesión nueva, conservando las anteriores más recientes.
+
+		@param session La sesión
+		"""
+
+		with self.mutex:
+			self.current[session.peer] = session
+			self.by_sid[session.sid] = session
+			self.failed.pop(session.peer, None)
+			self.established += 1
+			history = self.history.setdefault(session.peer, [])
+			history.append(session.sid)
+			while len(history) > SessionManager.kept: self.by_sid.pop(history.pop(0), None)
+
+	def forget(self, peer):
+		"""
+		Descarta todas las sesiones con un par (por ejemplo, si cambió de llave).
+
+		@param peer La identificación del par
+		"""
+
+		with self.mutex:
+			self.current.pop(peer, None)
+			for sid in self.history.pop(peer, []): self.by_sid.pop(sid, None)
+
+	def decrypt_packet(self, packet):
+		"""
+		Decifra un paquete cifrado con alguna sesión de este nodo.
+
+		@param packet El paquete cifrado
+		@return El paquete decifrado (o el mismo paquete si no es para este nodo)
+		"""
+
+		with self.mutex: session = self.by_sid.get(packet.sid)
+		if session is None: return packet
+		try:
+			return session.decrypt_packet(packet)
+		except Exception as e:
+			logging.info(f"Couldn't decrypt session packet: {str(e)}")
+			return packet
+
+	def stats(self):
+		"""
+		Devuelve las estadísticas de las sesiones.
+
+		@return Un diccionario con las estadísticas
+		"""
+
+		with self.mutex:
+			return {
+				"active" : len(self.current),
+				"handshakes" : self.handshakes,
+				"established" : self.established,
+				"failures" : self.failures,
+				}
@@ -0,0 +1,63 @@
+import os
+import json
+import logging
+from threading import Lock
+
+class NodeState:
+	"""
+	Clase que guarda en disco el estado de un nodo entre reinicios.
+
+	El estado es un json con la identificación, la llave privada y lo que el
+	nodo aprendió de la red. Se escribe en un archivo temporal que luego
+	reemplaza al anterior, por lo que un corte a mitad de escritura no deja un
+	estado corrupto. El archivo solo lo puede leer el dueño, ya que incluye la
+	llave privada.
+	"""
+
+	def __init__(self, path):
+		"""
+		Constructor de la clase.
+
+		@param path La ruta del archivo de estado
+		"""
+
+		self.path = path
+		self.mutex = Lock()
+
+	def load(self):
+		"""
+		Lee el estado guardado.
+
+		@return El diccionario del estado (vacío si no hay uno válido)
+		"""
+
+		with self.mutex:
+			try:
+				with open(self.path, "r") as f: data = json.load(f)
+			except FileNotFoundError:
+				return dict()
+			except Exception as e:
+				logging.warning(f"Couldn't load the node state from {self.path}: {str(e)}")
+				return dict()
+		if type(data) != dict:
+			logging.warning(f"Ignoring malformed node state in {self.path}")
+			return dict()
+		return data
+
+	def save(self, data):
+		"""
+		Guarda el estado.
+
+		@param data El diccionario del estado
+		"""
+
+		with self.mutex:
+			directory = os.path.dirname(os.path.abspath(self.path))
+			os.makedirs(directory, exist_ok=True)
+			temporary = f"{self.path}.tmp"
+			fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+			with os.fdopen(fd, "w") as f:
+				json.dump(data, f)
+				f.flush()
+				os.fsync(f.fileno())
+			os.replace(temporary, self.path)